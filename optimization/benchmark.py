@@ -0,0 +1,752 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Reproducible benchmarks of the optimizer.
+
+Rooms are generated from seeds which only depend on the workload, case and trial, so two
+runs solve exactly the same rooms. Each case runs in a fresh process to measure its peak
+memory. Examples:
+
+    python benchmark.py run -o before.json
+    python benchmark.py run --workloads vary_users scenarios --backend cbc -o after.json
+    python benchmark.py compare before.json after.json
+    python benchmark.py plot after.json
+    python benchmark.py codec --users 10000
+    python benchmark.py latency
+"""
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import resource
+import runpy
+import sys
+import time
+import traceback
+import zlib
+
+import numpy as np
+
+from user import User
+from device import Device
+from element import Element
+from properties import Properties
+from optimize_device_assignment import optimize
+from optimize import handle_web_input, warm_up
+import codec
+import converters
+import formulation
+import solvers
+
+scenarios_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scenarios')
+num_trials = 10
+timings = ['time_taken', 'preprocess_time', 'build_time', 'solve_time', 'extract_time',
+           'wall_time']
+percentiles = [50, 90, 99]
+
+
+def vary_elements(rng, n):
+    devices = generate_devices(rng, 20)
+    users = generate_users(rng, 10)
+    assign_all_users_to_devices(users, devices)
+    return generate_elements(rng, n), devices, users
+
+
+def vary_devices(rng, n):
+    elements = generate_elements(rng, 20)
+    users = generate_users(rng, 10, elements=elements)
+    devices = generate_devices(rng, n)
+    assign_all_users_to_devices(users, devices)
+    return elements, devices, users
+
+
+def vary_users(rng, n):
+    devices = generate_devices(rng, 50)
+    elements = generate_elements(rng, 20)
+    users = generate_users(rng, n, elements=elements)
+    assign_all_users_to_devices(users, devices)
+    return elements, devices, users
+
+
+def vary_users_and_devices(rng, n):
+    elements = generate_elements(rng, 10)
+
+    # 2 devices per user + 1 shared device per 5 users
+    devices = generate_devices(rng, 2 * n + n // 5)
+    users = generate_users(rng, n, elements=elements)
+    assign_all_users_to_devices(users, devices)
+    for k in range(n):
+        devices[2*k].users = [users[k]]
+        devices[2*k+1].users = [users[k]]
+    return elements, devices, users
+
+
+def vary_identical_devices(rng, n):
+    """Identical laptops shared by all users, which are hard to tell apart for the solver."""
+    users = generate_users(rng, 3)
+    devices = [Device(name='laptop%05d' % i, width=100, height=100,
+                      affordances=Properties(4, 5, 0, 5), users=list(users))
+               for i in range(n)]
+    elements = [Element(name='element%05d' % i,
+                        importance=int(rng.randint(1, 10)),
+                        min_width=int(w), max_width=int(w + 10),
+                        min_height=int(h), max_height=int(h + 10),
+                        requirements=random_properties(rng))
+                for i, (w, h) in enumerate(rng.randint(35, 70, size=(35, 2)))]
+    return elements, devices, users
+
+
+# Generated workloads with their sizes for full and quick runs
+workloads = {
+    'vary_elements': (vary_elements, [1, 100, 200, 300, 400, 500], [1, 50, 100]),
+    'vary_devices': (vary_devices, [1, 100, 200, 300, 400, 500], [1, 50, 100]),
+    'vary_users': (vary_users, [1, 2000, 4000, 6000, 8000, 10000], [1, 100, 500]),
+    'vary_users_and_devices': (vary_users_and_devices, [1, 400, 800, 1200, 1600, 2000],
+                               [1, 50, 200]),
+    'vary_identical_devices': (vary_identical_devices, [2, 4, 8, 12, 16], [2, 4, 8]),
+}
+workload_labels = {
+    'vary_elements': 'Number of Elements',
+    'vary_devices': 'Number of Devices',
+    'vary_users': 'Number of Users',
+    'vary_users_and_devices': 'Number of Users',
+    'vary_identical_devices': 'Number of Identical Devices',
+}
+
+
+def generate_elements(rng, n):
+    return [Element(name='element%05d' % i,
+                    importance=int(10 * rng.random_sample()),
+                    min_width=int(10 + rng.random_sample() * 60),
+                    min_height=int(10 + rng.random_sample() * 60),
+                    max_width=int(80 + rng.random_sample() * 80),
+                    max_height=int(80 + rng.random_sample() * 80),
+                    requirements=random_properties(rng))
+            for i in range(n)]
+
+
+def generate_devices(rng, n):
+    return [Device(name='device%05d' % i,
+                   width=int(20 + rng.random_sample() * 100),
+                   height=int(20 + rng.random_sample() * 100),
+                   affordances=random_properties(rng))
+            for i in range(n)]
+
+
+def generate_users(rng, n, elements=None):
+    users = []
+    for i in range(n):
+        importance = None
+        if elements is not None:
+            importance = dict(zip([e.name for e in elements],
+                                  rng.random_sample(len(elements))))
+        users.append(User(name='user%05d' % i, id='user%05d' % i, importance=importance))
+    return users
+
+
+def assign_all_users_to_devices(users, devices):
+    for device in devices:
+        device.users = list(users)
+
+
+def random_properties(rng):
+    return Properties(*[int(v) for v in rng.randint(0, 6, size=4)])
+
+
+def scenario_rooms():
+    """Rooms optimized by the scripts in `scenarios/`, as list of (name, room)."""
+    sys.path.insert(0, scenarios_dir)
+    import common
+    run = common.Scenario.run
+    rooms = []
+    stdout = sys.stdout
+    try:
+        for filename in sorted(os.listdir(scenarios_dir)):
+            if not filename.endswith('.py') or filename == 'common.py':
+                continue
+            script = filename[:-3]
+            script_rooms = []
+
+            def record(scenario, expect={}):
+                room = [list(objects.values()) for objects in
+                        (scenario.elements, scenario.devices, scenario.users)]
+                script_rooms.append(('%s:%d' % (script, len(script_rooms)),
+                                     copy.deepcopy(room)))
+
+            # Rooms are recorded instead of optimized
+            common.Scenario.run = record
+            sys.stdout = open(os.devnull, 'w')
+            runpy.run_path(os.path.join(scenarios_dir, filename))
+            sys.stdout.close()
+            sys.stdout = stdout
+            rooms += script_rooms
+    finally:
+        sys.stdout = stdout
+        common.Scenario.run = run
+    return rooms
+
+
+def cases(workload_names, quick=False):
+    """List of (workload, case name, function returning a room for an rng)."""
+    out = []
+    for workload in workload_names:
+        if workload == 'scenarios':
+            for name, room in scenario_rooms():
+                out.append((workload, name, lambda rng, room=room: copy.deepcopy(room)))
+        else:
+            generate, sizes, quick_sizes = workloads[workload]
+            for size in (quick_sizes if quick else sizes):
+                out.append((workload, str(size),
+                            lambda rng, generate=generate, size=size: generate(rng, size)))
+    return out
+
+
+def seed_for(seed, workload, case, trial):
+    return zlib.crc32(('%d/%s/%s/%d' % (seed, workload, case, trial)).encode('utf-8')) \
+        & 0xffffffff
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and its finished children in MiB."""
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024.0
+
+
+def run_case(workload, case, make_room, trials, seed, backend, options):
+    """Solve all trials of a case and summarize them."""
+    start_rss = peak_rss_mb()
+    samples = dict((timing, []) for timing in timings)
+    objectives = []
+    statuses = {}
+    failures = 0
+    errors = []
+    room_size = None
+    for trial in range(trials):
+        rng = np.random.RandomState(seed_for(seed, workload, case, trial))
+        elements, devices, users = make_room(rng)
+        room_size = [len(elements), len(devices), len(users)]
+        try:
+            start_time = time.time()
+            _, stats = optimize(elements, devices, users, backend=backend, **options)
+            stats['wall_time'] = time.time() - start_time
+        except Exception:
+            failures += 1
+            errors.append(traceback.format_exc().strip().split('\n')[-1])
+            continue
+        statuses[stats['status']] = statuses.get(stats['status'], 0) + 1
+        # Rooms may rightly have an empty assignment, but there must be one
+        if stats['objective'] is None:
+            failures += 1
+            continue
+        for timing in timings:
+            samples[timing].append(stats[timing])
+        objectives.append(stats['objective'])
+
+    def summary(values):
+        if len(values) == 0:
+            return None
+        out = {'mean': float(np.mean(values)), 'min': float(np.min(values)),
+               'max': float(np.max(values))}
+        for q in percentiles:
+            out['p%d' % q] = float(np.percentile(values, q))
+        return out
+
+    peak_rss = peak_rss_mb()
+    return {
+        'workload': workload,
+        'case': case,
+        'num_elements': room_size[0],
+        'num_devices': room_size[1],
+        'num_users': room_size[2],
+        'trials': trials,
+        'failures': failures,
+        'errors': sorted(set(errors)),
+        'statuses': statuses,
+        'timings': dict((timing, summary(samples[timing])) for timing in timings),
+        'objective': summary(objectives),
+        'peak_rss_mb': peak_rss,
+        'rss_increase_mb': peak_rss - start_rss,
+    }
+
+
+def _run_process(results, function, args):
+    try:
+        results.put(function(*args))
+    except Exception:
+        results.put({'error': traceback.format_exc()})
+
+
+def run_isolated(workload, case, make_room, trials, *args):
+    """Run a case in a fresh process, so that its peak memory is measured on its own.
+
+    A case whose process died or raised counts all its trials as failures.
+    """
+    result = isolated(run_case, workload, case, make_room, trials, *args)
+    if 'error' not in result:
+        return result
+    return {
+        'workload': workload,
+        'case': case,
+        'num_elements': None,
+        'num_devices': None,
+        'num_users': None,
+        'trials': trials,
+        'failures': trials,
+        'errors': [result['error'].strip().split('\n')[-1]],
+        'statuses': {},
+        'timings': dict((timing, None) for timing in timings),
+        'objective': None,
+        # Includes the peak memory of the process which died
+        'peak_rss_mb': peak_rss_mb(),
+        'rss_increase_mb': None,
+    }
+
+
+def isolated(function, *args):
+    """Call a function returning a dict in a fresh process.
+
+    Output:
+        the dict, or a dict of the `error` if the function raised or the process died
+        without a result, e.g. when it was killed for running out of memory
+    """
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_process, args=(results, function, args))
+    process.start()
+    while True:
+        try:
+            result = results.get(timeout=1.0)
+            break
+        except queue.Empty:
+            if process.is_alive():
+                continue
+            # The result may have been put just before the process exited
+            try:
+                result = results.get(timeout=1.0)
+            except queue.Empty:
+                result = {'error': 'process died with exit code %s' % process.exitcode}
+            break
+    process.join()
+    return result
+
+
+def run(args):
+    workload_names = args.workloads or sorted(workloads.keys()) + ['scenarios']
+    formulation.break_symmetries = not args.no_symmetry_breaking
+    solvers.big_m = args.big_m
+    options = {}
+    if args.time_limit is not None:
+        options['time_limit'] = args.time_limit
+    if args.processes is not None:
+        options['processes'] = args.processes
+
+    results = {
+        'meta': {
+            'backend': args.backend,
+            'options': options,
+            'break_symmetries': formulation.break_symmetries,
+            'big_m': solvers.big_m,
+            'trials': args.trials,
+            'seed': args.seed,
+            'quick': args.quick,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': multiprocessing.cpu_count(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'cases': [],
+    }
+    for workload, case, make_room in cases(workload_names, quick=args.quick):
+        trials = args.trials
+        result = run_isolated(workload, case, make_room, trials, args.seed, args.backend,
+                              options)
+        results['cases'].append(result)
+        time_taken = result['timings']['time_taken']
+        if result['num_elements'] is None:
+            print('%s %s: %s, %d/%d failed' % (workload, case, result['errors'][0],
+                                               result['failures'], trials))
+            continue
+        print('%s %s (%d elements, %d devices, %d users): %s, %d/%d failed, %.0f MiB' % (
+            workload, case, result['num_elements'], result['num_devices'],
+            result['num_users'],
+            'p50 %.3fs p90 %.3fs' % (time_taken['p50'], time_taken['p90'])
+            if time_taken is not None else 'no successful trials',
+            result['failures'], trials, result['peak_rss_mb']))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print('Wrote %s' % args.output)
+
+
+def compare(args):
+    """Print changes between two runs and return the number of regressions."""
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    for key in ['backend', 'options', 'break_symmetries', 'big_m', 'trials', 'seed']:
+        if base['meta'].get(key) != new['meta'].get(key):
+            print('Warning: runs differ in %s (%s vs. %s)'
+                  % (key, base['meta'].get(key), new['meta'].get(key)))
+
+    base_cases = dict(((c['workload'], c['case']), c) for c in base['cases'])
+    regressions = 0
+    for case in new['cases']:
+        key = (case['workload'], case['case'])
+        if key not in base_cases:
+            continue
+        old = base_cases[key]
+        notes = []
+
+        # Times must grow both relatively and absolutely to count, to ignore noise
+        for q in args.percentiles:
+            old_time = (old['timings']['time_taken'] or {}).get(q)
+            new_time = (case['timings']['time_taken'] or {}).get(q)
+            if old_time is None or new_time is None:
+                continue
+            change = (new_time - old_time) / max(old_time, 1e-9)
+            is_regression = change > args.threshold and new_time - old_time > args.min_seconds
+            notes.append(('%s %.3fs -> %.3fs (%+.0f%%)'
+                          % (q, old_time, new_time, 100 * change), is_regression))
+        if case['failures'] != old['failures']:
+            notes.append(('failures %d -> %d' % (old['failures'], case['failures']),
+                          case['failures'] > old['failures']))
+        rss_change = case['peak_rss_mb'] - old['peak_rss_mb']
+        if abs(rss_change) > args.threshold * old['peak_rss_mb']:
+            notes.append(('peak memory %.0f -> %.0f MiB' % (old['peak_rss_mb'],
+                                                            case['peak_rss_mb']),
+                          rss_change > 0))
+        if old['objective'] is not None and case['objective'] is not None:
+            old_objective = old['objective']['mean']
+            new_objective = case['objective']['mean']
+            if abs(new_objective - old_objective) \
+                    > args.objective_tolerance * max(abs(old_objective), 1.0):
+                notes.append(('objective %.6f -> %.6f' % (old_objective, new_objective),
+                              new_objective < old_objective))
+
+        case_regressions = sum(is_regression for _, is_regression in notes)
+        regressions += case_regressions
+        if case_regressions > 0 or args.verbose:
+            print('%s %s %s: %s' % (
+                'REGRESSION' if case_regressions > 0 else 'ok',
+                case['workload'], case['case'],
+                ', '.join(('[!] ' if is_regression else '') + note
+                          for note, is_regression in notes)))
+    print('%d regression(s) in %d case(s) compared'
+          % (regressions, sum(1 for c in new['cases']
+                              if (c['workload'], c['case']) in base_cases)))
+    return regressions
+
+
+def plot(args, ylabel='Time to Solution / s'):
+    """Plot median times of generated workloads over their size."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    matplotlib.rcParams['text.usetex'] = args.usetex
+
+    with open(args.results) as f:
+        results = json.load(f)
+    out_dir = args.out_dir
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    for workload in sorted(workloads.keys()):
+        rows = [(int(c['case']), c['timings']['time_taken']['p50']) for c in results['cases']
+                if c['workload'] == workload and c['timings']['time_taken'] is not None]
+        if len(rows) < 3:
+            continue
+        x, y = np.array(rows, dtype=np.float64).T
+
+        # Define figure
+        fig = plt.figure(figsize=(3, 1.6))
+        fig.subplots_adjust(bottom=0.13, left=0.16, top=0.99, right=0.97)
+
+        # Plot data points
+        plt.plot(x, y, 'r.', aa=True)
+
+        # Regression fit
+        if workload == 'vary_users':
+            p = np.polyfit(x, y, deg=1)
+            plt.plot(x, p[0]*x**1 + p[1], 'g', label='linear fit', aa=True)
+        else:
+            p = np.polyfit(x, y, deg=2)
+            plt.plot(x, p[0]*x**2 + p[1]*x**1 + p[2], 'b', label='quadratic fit', aa=True)
+
+        # Labels
+        plt.xlabel(workload_labels[workload])
+        if workload == 'vary_elements':
+            plt.ylabel(ylabel)
+        plt.legend(frameon=False)
+
+        # Axes adjustments
+        ax = plt.gca()
+        ax.yaxis.set_label_coords(-0.13, 0.43)
+        ax.spines['top'].set_visible(False)
+        ax.spines['right'].set_visible(False)
+        ax.set_xlim((0.0, ax.get_xlim()[1]))
+        ax.set_ylim((0.0, ax.get_ylim()[1]))
+
+        # Save
+        plt.savefig('%s/%s.pdf' % (out_dir, workload))
+        plt.clf()
+        print('Wrote %s/%s.pdf' % (out_dir, workload))
+
+
+def codec_room(rng, num_users, num_elements, num_devices, users_per_device):
+    """Room with a shared display and private devices of few users each."""
+    elements = generate_elements(rng, num_elements)
+    users = generate_users(rng, num_users, elements)
+    devices = generate_devices(rng, num_devices)
+    devices[0].users = list(users)
+    for device in devices[1:]:
+        device.users = [users[u] for u in rng.choice(num_users, users_per_device, replace=False)]
+    return elements, devices, users
+
+
+def _generic_object_hook(o):
+    """Unpack JSON objects using __class__ annotations, as `converters` did before `codec`."""
+    if isinstance(o, dict) and '__class__' in o:
+        class_name = o['__class__']
+        del o['__class__']
+        if class_name == 'Properties':
+            keys = o.keys()
+            return Properties(**dict((k, o[k]) for k in keys))
+        elif class_name == 'Element':
+            restrictions = {}
+            for key in ['allowed_users', 'prohibited_users']:
+                if key in o.keys():
+                    if isinstance(o[key], list):
+                        restrictions[key] = o[key]
+                    del o[key]
+            element = Element(**o)  # Unpack dict as keyword-arguments
+            element.allowed_users = restrictions.get('allowed_users', [])
+            element.prohibited_users = restrictions.get('prohibited_users', [])
+            return element
+        elif class_name == 'Device':
+            o['affordances'] = _generic_object_hook(o['affordances'])
+            return Device(**o)
+        elif class_name == 'User':
+            element_importances = {}
+            if 'element_importances' in o.keys():
+                if isinstance(o['element_importances'], dict):
+                    element_importances = o['element_importances']
+                del o['element_importances']
+            user = User(**o)
+            user.importance = element_importances
+            return user
+    elif isinstance(o, list):
+        out = []
+        for item in o:
+            out.append(_generic_object_hook(item))
+        return out
+    return o
+
+
+def generic_decode(s):
+    """Decode a request through an object hook, the baseline of `codec_benchmark`."""
+    out = json.loads(s, object_hook=_generic_object_hook)
+    users = out['data']['users']
+    user_id_to_device = dict((u.id, u) for u in users)
+    for device in out['data']['devices']:
+        device.users = [user_id_to_device[uid] for uid in device.users
+                        if uid in user_id_to_device.keys()]
+    for element in out['data']['elements']:
+        element.allowed_users = [user_id_to_device[uid] for uid in element.allowed_users
+                                 if uid in user_id_to_device.keys()]
+        element.prohibited_users = [user_id_to_device[uid] for uid in element.prohibited_users
+                                    if uid in user_id_to_device.keys()]
+    return out
+
+
+def codec_benchmark(args):
+    """Time decoding requests and encoding replies with the generic and schema codecs."""
+    rng = np.random.RandomState(seed_for(args.seed, 'codec', args.users, 0))
+    elements, devices, users = codec_room(rng, args.users, args.elements, args.devices,
+                                          args.users_per_device)
+    request = codec.encode_request(elements, devices, users, token='benchmark')
+    assignment = dict((d.name, [e.name for e in elements[:rng.randint(1, 8)]])
+                      for d in devices)
+    output = dict((d, [e for e in elements if e.name in assignment[d.name]]) for d in devices)
+
+    def best_time(function, payload):
+        times = []
+        for _ in range(args.repeats):
+            start_time = time.time()
+            function(payload)
+            times.append(time.time() - start_time)
+        return min(times)
+
+    def generic_reply(output):
+        cleaned_output = {'token': 'benchmark', 'data': {}}
+        for device, assigned in output.items():
+            cleaned_output['data'][device.name] = [e.name for e in assigned]
+        return json.dumps(cleaned_output, cls=converters.OurJSONEncoder, indent=2,
+                          sort_keys=True)
+
+    rows = [('decode request', 'generic', request, generic_decode),
+            ('decode request', 'schema', request, codec.decode_request),
+            ('encode reply', 'generic', output, generic_reply),
+            ('encode reply', 'schema', output, lambda o: converters.our_output_to_json(o)),
+            ('encode reply', 'compact', output,
+             lambda o: converters.our_output_to_json(o, compact=True))]
+    if codec.msgpack is not None:
+        binary_request = codec.encode_request(elements, devices, users, token='benchmark',
+                                              binary=True)
+        rows.insert(2, ('decode request', 'msgpack', binary_request,
+                        lambda s: codec.decode_request(s, binary=True)))
+        rows.append(('encode reply', 'msgpack', output,
+                     lambda o: codec.encode_reply(
+                         dict((d.name, [e.name for e in assigned]) for d, assigned in o.items()),
+                         token='benchmark', binary=True)))
+
+    print('%d users, %d elements, %d devices, best of %d' % (
+        args.users, args.elements, args.devices, args.repeats))
+    baseline = {}
+    for operation, name, payload, function in rows:
+        seconds = best_time(function, payload)
+        encoded = payload if operation.startswith('decode') else function(payload)
+        baseline.setdefault(operation, seconds)
+        print('%-15s %-8s %9.1f ms %9.1f KiB %8.1f MiB/s %6.1fx' % (
+            operation, name, seconds * 1000, len(encoded) / 1024.0,
+            len(encoded) / 1024.0 ** 2 / seconds, baseline[operation] / seconds))
+
+
+def latency_trial(requests, backend, threads, with_warm_up):
+    """Handle requests one after another in this process and return their latencies."""
+    warm_up_time = warm_up(backend, threads=threads) if with_warm_up else None
+    latencies = []
+    for request in requests:
+        start_time = time.time()
+        handle_web_input(request, backend=backend, processes=1, threads=threads)
+        latencies.append(time.time() - start_time)
+    return {'warm_up': warm_up_time, 'latencies': latencies}
+
+
+def latency_benchmark(args):
+    """Time the first and later requests of a fresh process, with and without warm-up."""
+    requests = []
+    for trial in range(args.requests):
+        rng = np.random.RandomState(seed_for(args.seed, 'latency', args.users, trial))
+        requests.append(codec.encode_request(*vary_users(rng, args.users),
+                                             token='benchmark'))
+
+    print('%s, %d requests of rooms with %d users, %d processes each' % (
+        args.backend, args.requests, args.users, args.repeats))
+    for with_warm_up in [False, True]:
+        first, steady, warm_up_times = [], [], []
+        for _ in range(args.repeats):
+            result = isolated(latency_trial, requests, args.backend, args.threads, with_warm_up)
+            if 'error' in result:
+                raise RuntimeError(result['error'])
+            first.append(result['latencies'][0])
+            steady.extend(result['latencies'][1:])
+            warm_up_times.append(result['warm_up'])
+        print('%-14s first p50 %7.1f ms   steady p50 %7.1f ms p90 %7.1f ms%s' % (
+            'warm-up' if with_warm_up else 'no warm-up', np.median(first) * 1000,
+            np.percentile(steady, 50) * 1000, np.percentile(steady, 90) * 1000,
+            '   warm-up p50 %.1f ms' % (np.median(warm_up_times) * 1000)
+            if with_warm_up else ''))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help='run benchmarks and save results as JSON')
+    run_parser.add_argument('-o', '--output', default='benchmark.json')
+    run_parser.add_argument('--workloads', nargs='+',
+                            choices=sorted(workloads.keys()) + ['scenarios'],
+                            help='workloads to run, all by default')
+    run_parser.add_argument('--backend', default='gurobi',
+                            choices=sorted(solvers.BACKENDS.keys()))
+    run_parser.add_argument('--time-limit', type=float, default=None)
+    run_parser.add_argument('--processes', type=int, default=None,
+                            help='processes used by the optimizer, see `decomposition`')
+    run_parser.add_argument('--trials', type=int, default=num_trials,
+                            help='number of rooms solved per case')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--quick', action='store_true',
+                            help='only run small sizes of generated workloads')
+    run_parser.add_argument('--no-symmetry-breaking', action='store_true',
+                            help='leave out constraints ordering interchangeable devices and '
+                                 'elements, see `formulation.symmetry_breaking_rows`')
+    run_parser.add_argument('--big-m', action='store_true',
+                            help='link assignments and areas by linear bounds instead of '
+                                 'indicator constraints, see `solvers.GurobiBackend`')
+
+    compare_parser = subparsers.add_parser(
+        'compare', help='compare two runs and fail if the second has regressions')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='relative increase of time or memory to flag')
+    compare_parser.add_argument('--min-seconds', type=float, default=0.005,
+                                help='absolute increase of time to flag')
+    compare_parser.add_argument('--objective-tolerance', type=float, default=1e-4,
+                                help='relative change of objective to report, by default '
+                                     'the MIP gap at which solvers stop')
+    compare_parser.add_argument('--percentiles', nargs='+', default=['p50', 'p90'],
+                                choices=['mean', 'min', 'max']
+                                        + ['p%d' % q for q in percentiles])
+    compare_parser.add_argument('-v', '--verbose', action='store_true',
+                                help='also list cases without regressions')
+
+    plot_parser = subparsers.add_parser('plot', help='plot times of a run over room size')
+    plot_parser.add_argument('results')
+    plot_parser.add_argument('--out-dir', default='scalability_test_outputs')
+    plot_parser.add_argument('--usetex', action='store_true')
+
+    codec_parser = subparsers.add_parser(
+        'codec', help='time decoding requests and encoding replies, see `codec`')
+    codec_parser.add_argument('--users', type=int, default=10000)
+    codec_parser.add_argument('--elements', type=int, default=30)
+    codec_parser.add_argument('--devices', type=int, default=2000)
+    codec_parser.add_argument('--users-per-device', type=int, default=5)
+    codec_parser.add_argument('--repeats', type=int, default=5)
+    codec_parser.add_argument('--seed', type=int, default=0)
+
+    latency_parser = subparsers.add_parser(
+        'latency', help='time the first and later requests of fresh processes, with and '
+                        'without `optimize.warm_up`')
+    latency_parser.add_argument('--backend', default='gurobi',
+                                choices=sorted(solvers.BACKENDS.keys()))
+    latency_parser.add_argument('--threads', type=int, default=None)
+    latency_parser.add_argument('--users', type=int, default=20)
+    latency_parser.add_argument('--requests', type=int, default=10,
+                                help='number of requests handled by each process')
+    latency_parser.add_argument('--repeats', type=int, default=5,
+                                help='number of fresh processes')
+    latency_parser.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    elif args.command == 'compare':
+        sys.exit(1 if compare(args) > 0 else 0)
+    elif args.command == 'plot':
+        plot(args)
+    elif args.command == 'codec':
+        codec_benchmark(args)
+    elif args.command == 'latency':
+        latency_benchmark(args)
@@ -0,0 +1,137 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Caching of assignments for rooms which have been optimized before."""
+from collections import OrderedDict
+import hashlib
+import threading
+
+
+def canonical_key(elements, devices, users, *options):
+    """Hash of a room which does not depend on the order of objects or on user IDs.
+
+    Users are referred to by their rank among all users, ordered by name and importances,
+    and then by the names of the devices and elements they have access to, so that users
+    which tie on name and importances are ranked by content rather than by input order.
+    Users not in `users` are left out as they are ignored by the optimizer. Further
+    options which change the assignment, such as the solver backend, are hashed as given.
+    """
+    user_keys = [(user.name, sorted(user.importance.items())) for user in users]
+    access = dict((id(user), ([], [], [])) for user in users)
+    for d in devices:
+        for user in d.users:
+            if id(user) in access:
+                access[id(user)][0].append(d.name)
+    for e in elements:
+        for kind, user_list in [(1, e.allowed_users), (2, e.prohibited_users)]:
+            for user in user_list:
+                if id(user) in access:
+                    access[id(user)][kind].append(e.name)
+    access_keys = [tuple(sorted(names) for names in access[id(user)]) for user in users]
+    order = sorted(range(len(users)), key=lambda u: (user_keys[u], access_keys[u]))
+    rank = dict((id(users[u]), r) for r, u in enumerate(order))
+
+    def user_ranks(user_list):
+        return sorted(rank[id(user)] for user in user_list if id(user) in rank)
+
+    def properties(p):
+        return (p.visual_display, p.text_input, p.touch_pointing, p.mouse_pointing)
+
+    canonical = (
+        sorted(user_keys),
+        sorted((e.name, e.importance, e.min_width, e.max_width, e.min_height, e.max_height,
+                properties(e.requirements), user_ranks(e.allowed_users),
+                user_ranks(e.prohibited_users))
+               for e in elements),
+        sorted((d.name, d.width, d.height, properties(d.affordances), user_ranks(d.users))
+               for d in devices),
+        options,
+    )
+    return hashlib.sha1(repr(canonical).encode('utf-8')).hexdigest()
+
+
+def object_keys(elements, devices, users):
+    """Description of each object of a room, to find the objects changed between rooms.
+
+    Users not in `users` are left out, as they are ignored by the optimizer.
+
+    Output:
+        dict of 'elements', 'devices' and 'users' => dict of name => description
+    """
+    def properties(p):
+        return (p.visual_display, p.text_input, p.touch_pointing, p.mouse_pointing)
+
+    members = set(id(user) for user in users)
+
+    def user_names(user_list):
+        return sorted(user.name for user in user_list if id(user) in members)
+
+    return {
+        'users': dict((u.name, sorted(u.importance.items())) for u in users),
+        'elements': dict((e.name, (e.importance, e.min_width, e.max_width, e.min_height,
+                                   e.max_height, properties(e.requirements),
+                                   user_names(e.allowed_users),
+                                   user_names(e.prohibited_users)))
+                         for e in elements),
+        'devices': dict((d.name, (d.width, d.height, properties(d.affordances),
+                                  user_names(d.users)))
+                        for d in devices),
+    }
+
+
+def changes(old_keys, new_keys):
+    """Names of objects which were added, removed or changed between two `object_keys`."""
+    return dict((kind, sorted(name for name in set(old_keys[kind]) | set(new_keys[kind])
+                              if old_keys[kind].get(name) != new_keys[kind].get(name)))
+                for kind in new_keys)
+
+
+class LRUCache(object):
+    """Bounded mapping which evicts the least recently used entry when full.
+
+    Safe to use from several threads, such as those of the websocket server.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Value stored for a key, or None if not cached."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            value = self._entries.pop(key)
+            self._entries[key] = value
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
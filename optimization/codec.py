@@ -0,0 +1,199 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Encoding and decoding of requests and replies by their known schema.
+
+Requests are parsed into plain dicts and lists, which are then turned into model objects
+field by field, rather than through an `object_hook` called for every JSON object. User
+ids are resolved with a dict. Replies are encoded from plain dicts, compactly or indented
+as before, or as MessagePack if the `msgpack` package is installed.
+
+Benchmark with `python benchmark.py codec`.
+"""
+import json
+
+from user import User
+from device import Device
+from element import Element
+from properties import Properties
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_property_names = Properties.names
+
+
+def loads(data, binary=False):
+    """Parse a message from JSON, or from MessagePack if `binary`."""
+    if binary:
+        _require_msgpack()
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data)
+
+
+def dumps(message, compact=False, binary=False):
+    """Encode a message of plain types.
+
+    JSON is indented with sorted keys unless `compact`. MessagePack is returned as bytes.
+    """
+    if binary:
+        _require_msgpack()
+        return msgpack.packb(message, use_bin_type=True)
+    if compact:
+        text = json.dumps(message, separators=(',', ':'))
+    else:
+        text = json.dumps(message, indent=2, sort_keys=True)
+    return text.decode('utf-8') if isinstance(text, bytes) else text
+
+
+def decode_request(message, binary=False):
+    """Model objects of a request, which is encoded or parsed already.
+
+    A parsed request may also hold the decoded lists of elements, devices and users of a
+    room under 'objects', as kept by `rooms.Rooms`, which are used as they are.
+
+    Output:
+        (list of Element, list of Device, list of User, token, dict of options)
+    """
+    if not isinstance(message, dict):
+        message = loads(message, binary=binary)
+    if 'objects' in message:
+        elements, devices, users = [list(objects) for objects in message['objects']]
+        return elements, devices, users, message['token'], message.get('options', {})
+    data = message['data']
+
+    users = [decode_user(u) for u in data['users']]
+    user_by_id = dict((user.id, user) for user in users)
+
+    def users_of(ids):
+        return [user_by_id[uid] for uid in ids if uid in user_by_id]
+
+    elements = [decode_element(e, users_of) for e in data['elements']]
+    devices = [decode_device(d, users_of) for d in data['devices']]
+    return elements, devices, users, message['token'], message.get('options', {})
+
+
+def decode_user(u):
+    """User of its fields in a request."""
+    importance = u.get('element_importances')
+    return User(name=u.get('name', ''), id=u.get('id'),
+                importance=dict(importance) if isinstance(importance, dict) else {})
+
+
+def decode_element(e, users_of):
+    """Element of its fields in a request, with a function from user ids to Users."""
+    element = Element(e['name'], e['importance'], e['min_width'], e['max_width'],
+                      e['min_height'], e['max_height'], _properties(e['requirements']))
+    allowed_users = e.get('allowed_users')
+    if isinstance(allowed_users, list):
+        element.allowed_users = users_of(allowed_users)
+    prohibited_users = e.get('prohibited_users')
+    if isinstance(prohibited_users, list):
+        element.prohibited_users = users_of(prohibited_users)
+    return element
+
+
+def decode_device(d, users_of):
+    """Device of its fields in a request, with a function from user ids to Users."""
+    return Device(d['name'], d['width'], d['height'], _properties(d['affordances']),
+                  users_of(d.get('users') or []))
+
+
+def encode_request(elements, devices, users, token='', options=None, compact=False,
+                   binary=False):
+    """Request for a room, as decoded by `decode_request`."""
+    message = {
+        'token': token,
+        'data': {
+            'elements': [_element_fields(e) for e in elements],
+            'devices': [_device_fields(d) for d in devices],
+            'users': [_user_fields(u) for u in users],
+        },
+    }
+    if options:
+        message['options'] = options
+    return dumps(message, compact=compact, binary=binary)
+
+
+def encode_reply(assignment, token='', stats=None, version=None, base_version=None,
+                 removed_devices=None, progress=None, compact=False, binary=False):
+    """Reply with an assignment of device names to lists of element names.
+
+    See `converters.our_output_to_json` for the other arguments.
+    """
+    message = {'token': token, 'data': assignment}
+    if stats is not None:
+        message['stats'] = stats
+    if version is not None:
+        message['version'] = version
+    if base_version is not None:
+        message['base_version'] = base_version
+        message['removed'] = removed_devices or []
+    if progress is not None:
+        message['progress'] = progress
+    return dumps(message, compact=compact, binary=binary)
+
+
+def object_fields(o):
+    """Fields of an Element, Device, User or Properties as encoded in requests."""
+    if isinstance(o, Element):
+        return _element_fields(o)
+    elif isinstance(o, Device):
+        return _device_fields(o)
+    elif isinstance(o, User):
+        return _user_fields(o)
+    return _properties_fields(o)
+
+
+def _require_msgpack():
+    if msgpack is None:
+        raise ValueError('msgpack is not installed')
+
+
+def _properties(p):
+    return Properties(*[p.get(name, 0) for name in _property_names])
+
+
+def _properties_fields(p):
+    fields = dict((name, getattr(p, name)) for name in _property_names)
+    fields['__class__'] = 'Properties'
+    return fields
+
+
+def _element_fields(e):
+    fields = {'__class__': 'Element', 'name': e.name, 'importance': e.importance,
+              'min_width': e.min_width, 'max_width': e.max_width, 'min_height': e.min_height,
+              'max_height': e.max_height, 'requirements': _properties_fields(e.requirements)}
+    if len(e.allowed_users) > 0:
+        fields['allowed_users'] = [user.id for user in e.allowed_users]
+    if len(e.prohibited_users) > 0:
+        fields['prohibited_users'] = [user.id for user in e.prohibited_users]
+    return fields
+
+
+def _device_fields(d):
+    return {'__class__': 'Device', 'name': d.name, 'width': d.width, 'height': d.height,
+            'affordances': _properties_fields(d.affordances),
+            'users': [user.id for user in d.users]}
+
+
+def _user_fields(u):
+    return {'__class__': 'User', 'name': u.name, 'id': u.id, 'element_importances': u.importance}
@@ -0,0 +1,94 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Compatibility of all elements with all devices at once.
+
+Compatibility compares the requirements of an element with the affordances of a device,
+with the properties of many objects given as rows of arrays, see `ProblemArrays`. The
+metrics are those of `Device.calculate_compatibility`:
+
+    'dot': dot product of requirements and affordances
+    'distance': 10 minus the floored Euclidean distance over the properties which the
+                element requires
+
+As each property is one of 0...5, there are only 6^4 = 1296 distinct vectors. The distance
+of every pair of them is held in a table of 1.6 MiB, built on first use, which turns the
+distance metric into a lookup by vector codes.
+"""
+import numpy as np
+
+max_distance = 10
+
+_num_values = 6
+_distance_table = None
+
+
+def compatibility_matrix(requirements, affordances, metric='dot', table=False):
+    """Compatibility of each element with each device.
+
+    Input:
+        requirements (array): properties required by each element, one row each
+        affordances (array): properties afforded by each device, one row each
+        metric (str): 'dot' or 'distance'
+        table (bool): look distances up in the precomputed table
+
+    Output:
+        array of elements x devices
+    """
+    if metric == 'dot':
+        return np.dot(np.asarray(requirements, dtype=np.float64),
+                      np.asarray(affordances, dtype=np.float64).T)
+    elif metric == 'distance':
+        if table:
+            return distance_table()[vector_codes(requirements)[:, np.newaxis],
+                                    vector_codes(affordances)].astype(np.float64)
+        return _distances(np.asarray(requirements, dtype=np.float64),
+                          np.asarray(affordances, dtype=np.float64))
+    raise ValueError('Unknown compatibility metric "%s"' % metric)
+
+
+def vector_codes(properties):
+    """Index of each row of properties among all 1296 vectors."""
+    properties = np.asarray(properties, dtype=np.int64).reshape(-1, 4)
+    return np.dot(properties, _num_values ** np.arange(3, -1, -1))
+
+
+def distance_table():
+    """Distance metric of all pairs of requirement and affordance vectors, by codes."""
+    global _distance_table
+    if _distance_table is None:
+        values = np.arange(_num_values)
+        digits = (np.arange(_num_values ** 4)[:, np.newaxis]
+                  // _num_values ** np.arange(3, -1, -1)) % _num_values
+        # Squared difference of a required and an afforded value, if required at all
+        squared = (values - values[:, np.newaxis]) ** 2 * (values != 0)[:, np.newaxis]
+        total = np.zeros((len(digits), len(digits)), dtype=np.int16)
+        for p in range(digits.shape[1]):
+            total += squared[digits[:, p][:, np.newaxis], digits[:, p]].astype(np.int16)
+        floored = max_distance - np.floor(np.sqrt(np.arange(total.max() + 1)))
+        _distance_table = floored.astype(np.int8)[total]
+    return _distance_table
+
+
+def _distances(requirements, affordances):
+    # Only consider properties which are required by an element
+    diff = affordances[np.newaxis, :, :] - requirements[:, np.newaxis, :]
+    diff *= (requirements != 0)[:, np.newaxis, :]
+    distance = np.sqrt(np.einsum('edp,edp->ed', diff, diff))
+    return max_distance - np.floor(distance)
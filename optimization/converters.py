@@ -20,6 +20,7 @@
 """Conversion methods for communication between frontend and backend."""
 import json
 
+import codec
 from user import User
 from device import Device
 from element import Element
@@ -36,20 +37,8 @@ class OurJSONEncoder(json.JSONEncoder):
         """Overload method to add annotations for class instances."""
         if isinstance(o, Device) or isinstance(o, Element) or \
            isinstance(o, Properties) or isinstance(o, User):
-            # Add __class__ property to identify later
-            out = {'__class__': o.__class__.__name__}
-
-            variables = vars(o)
-            for key, value in variables.iteritems():
-                if key[0] == '_':
-                    continue
-                elif key == 'users':
-                    out[key] = [u.id for u in value]
-                elif hasattr(value, '__class__'):
-                    out[key] = self.default(value)
-                else:
-                    out[key] = value
-            return out
+            # Fields with a __class__ property to identify later
+            return codec.object_fields(o)
         elif isinstance(o, list):
             out = []
             for item in o:
@@ -76,75 +65,34 @@ def our_inputs_to_json(elements, devices, users, token=''):
                 'users': users
             },
         },
-        cls=OurJSONEncoder, indent=2, sort_keys=True).decode('utf-8')
-
-
-def _our_json_decode(o):
-    """Unpack JSON objects using __class__ annotations."""
-    if isinstance(o, dict) and '__class__' in o:
-        class_name = o['__class__']
-        del o['__class__']
-        if class_name == 'Properties':
-            keys = o.keys()
-            return Properties(**dict((k, o[k]) for k in keys))
-        elif class_name == 'Element':
-            allowed_users = []
-            if 'allowed_users' in o.keys():
-                if isinstance(o['allowed_users'], list):
-                    allowed_users = o['allowed_users']
-                del o['allowed_users']
-            element = Element(**o)  # Unpack dict as keyword-arguments
-            element.allowed_users = allowed_users
-            return element
-        elif class_name == 'Device':
-            o['affordances'] = _our_json_decode(o['affordances'])
-            return Device(**o)
-        elif class_name == 'User':
-            element_importances = {}
-            if 'element_importances' in o.keys():
-                if isinstance(o['element_importances'], dict):
-                    element_importances = o['element_importances']
-                del o['element_importances']
-            user = User(**o)
-            user.importance = element_importances
-            return user
-    elif isinstance(o, list):
-        out = []
-        for item in o:
-            out.append(_our_json_decode(item))
-        return out
-    return o
+        cls=OurJSONEncoder, indent=2, sort_keys=True)
 
 
 def json_to_our_inputs(s):
-    """Convert JSON problem formulation from frontend to Python structures."""
-    # Convert to Python structures
-    out = json.loads(s, object_hook=_our_json_decode)
+    """Convert JSON problem formulation from frontend to Python structures.
 
-    # Fix Device.users lists which is originally just UIDs
-    token = out['token']
-    devices = out['data']['devices']
-    elements = out['data']['elements']
-    users = out['data']['users']
-
-    user_id_to_device = dict((u.id, u) for u in users)
-    for device in devices:
-        device.users = [user_id_to_device[uid] for uid in device.users
-                        if uid in user_id_to_device.keys()]
-
-    for element in elements:
-        element.allowed_users \
-            = [user_id_to_device[uid] for uid in element.allowed_users
-               if uid in user_id_to_device.keys()]
-
-    return elements, devices, users, token
+    The optional 'options' dict of a request holds solver settings such as
+    'time_limit' and 'mip_gap'. It is empty if not given. `s` may also be a request
+    which was parsed already, or one holding the objects of a room kept by `rooms.Rooms`.
+    Device users and allowed and prohibited users of elements are resolved from user IDs
+    to User objects.
+    """
+    return codec.decode_request(s)
 
 
-def our_output_to_json(output, token=''):
-    """Convert optimizer output to JSON interpretable by frontend."""
-    cleaned_output = {'token': token, 'data': {}}
-    for device, elements in output.items():
-        cleaned_output['data'][device.name] = [e.name for e in elements]
+def our_output_to_json(output, token='', stats=None, version=None, base_version=None,
+                       removed_devices=None, progress=None, compact=False):
+    """Convert optimizer output to JSON interpretable by frontend.
 
-    return json.dumps(cleaned_output, cls=OurJSONEncoder,
-                      indent=2, sort_keys=True).decode('utf-8')
+    `stats` is an optional dict of solver statistics, such as status and MIP gap, which
+    is passed on as is. `version` optionally identifies the assignment. If `base_version`
+    is given, `output` only holds the devices whose elements changed since the assignment
+    of this version and `removed_devices` lists the names of devices which are gone.
+    `progress` optionally tags replies of a progressive solve, see
+    `optimize.handle_web_input`. The JSON is indented unless `compact`.
+    """
+    assignment = dict((device.name, [e.name for e in elements])
+                      for device, elements in output.items())
+    return codec.encode_reply(assignment, token=token, stats=stats, version=version,
+                              base_version=base_version, removed_devices=removed_devices,
+                              progress=progress, compact=compact)
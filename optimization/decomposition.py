@@ -0,0 +1,289 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Solve independent parts of an AssignmentProblem separately and in parallel.
+
+Users and devices form a graph in which a user is connected to a device if one of the
+user's elements may be assigned to it. Connected components of this graph share no
+constraints, e.g. every user with a private device forms their own component. Components
+are packed into one part per process, and parts are only coupled by the min. completeness
+over all users.
+
+The coupling is resolved exactly by solving all parts for fixed levels of min.
+completeness. The completeness of a user with n elements is a multiple of 1/n, so only
+these levels need to be considered. The highest feasible level is found by bisection and
+lower levels are then tried while they can still improve the objective.
+"""
+import copy
+import heapq
+import multiprocessing
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+import solvers
+
+_eps = 1e-9
+
+# Min. number of pairs and coverage rows per part, as smaller problems are solved faster
+# than they can be sent to another process
+min_part_size = 1000
+
+# Process pool and its number of processes, kept across calls to save start-up time
+_pool = None
+_pool_processes = 0
+
+
+def solve(backend, problem, readable_names=False, time_limit=None, mip_gap=None,
+          processes=None, start=None, threads=None, incumbent=None):
+    """Solve an AssignmentProblem in independent parts with a Backend.
+
+    Parts are solved on a pool of `processes` processes (number of CPUs if None), which
+    share `threads` solver threads, but use at least one each.
+    Heuristic backends, small problems and problems with a single component are solved as
+    a whole. Each part starts from its pairs of a `start` assignment, if given.
+    Incumbents are only passed to `incumbent` by problems solved as a whole, as parts are
+    solved in other processes. All rounds of part solves share one `time_limit`, and no
+    further levels are tried once it has run out.
+
+    Output:
+        Solution with status 'optimal' if all parts were solved to optimality
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    num_parts = min(processes, (problem.num_pairs + problem.num_coverages) // min_part_size)
+    if not backend.exact or num_parts <= 1:
+        return backend.solve(problem, readable_names=readable_names, time_limit=time_limit,
+                             mip_gap=mip_gap, start=start, threads=threads,
+                             incumbent=incumbent)
+    start_time = time.time()
+    parts, part_pairs = split(problem, num_parts)
+    if len(parts) <= 1:
+        return backend.solve(problem, readable_names=readable_names, time_limit=time_limit,
+                             mip_gap=mip_gap, start=start, threads=threads,
+                             incumbent=incumbent)
+    build_end_time = time.time()
+    deadline = start_time + time_limit if time_limit is not None else None
+
+    part_solutions = []
+
+    def remaining_time():
+        return max(0.0, deadline - time.time()) if deadline is not None else None
+
+    def out_of_time():
+        return deadline is not None and time.time() >= deadline
+
+    def solve_parts(indices, level):
+        """Solve some parts for a level, or return None if any has no assignment."""
+        part_time_limit = remaining_time()
+        tasks = []
+        part_threads = max(1, threads // max(1, min(processes, len(indices)))) \
+            if threads is not None else None
+        for c in indices:
+            part = copy.copy(parts[c])
+            part.fixed_min_ratio = level
+            part_start = (start[0][part_pairs[c]], start[1][part_pairs[c]]) \
+                if start is not None else None
+            tasks.append((backend.name, part, readable_names, part_time_limit, mip_gap,
+                          part_start, part_threads))
+        solutions = _map(_solve_part, tasks, processes)
+        part_solutions.extend(solutions)
+        if not all(solution.has_assignment for solution in solutions):
+            return None
+        return solutions
+
+    def combined(x, s, indices, solutions):
+        x, s = x.copy(), s.copy()
+        for c, solution in zip(indices, solutions):
+            x[part_pairs[c]] = solution.x
+            s[part_pairs[c]] = solution.s
+        return x, s
+
+    # Best assignment if min. completeness is left out, giving each part's min.
+    all_parts = range(len(parts))
+    solutions = solve_parts(all_parts, 0.0)
+    if solutions is None:
+        return _solution(part_solutions, len(parts), start_time, build_end_time)
+    x, s = combined(np.zeros(problem.num_pairs), np.zeros(problem.num_pairs), all_parts,
+                    solutions)
+    part_min_ratio = [part.completeness(solution.x)[1]
+                      for part, solution in zip(parts, solutions)]
+    # Upper bound on the objective without min. completeness
+    unconstrained_objective = sum(
+        part.objective(solution.x, solution.s) - part.completeness_weight * min_ratio
+        for part, solution, min_ratio in zip(parts, solutions, part_min_ratio))
+    best = [problem.objective(x, s), x, s]
+
+    def evaluate(level):
+        """Raise min. completeness to a level, or return False if infeasible.
+
+        Parts which run out of time without an assignment are also taken as infeasible,
+        after which no further levels are tried.
+        """
+        indices = [c for c in all_parts if part_min_ratio[c] < level - _eps]
+        solutions = solve_parts(indices, level - _eps)
+        if solutions is None:
+            return False
+        level_x, level_s = combined(x, s, indices, solutions)
+        objective = problem.objective(level_x, level_s)
+        if objective > best[0]:
+            best[:] = [objective, level_x, level_s]
+        return True
+
+    levels = candidate_levels(problem)
+    levels = levels[levels > problem.completeness(x)[1] + _eps]
+
+    # Find highest feasible level by bisection
+    low, high = -1, len(levels) - 1
+    evaluated = set()
+    while low < high and not out_of_time():
+        middle = (low + high + 1) // 2
+        evaluated.add(middle)
+        if evaluate(levels[middle]):
+            low = middle
+        else:
+            high = middle - 1
+
+    # Try lower levels while they may still improve the objective
+    for i in range(low, -1, -1):
+        if out_of_time():
+            break
+        if unconstrained_objective + problem.completeness_weight * levels[i] <= best[0] + _eps:
+            break
+        if i not in evaluated:
+            evaluate(levels[i])
+
+    solution = _solution(part_solutions, len(parts), start_time, build_end_time)
+    solution.x, solution.s = best[1], best[2]
+    return solution
+
+
+def split(problem, num_parts):
+    """Split an AssignmentProblem into at most num_parts independent subproblems.
+
+    Connected components are distributed over the parts, largest first, such that all
+    parts have a similar number of pairs and coverage rows.
+
+    Output:
+        (list of AssignmentProblem, list of arrays of pair indices of each subproblem)
+    """
+    num_users = len(problem.user_names)
+    num_devices = len(problem.device_names)
+    coverage_rows, pair_columns = problem.coverage_pairs.nonzero()
+    graph = sp.csr_matrix(
+        (np.ones(len(coverage_rows)),
+         (problem.coverage_user[coverage_rows], num_users + problem.pair_device[pair_columns])),
+        shape=(num_users + num_devices, num_users + num_devices))
+    num_components, labels = connected_components(graph, directed=False)
+
+    pair_labels = labels[num_users + problem.pair_device]
+    coverage_labels = labels[problem.coverage_user]
+    ratio_labels = labels[problem.ratio_users]
+    sizes = np.bincount(pair_labels, minlength=num_components) \
+        + np.bincount(coverage_labels, minlength=num_components)
+
+    # Components without pairs or users with elements have nothing to decide
+    relevant = np.zeros(num_components, dtype=bool)
+    relevant[pair_labels] = True
+    relevant[ratio_labels] = True
+    relevant = np.flatnonzero(relevant)
+
+    component_part = np.zeros(num_components, dtype=np.int64)
+    heap = [(0, part) for part in range(min(num_parts, len(relevant)))]
+    for component in relevant[np.argsort(-sizes[relevant], kind='mergesort')]:
+        size, part = heapq.heappop(heap)
+        component_part[component] = part
+        heapq.heappush(heap, (size + sizes[component], part))
+
+    part_labels = np.arange(len(heap))
+    pair_groups = _group(component_part[pair_labels], part_labels)
+    coverage_groups = _group(component_part[coverage_labels], part_labels)
+    ratio_groups = _group(component_part[ratio_labels], part_labels)
+    parts = [problem.subproblem(pairs, coverages, ratio_rows)
+             for pairs, coverages, ratio_rows in zip(pair_groups, coverage_groups, ratio_groups)]
+    return parts, pair_groups
+
+
+def candidate_levels(problem):
+    """Possible values of min. completeness, up to what each user could be shown."""
+    if len(problem.ratio_users) == 0:
+        return np.zeros(0)
+    max_ratio = (np.asarray(problem.user_ratios.sum(axis=1)).ravel()
+                 + problem.ratio_offset).min()
+    levels = np.unique(np.concatenate(
+        [np.arange(1, n + 1) / float(n)
+         for n in np.unique(problem.user_num_elements[problem.ratio_users])]))
+    return levels[levels <= max_ratio + _eps]
+
+
+def _group(labels, part_labels):
+    """Indices with each of the part labels."""
+    order = np.argsort(labels, kind='mergesort')
+    bounds = np.searchsorted(labels[order], np.append(part_labels, len(part_labels)))
+    return [order[bounds[i]:bounds[i + 1]] for i in range(len(part_labels))]
+
+
+def _solution(part_solutions, num_parts, start_time, build_end_time):
+    """Solution without assignment, summarizing the solves of all parts.
+
+    The model size is that of the first solve of each part, which together cover the whole
+    problem, and nodes are counted over all solves.
+    """
+    status = 'optimal'
+    for part_solution in part_solutions:
+        if part_solution.status not in ['optimal', 'infeasible', 'infeasible_or_unbounded']:
+            status = part_solution.status
+            break
+    solution = solvers.Solution(status=status, build_time=build_end_time - start_time,
+                                solve_time=time.time() - build_end_time)
+    gaps = [s.gap for s in part_solutions if s.has_assignment]
+    if len(gaps) > 0 and None not in gaps:
+        solution.gap = max(gaps)
+
+    def total(values):
+        return None if None in values else sum(values)
+
+    first_solutions = part_solutions[:num_parts]
+    solution.num_variables = total([s.num_variables for s in first_solutions])
+    solution.num_constraints = total([s.num_constraints for s in first_solutions])
+    solution.num_nonzeros = total([s.num_nonzeros for s in first_solutions])
+    solution.num_nodes = total([s.num_nodes for s in part_solutions])
+    return solution
+
+
+def _solve_part(task):
+    backend_name, part, readable_names, time_limit, mip_gap, start, threads = task
+    return solvers.get_backend(backend_name).solve(part, readable_names=readable_names,
+                                                   time_limit=time_limit, mip_gap=mip_gap,
+                                                   start=start, threads=threads)
+
+
+def _map(function, tasks, processes):
+    """Apply function to all tasks, in parallel if there are several processes."""
+    global _pool, _pool_processes
+    if processes <= 1 or len(tasks) <= 1:
+        return [function(task) for task in tasks]
+    if _pool is None or _pool_processes != processes:
+        if _pool is not None:
+            _pool.terminate()
+        _pool = multiprocessing.Pool(processes)
+        _pool_processes = processes
+    return _pool.map(function, tasks)
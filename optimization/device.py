@@ -21,13 +21,15 @@ from properties import Properties
 from element import Element
 from user import User
 
-class Device:
+class Device(object):
+    """Device of one or more users.
 
-    name = ''
-    width = 0
-    height = 0
-    affordances = {}
-    users = None
+    `users` is a tuple of the users with access. Change it with `give_access` and
+    `remove_access`, or by assigning a new list. Access checks keep a set of the same
+    users once called, so that further checks take constant time.
+    """
+
+    __slots__ = ('name', 'width', 'height', 'affordances', '_area', '_users', '_user_set')
 
     def __init__(self, name, width, height, affordances, users=None):
         assert isinstance(width, int) and width > 0
@@ -36,26 +38,41 @@ class Device:
 
         self.name = name
         self.affordances = affordances
-        self.users = users or []
+        self.users = users or ()
 
         self.width = width
         self.height = height
         self._area = width * height
 
+    @property
+    def users(self):
+        return self._users
+
+    @users.setter
+    def users(self, users):
+        self._users = tuple(users)
+        self._user_set = None
+
     def calculate_compatibility(self, element, metric):
         assert isinstance(element, Element)
-        if metric is 'distance':
+        if metric == 'distance':
             return self.distance(element.requirements)
-        elif metric is 'dot':
+        elif metric == 'dot':
             return self.affordances.dot(element.requirements)
 
     def has_access(self, user):
-        return user in self.users
+        if self._user_set is None:
+            self._user_set = frozenset(self._users)
+        return user in self._user_set
 
     def give_access(self, user):
         assert isinstance(user, User)
-        if user not in self.users:
-            self.users.append(user)
+        if not self.has_access(user):
+            self.users = self._users + (user,)
+
+    def remove_access(self, user):
+        if self.has_access(user):
+            self.users = [u for u in self._users if u is not user]
 
     def distance(self, element_requirements):
         max_distance = 10
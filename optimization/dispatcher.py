@@ -0,0 +1,324 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Handling of web inputs on worker processes.
+
+Requests are identified by their token. Only the latest request of a token is of interest
+to the frontend, so a request which is still waiting for a worker is replaced by a newer
+one with the same token, and a running request is cancelled once a newer one has arrived,
+see `solvers.cancel`. Its output is dropped and the newer request runs once the cancelled
+solve has stopped. Progressive replies of a running request are passed on until its output
+arrives, see `optimize.handle_web_input`.
+
+The last assignments of tokens are kept here rather than by the workers, and passed along
+with each request, so that a solve starts from the reply the client last received whichever
+worker solved it. Outputs which are dropped do not change them.
+
+If a worker process dies, the request it was solving is answered with a `worker` error and
+the worker is restarted, as are shards in `shards`.
+"""
+from collections import OrderedDict
+import json
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+import traceback
+
+import cache
+import optimize
+import solvers
+
+logger = logging.getLogger('SoManyScreens_backend')
+
+# Solution cache of a worker process, and the scheduler shared by all workers
+_cache = None
+_scheduler = None
+
+
+class Dispatcher(object):
+    """Solve web inputs on worker processes with a bounded queue of waiting requests.
+
+    Input:
+        processes (int): number of worker processes
+        max_pending (int): max. number of requests waiting for a worker
+        cache_size (int): number of assignments cached by each worker, 0 to disable
+        session_size (int): number of tokens whose last assignment is kept to start from,
+                            0 to disable
+        warm_up (bool): warm up each worker with `optimize.warm_up` before returning, so
+                        that the first requests are not slowed down. The longest warm-up
+                        of a worker is kept in seconds as `warm_up_time`.
+        scheduler (scheduler.Scheduler): hands out threads to the solves of all workers
+        handler_args: keyword arguments of `optimize.handle_web_input`
+    """
+
+    def __init__(self, processes, max_pending, cache_size=0, session_size=0, warm_up=False,
+                 scheduler=None, **handler_args):
+        self.processes = processes
+        self.max_pending = max_pending
+        self.superseded = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.warm_up_time = None
+
+        # Workers are daemons, which cannot start processes of their own
+        handler_args['processes'] = 1
+        warm_up_args = None
+        if warm_up:
+            warm_up_args = dict((key, handler_args[key]) for key in ['backend', 'threads']
+                                if key in handler_args)
+        self._worker_args = (cache_size, session_size > 0, scheduler, warm_up_args,
+                             handler_args)
+        self._sessions = cache.LRUCache(session_size) if session_size > 0 else None
+        self._scheduler = scheduler
+        self._lock = threading.Lock()
+        self._closed = False
+        self._next_id = 0
+        self._pending = OrderedDict()  # token => (web input, reply and progress functions)
+        self._workers = [_Worker(i, self._worker_args) for i in range(processes)]
+        times = [worker.replies.get()[2] for worker in self._workers]
+        if warm_up:
+            self.warm_up_time = max([t for t in times if t is not None] or [None])
+        for worker in self._workers:
+            thread = threading.Thread(target=self._read, args=(worker,))
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, token, web_input, reply, progress=None):
+        """Queue a web input for solving.
+
+        `reply` is called with the JSON output from another thread once solved, unless
+        the request is superseded by a newer one with the same token. `progress` is
+        called with progressive replies before, see `optimize.handle_web_input`.
+
+        Output:
+            False if the request was rejected as too many requests are waiting
+        """
+        with self._lock:
+            running = self._worker_of(token)
+            if token in self._pending:
+                self.superseded += 1
+                self._pending[token] = (web_input, reply, progress)
+            elif running is None and self._idle_worker() is not None:
+                self._start(self._idle_worker(), token, web_input, reply, progress)
+            elif len(self._pending) < self.max_pending:
+                self._pending[token] = (web_input, reply, progress)
+                # The running request of the token is outdated now
+                if running is not None:
+                    running.cancel()
+            else:
+                self.rejected += 1
+                return False
+        return True
+
+    def summary(self):
+        """Dict of the numbers of running, waiting, superseded and rejected requests, and
+        of restarts of workers."""
+        with self._lock:
+            return {'running': sum(1 for w in self._workers if w.running is not None),
+                    'pending': len(self._pending), 'superseded': self.superseded,
+                    'rejected': self.rejected, 'restarts': self.restarts}
+
+    def close(self):
+        self._closed = True
+        for worker in self._workers:
+            worker.requests.put(None)
+        for worker in self._workers:
+            worker.process.join(1)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+    def _worker_of(self, token):
+        for worker in self._workers:
+            if worker.running is not None and worker.running[1] == token:
+                return worker
+        return None
+
+    def _idle_worker(self):
+        for worker in self._workers:
+            if worker.running is None:
+                return worker
+        return None
+
+    def _start(self, worker, token, web_input, reply, progress):
+        request_id = self._next_id
+        self._next_id += 1
+        worker.running = (request_id, token, reply, progress)
+        session = self._sessions.get(token) if self._sessions is not None else None
+        worker.requests.put((request_id, token, web_input, session))
+
+    def _start_pending(self):
+        """Start waiting requests on idle workers, unless their token is still running."""
+        for token in list(self._pending.keys()):
+            worker = self._idle_worker()
+            if worker is None:
+                break
+            if self._worker_of(token) is None:
+                self._start(worker, token, *self._pending.pop(token))
+
+    def _read(self, worker):
+        """Pass on the replies of a worker and restart it if it died.
+
+        Progressive replies and outputs of a worker come through the same queue, so that
+        they arrive in order, and are sent without holding the lock. The session of a token
+        is updated before its next request starts.
+        """
+        while not self._closed:
+            try:
+                request_id, is_final, web_output, session = worker.replies.get(timeout=0.5)
+            except queue.Empty:
+                if not worker.process.is_alive() and not self._closed:
+                    self._restart(worker)
+                continue
+            with self._lock:
+                if worker.running is None or worker.running[0] != request_id:
+                    continue
+                token, reply, progress = worker.running[1:]
+                is_stale = token in self._pending
+                if is_final:
+                    worker.running = None
+                    if is_stale:
+                        self.superseded += 1
+                    elif session is not None and web_output is not None:
+                        self._sessions.put(token, session)
+                    self._start_pending()
+                else:
+                    reply = progress
+            if is_stale or reply is None or web_output is None:
+                continue
+
+            # Exceptions would stop replying to the requests of the worker
+            try:
+                reply(web_output)
+            except:
+                logger.debug('\n%s\n' % traceback.format_exc())
+
+    def _restart(self, worker):
+        # Threads held by the solve of the worker would never be given back otherwise
+        if self._scheduler is not None:
+            self._scheduler.reclaim(worker.process.pid)
+        with self._lock:
+            failed = worker.running
+            is_stale = failed is not None and failed[1] in self._pending
+            worker.running = None
+            self.restarts += 1
+            logger.info('Worker %d exited with code %s, restarting it' % (
+                worker.index, worker.process.exitcode))
+            worker.start()
+            self._start_pending()
+        if failed is None or is_stale:
+            return
+        try:
+            failed[2](json.dumps({'error': 'worker', 'token': failed[1]}))
+        except:
+            logger.debug('\n%s\n' % traceback.format_exc())
+
+
+class _Worker(object):
+    """Process of a worker with its queues of requests, cancellations and replies."""
+
+    def __init__(self, index, args):
+        self.index = index
+        self.args = args
+        self.start()
+
+    def start(self):
+        # Queues of a process which died may be left locked, so they are not reused
+        self.running = None  # (request id, token, reply function, progress function)
+        self.requests = multiprocessing.Queue()
+        self.cancellations = multiprocessing.Queue()
+        self.replies = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=_run_worker,
+            args=(self.requests, self.cancellations, self.replies) + self.args)
+        self.process.daemon = True
+        self.process.start()
+
+    def cancel(self):
+        """Cancel the running request."""
+        self.cancellations.put(self.running[0])
+
+
+def _run_worker(requests, cancellations, replies, cache_size, with_sessions, scheduler,
+                warm_up_args, handler_args):
+    global _cache, _scheduler
+    # Let the parent process handle interrupts
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if cache_size > 0:
+        _cache = cache.LRUCache(cache_size)
+    _scheduler = scheduler
+    # Workers which fail to warm up still take requests, which then report the error
+    seconds = None
+    if warm_up_args is not None:
+        try:
+            seconds = optimize.warm_up(**warm_up_args)
+        except:
+            logger.debug('\n%s\n' % traceback.format_exc())
+    replies.put((None, True, seconds, None))
+
+    # Cancel the solve of the current request from another thread. The lock ensures that
+    # a late cancellation does not hit the next request.
+    lock = threading.Lock()
+    current = [None]
+
+    def watch():
+        while True:
+            request_id = cancellations.get()
+            with lock:
+                if request_id == current[0]:
+                    solvers.cancel()
+    thread = threading.Thread(target=watch)
+    thread.daemon = True
+    thread.start()
+
+    while True:
+        request = requests.get()
+        if request is None:
+            return
+        request_id, token, web_input, session = request
+        with lock:
+            current[0] = request_id
+            solvers.resume()
+
+        # Sessions of only the token of the request, holding its new session after solving
+        sessions = None
+        if with_sessions:
+            sessions = cache.LRUCache(1)
+            if session is not None:
+                sessions.put(token, session)
+
+        def progress(web_output):
+            replies.put((request_id, False, web_output, None))
+        web_output = _handle(web_input, token, sessions, progress, handler_args)
+        replies.put((request_id, True, web_output,
+                     sessions.get(token) if sessions is not None else None))
+
+
+def _handle(web_input, token, sessions, progress, handler_args):
+    """JSON output for a web input, or None if it was cancelled."""
+    try:
+        return optimize.handle_web_input(
+            web_input, cache=_cache, sessions=sessions, scheduler=_scheduler,
+            progress=progress, **handler_args)
+    except solvers.Cancelled:
+        return None
+    except:
+        tb = traceback.format_exc()
+        return json.dumps({'error': tb, 'token': token})
@@ -19,18 +19,17 @@
 # DEALINGS IN THE SOFTWARE.
 from user import User
 
-class Element:
+class Element(object):
+    """Part of an interface to assign to devices.
 
-    name = ''
-    importance = 0
-    min_width = 0
-    max_width = 0
-    min_height = 0
-    max_height = 0
-    requirements = None
+    Access is either given to `allowed_users` or withheld from `prohibited_users`, and
+    otherwise open to all users. Both are tuples. `user_has_access` keeps a set of the
+    same users once called, so that further checks take constant time.
+    """
 
-    prohibited_users = []
-    allowed_users = []
+    __slots__ = ('name', 'importance', 'requirements', 'min_width', 'min_height', 'max_width',
+                 'max_height', '_min_area', '_max_area', '_allowed_users', '_allowed_set',
+                 '_prohibited_users', '_prohibited_set', '_optimizer_size')
 
     def __init__(self, name, importance, min_width, max_width, min_height,
                  max_height, requirements):
@@ -46,17 +45,39 @@ class Element:
         self.max_height = max_height
         self._max_area = max_width * max_height
 
-        self.prohibited_users = []
-        self.allowed_users = []
+        self.prohibited_users = ()
+        self.allowed_users = ()
+
+    @property
+    def allowed_users(self):
+        return self._allowed_users
+
+    @allowed_users.setter
+    def allowed_users(self, users):
+        self._allowed_users = tuple(users)
+        self._allowed_set = None
+
+    @property
+    def prohibited_users(self):
+        return self._prohibited_users
+
+    @prohibited_users.setter
+    def prohibited_users(self, users):
+        self._prohibited_users = tuple(users)
+        self._prohibited_set = None
 
     def user_has_access(self, user):
-        if len(self.prohibited_users) > 0:
-            assert len(self.allowed_users) == 0
-            return user not in self.prohibited_users
+        if len(self._prohibited_users) > 0:
+            assert len(self._allowed_users) == 0
+            if self._prohibited_set is None:
+                self._prohibited_set = frozenset(self._prohibited_users)
+            return user not in self._prohibited_set
 
-        elif len(self.allowed_users) > 0:
-            assert len(self.prohibited_users) == 0
-            return user in self.allowed_users
+        elif len(self._allowed_users) > 0:
+            assert len(self._prohibited_users) == 0
+            if self._allowed_set is None:
+                self._allowed_set = frozenset(self._allowed_users)
+            return user in self._allowed_set
 
         return True
 
@@ -67,7 +88,7 @@ class Element:
         assert isinstance(users, list)
         for user in users:
             assert isinstance(user, User)
-            self.allowed_users.append(user)
+        self.allowed_users = self.allowed_users + tuple(users)
 
     def user_prohibit_access(self, users):
         assert len(self.allowed_users) == 0
@@ -76,7 +97,7 @@ class Element:
         assert isinstance(users, list)
         for user in users:
             assert isinstance(user, User)
-            self.prohibited_users.append(user)
+        self.prohibited_users = self.prohibited_users + tuple(users)
 
     def __repr__(self):
         return '[Element "%s" importance=%d size_range=(%d,%d)~(%d,%d) requirements=%s]' % \
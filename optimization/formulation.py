@@ -0,0 +1,473 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Solver-independent formulation of the element-device assignment problem."""
+import numpy as np
+import scipy.sparse as sp
+
+# Whether to add constraints which order interchangeable devices and elements, see
+# `symmetry_breaking_rows`
+break_symmetries = True
+
+
+class AssignmentProblem(object):
+    """Arrays describing the assignment problem as handed to a solver backend.
+
+    Decision variables are
+        x[p] (binary): whether pair p is assigned, where pair p is element
+                       pair_element[p] on device pair_device[p]
+        s[p] (integer): area of the element on the device, s[p] = 0 if x[p] = 0
+                        and pair_min_area[p] <= s[p] <= pair_max_area[p] otherwise
+        user_has_element[k] (binary): whether element coverage_element[k] is available
+                                      to user coverage_user[k] on any of their devices
+        min_ratio_unique_elements (continuous): completeness ratio of user with min.
+                                                completeness
+
+    Users with the same access to devices and elements are grouped into classes, which
+    are formulated once, as they always see the same elements. Arrays over users, such as
+    coverage_user and user_names, refer to these classes and coverage weights sum over the
+    members of a class. `user_class` gives the class of each user.
+
+    Interchangeable devices and elements may be ordered by the optional constraints
+    device_order_pairs * s >= 0 and element_order_pairs * x >= 0, see
+    `symmetry_breaking_rows`.
+
+    If `fixed_min_ratio` is given, min_ratio_unique_elements is fixed to this value. All
+    users then need to have at least this completeness, see `decomposition`.
+
+    The completeness of the user of ratio row r is user_ratios[r] * user_has_element +
+    ratio_offset[r], where the offset counts elements shown to the user by pairs outside
+    of the problem, see `restricted`.
+    """
+
+    quality_weight = 0.8
+    completeness_weight = 0.2
+
+    def __init__(self, element_names, device_names, user_names, pair_element, pair_device,
+                 pair_min_area, pair_max_area, pair_quality, device_area, coverage_user,
+                 coverage_element, coverage_pairs, coverage_weight, ratio_users, user_ratios,
+                 user_num_elements, user_class, device_order_pairs=None,
+                 element_order_pairs=None, ratio_offset=None, fixed_min_ratio=None):
+        self.element_names = element_names
+        self.device_names = device_names
+        self.user_names = user_names
+
+        self.pair_element = pair_element
+        self.pair_device = pair_device
+        self.pair_min_area = pair_min_area
+        self.pair_max_area = pair_max_area
+        self.pair_quality = pair_quality
+        self.device_area = device_area
+
+        self.coverage_user = coverage_user
+        self.coverage_element = coverage_element
+        self.coverage_pairs = coverage_pairs
+        self.coverage_weight = coverage_weight
+
+        self.ratio_users = ratio_users
+        self.user_ratios = user_ratios
+        self.user_num_elements = user_num_elements
+        self.user_class = user_class
+        self.ratio_offset = ratio_offset if ratio_offset is not None \
+            else np.zeros(len(ratio_users))
+        self.fixed_min_ratio = fixed_min_ratio
+
+        no_rows = sp.csr_matrix((0, self.num_pairs))
+        self.device_order_pairs = device_order_pairs if device_order_pairs is not None \
+            else no_rows
+        self.element_order_pairs = element_order_pairs if element_order_pairs is not None \
+            else no_rows
+
+        # (10) sum of widget areas shouldn't exceed device capacity (area)
+        self.capacity_devices, device_rows = np.unique(pair_device, return_inverse=True)
+        self.capacity_pairs = sp.csr_matrix(
+            (np.ones(self.num_pairs), (device_rows, np.arange(self.num_pairs))),
+            shape=(len(self.capacity_devices), self.num_pairs))
+
+    @property
+    def num_pairs(self):
+        return len(self.pair_element)
+
+    @property
+    def num_coverages(self):
+        return len(self.coverage_user)
+
+    def pair_names(self):
+        return ['%s_%s' % (self.element_names[e], self.device_names[d])
+                for e, d in zip(self.pair_element, self.pair_device)]
+
+    def coverage_names(self):
+        return ['%s_%s' % (self.user_names[u], self.element_names[e])
+                for u, e in zip(self.coverage_user, self.coverage_element)]
+
+    def subproblem(self, pairs, coverages, ratio_rows, fixed_min_ratio=None):
+        """Restrict the problem to some pairs, coverage rows and ratio rows.
+
+        The coverage rows must only depend on the given pairs and the ratio rows only on
+        the given coverage rows. Symmetry breaking rows which involve other pairs are left
+        out.
+        """
+        is_outside = np.ones(self.num_pairs, dtype=bool)
+        is_outside[pairs] = False
+
+        def order_rows(order_pairs):
+            uses_outside = abs(order_pairs).dot(is_outside.astype(np.float64)) > 0
+            return order_pairs[np.flatnonzero(~uses_outside)][:, pairs]
+
+        return AssignmentProblem(
+            element_names=self.element_names,
+            device_names=self.device_names,
+            user_names=self.user_names,
+            pair_element=self.pair_element[pairs],
+            pair_device=self.pair_device[pairs],
+            pair_min_area=self.pair_min_area[pairs],
+            pair_max_area=self.pair_max_area[pairs],
+            pair_quality=self.pair_quality[pairs],
+            device_area=self.device_area,
+            coverage_user=self.coverage_user[coverages],
+            coverage_element=self.coverage_element[coverages],
+            coverage_pairs=self.coverage_pairs[coverages][:, pairs],
+            coverage_weight=self.coverage_weight[coverages],
+            ratio_users=self.ratio_users[ratio_rows],
+            user_ratios=self.user_ratios[ratio_rows][:, coverages],
+            user_num_elements=self.user_num_elements,
+            user_class=self.user_class,
+            device_order_pairs=order_rows(self.device_order_pairs),
+            element_order_pairs=order_rows(self.element_order_pairs),
+            ratio_offset=self.ratio_offset[ratio_rows],
+            fixed_min_ratio=fixed_min_ratio,
+        )
+
+    def restricted(self, pairs, x):
+        """Restrict the problem to some pairs, with all other pairs fixed to an assignment x.
+
+        Coverage rows which the fixed pairs satisfy are left out and counted in the
+        offset of the ratio rows instead, as are rows which only depend on fixed pairs.
+        All ratio rows are kept, as users with only fixed pairs still bound the min.
+        completeness. The pairs must include all pairs of their devices, so that the
+        capacity of the fixed devices needs no rows.
+        """
+        is_fixed = np.ones(self.num_pairs, dtype=bool)
+        is_fixed[pairs] = False
+        fixed_x = np.where(is_fixed, x, 0.0)
+        is_covered = self.coverage_pairs.dot(fixed_x) > 0.5
+        depends_on_pairs = self.coverage_pairs.dot((~is_fixed).astype(np.float64)) > 0
+        coverages = np.flatnonzero(depends_on_pairs & ~is_covered)
+        part = self.subproblem(pairs, coverages, np.arange(len(self.ratio_users)))
+        part.ratio_offset = self.ratio_offset \
+            + self.user_ratios.dot(is_covered.astype(np.float64))
+        return part
+
+    def pairs_in(self, assignment):
+        """Whether each pair is part of an assignment of (element name, device name) tuples.
+
+        Elements and devices which are not part of the problem are ignored.
+        """
+        element_index = dict((name, e) for e, name in enumerate(self.element_names))
+        device_index = dict((name, d) for d, name in enumerate(self.device_names))
+        num_devices = len(self.device_names)
+        keys = [element_index[e] * num_devices + device_index[d] for e, d in assignment
+                if e in element_index and d in device_index]
+        return np.isin(self.pair_element * num_devices + self.pair_device, keys)
+
+    def order_symmetric(self, x, s):
+        """Permute an assignment among interchangeable devices and elements.
+
+        The result satisfies the symmetry breaking rows and has the same objective value.
+        """
+        x, s = x.copy(), s.copy()
+        for order_pairs, owners, key in [(self.device_order_pairs, self.pair_device, s),
+                                         (self.element_order_pairs, self.pair_element, x)]:
+            for chain in _order_chains(order_pairs, owners):
+                # Owners in a chain have pairs with the same other ends in the same order
+                owner_pairs = [np.flatnonzero(owners == owner) for owner in chain]
+                totals = [key[pairs].sum() for pairs in owner_pairs]
+                order = sorted(range(len(chain)), key=lambda i: -totals[i])
+                x_values = [x[owner_pairs[i]] for i in order]
+                s_values = [s[owner_pairs[i]] for i in order]
+                for pairs, x_value, s_value in zip(owner_pairs, x_values, s_values):
+                    x[pairs] = x_value
+                    s[pairs] = s_value
+        return x, s
+
+    def completeness(self, x):
+        """Best user_has_element and min_ratio_unique_elements for an assignment x."""
+        user_has_element = np.minimum(self.coverage_pairs.dot(x), 1.0)
+        ratios = self.user_ratios.dot(user_has_element) + self.ratio_offset
+        min_ratio = ratios.min() if len(ratios) > 0 else 1.0
+        return user_has_element, min_ratio
+
+    def objective(self, x, s):
+        """Weighted objective value of an assignment, as maximized by all backends."""
+        user_has_element, min_ratio = self.completeness(x)
+        quality_term = np.dot(self.pair_quality, s)
+        completeness_term = np.dot(self.coverage_weight, user_has_element) + min_ratio
+        return self.quality_weight * quality_term + self.completeness_weight * completeness_term
+
+
+def formulate(arrays, element_device_imp, element_device_comp, user_device_access,
+              user_element_access):
+    """Create the AssignmentProblem of a room given as ProblemArrays and its matrices."""
+    # Users with identical access are indistinguishable in the model, so only the first
+    # user of each class is formulated and weighted by the size of the class
+    user_class, class_users = user_classes(user_device_access, user_element_access)
+    class_size = np.bincount(user_class, minlength=len(class_users))
+    user_device_access = user_device_access[class_users, :]
+    user_element_access = user_element_access[class_users, :]
+
+    # Only materialise variables for element-device pairs which can be assigned
+    pair_element, pair_device = admissible_pairs(arrays, element_device_imp,
+                                                 element_device_comp, user_device_access,
+                                                 user_element_access)
+    num_pairs = len(pair_element)
+
+    element_min_area = arrays.element_min_area
+    element_max_area = arrays.element_max_area
+    device_area = arrays.device_area
+
+    # (9) Ensure s within possible min/max
+    pair_min_area = element_min_area[pair_element]
+    pair_max_area = np.minimum(element_max_area[pair_element], device_area[pair_device])
+
+    # (3)
+    # Maximize summed area of elements weighted by importance
+    # Also maximize compatibility in assignment
+    pair_quality = (element_device_comp * element_device_imp / device_area)[pair_element,
+                                                                             pair_device]
+
+    # Elements Diversity
+    # Each row k corresponds to a user u with access to element e.
+    coverage_user, coverage_element = np.nonzero(user_element_access)
+    user_num_elements = np.sum(user_element_access, axis=1)
+    user_has_devices = np.any(user_device_access, axis=1)
+
+    # Elements which cannot be assigned to any of the user's devices can never be made
+    # available to the user, so only keep rows with at least one admissible pair.
+    # Candidates are the pairs of the element of each row, without a dense row per device.
+    element_pairs = sp.csr_matrix(
+        (np.ones(num_pairs), (pair_element, np.arange(num_pairs))),
+        shape=(arrays.num_elements, num_pairs))
+    candidates = element_pairs[coverage_element, :].tocoo()
+    on_user_device = user_device_access[coverage_user[candidates.row],
+                                        pair_device[candidates.col]]
+    coverage_rows = candidates.row[on_user_device]
+    coverage_columns = candidates.col[on_user_device]
+    coverable = np.zeros(len(coverage_user), dtype=bool)
+    coverable[coverage_rows] = True
+    coverage_user = coverage_user[coverable]
+    coverage_element = coverage_element[coverable]
+    num_coverages = len(coverage_user)
+
+    # (6) the element has to be assigned to at least one of the user's devices
+    coverage_pairs = sp.csr_matrix(
+        (np.ones(len(coverage_rows)), (np.cumsum(coverable)[coverage_rows] - 1,
+                                       coverage_columns)),
+        shape=(num_coverages, num_pairs))
+
+    # (8) Term for trying to assign all available elements
+    coverage_weight = np.where(user_has_devices[coverage_user],
+                               class_size[coverage_user]
+                               / (user_num_elements[coverage_user] * float(arrays.num_users)), 0.0)
+
+    # (7) completeness ratio for all users with elements to see
+    ratio_users = np.flatnonzero(user_num_elements > 0)
+    ratio_rows = np.searchsorted(ratio_users, coverage_user)
+    user_ratios = sp.csr_matrix(
+        (1.0 / user_num_elements[coverage_user], (ratio_rows, np.arange(num_coverages))),
+        shape=(len(ratio_users), num_coverages))
+
+    problem = AssignmentProblem(
+        element_names=arrays.element_names,
+        device_names=arrays.device_names,
+        user_names=[arrays.user_names[u] for u in class_users],
+        pair_element=pair_element,
+        pair_device=pair_device,
+        pair_min_area=pair_min_area,
+        pair_max_area=pair_max_area,
+        pair_quality=pair_quality,
+        device_area=device_area,
+        coverage_user=coverage_user,
+        coverage_element=coverage_element,
+        coverage_pairs=coverage_pairs,
+        coverage_weight=coverage_weight,
+        ratio_users=ratio_users,
+        user_ratios=user_ratios,
+        user_num_elements=user_num_elements,
+        user_class=user_class,
+    )
+    if break_symmetries:
+        problem.device_order_pairs, problem.element_order_pairs \
+            = symmetry_breaking_rows(problem)
+    return problem
+
+
+def symmetry_breaking_rows(problem):
+    """Constraints ordering interchangeable devices and elements.
+
+    Devices are interchangeable if they have the same area and admissible pairs with the
+    same areas, quality and coverage rows, e.g. identical laptops of the same users.
+    Elements are interchangeable if their pairs and coverage rows match in the same way.
+    Any assignment can be permuted among interchangeable devices and elements without
+    changing its objective. Branch-and-bound would otherwise explore all permutations.
+
+    Interchangeable devices are ordered by the area they assign, and elements by the
+    number of devices they are assigned to. Permuting elements leaves the assigned area
+    of devices unchanged, so an optimal assignment satisfying both orders always exists.
+
+    Output:
+        (sparse matrix of rows over s, sparse matrix of rows over x), each row r is to
+        satisfy row r * s >= 0 and row r * x >= 0 respectively
+    """
+    coverage_by_pair = problem.coverage_pairs.tocsc()
+    coverage_by_pair.sort_indices()
+    coverage_by_row = problem.coverage_pairs.tocsr()
+    coverage_by_row.sort_indices()
+
+    def pair_signature(pairs, other_index):
+        return (other_index[pairs].tobytes(), problem.pair_min_area[pairs].tobytes(),
+                problem.pair_max_area[pairs].tobytes(), problem.pair_quality[pairs].tobytes())
+
+    def entries(matrix, index, rows):
+        """Entries of rows of a sparse matrix, mapped through an index."""
+        return tuple(index[matrix.indices[matrix.indptr[k]:matrix.indptr[k + 1]]].tobytes()
+                     for k in rows)
+
+    # Devices, with their pairs ordered by element and the users covered by each pair
+    device_pairs = _indices_by_label(problem.pair_device, len(problem.device_names))
+
+    def device_signature(d):
+        pairs = device_pairs[d]
+        return (problem.device_area[d], pair_signature(pairs, problem.pair_element),
+                entries(coverage_by_pair, problem.coverage_user, pairs))
+
+    # Elements, with their pairs ordered by device and their coverage rows by user, with
+    # the devices of each row
+    element_pairs = _indices_by_label(problem.pair_element, len(problem.element_names))
+    element_coverages = _indices_by_label(problem.coverage_element, len(problem.element_names))
+
+    def element_signature(e):
+        rows = element_coverages[e]
+        return (pair_signature(element_pairs[e], problem.pair_device),
+                problem.coverage_user[rows].tobytes(), problem.coverage_weight[rows].tobytes(),
+                entries(coverage_by_row, problem.pair_device, rows))
+
+    return _ordering_rows(device_pairs, device_signature, problem.num_pairs), \
+        _ordering_rows(element_pairs, element_signature, problem.num_pairs)
+
+
+def _order_chains(order_pairs, owners):
+    """Owners of pairs in the order given by the rows of `_ordering_rows`."""
+    chains = []
+    order_pairs = order_pairs.tocsr()
+    for row in range(order_pairs.shape[0]):
+        entries = order_pairs.indices[order_pairs.indptr[row]:order_pairs.indptr[row + 1]]
+        values = order_pairs.data[order_pairs.indptr[row]:order_pairs.indptr[row + 1]]
+        first, second = owners[entries[values > 0][0]], owners[entries[values < 0][0]]
+        if len(chains) > 0 and chains[-1][-1] == first:
+            chains[-1].append(second)
+        else:
+            chains.append([first, second])
+    return chains
+
+
+def _indices_by_label(labels, num_labels):
+    """Indices with each label, in increasing order."""
+    order = np.argsort(labels, kind='mergesort')
+    bounds = np.searchsorted(labels[order], np.arange(num_labels + 1))
+    return [order[bounds[i]:bounds[i + 1]] for i in range(num_labels)]
+
+
+def _ordering_rows(owner_pairs, signature, num_pairs):
+    """Rows ordering owners of pairs with equal signatures by the sum over their pairs.
+
+    Each row compares an owner with the next owner with the same signature.
+    """
+    groups = {}
+    for owner, pairs in enumerate(owner_pairs):
+        if len(pairs) > 0:
+            groups.setdefault(signature(owner), []).append(owner)
+
+    rows, columns, values = [], [], []
+    for group in sorted(groups.values()):
+        for first, second in zip(group[:-1], group[1:]):
+            row = len(rows) // 2
+            for owner, value in [(first, 1.0), (second, -1.0)]:
+                rows.append(np.repeat(row, len(owner_pairs[owner])))
+                columns.append(owner_pairs[owner])
+                values.append(np.repeat(value, len(owner_pairs[owner])))
+    if len(rows) == 0:
+        return sp.csr_matrix((0, num_pairs))
+    return sp.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(columns))),
+                         shape=(len(rows) // 2, num_pairs))
+
+
+def user_classes(user_device_access, user_element_access):
+    """Group users with the same access to devices and elements.
+
+    Classes are numbered in order of their first user, so users without equals keep
+    their order.
+
+    Output:
+        (array of class index of each user, array of first user of each class)
+    """
+    num_users = user_device_access.shape[0]
+    access = np.hstack([user_device_access, user_element_access])
+    if access.shape[1] == 0:
+        return np.zeros(num_users, dtype=np.int64), np.arange(min(num_users, 1))
+    _, first_users, classes = np.unique(np.packbits(access, axis=1), axis=0,
+                                        return_index=True, return_inverse=True)
+    order = np.argsort(first_users)
+    class_rank = np.empty(len(order), dtype=np.int64)
+    class_rank[order] = np.arange(len(order))
+    return class_rank[classes.ravel()], first_users[order]
+
+
+def admissible_pairs(arrays, element_device_imp, element_device_comp, user_device_access,
+                     user_element_access):
+    """Find the element-device pairs which may be part of an assignment.
+
+    All other pairs are fixed to be unassigned, so no variables need to be created for them.
+
+    Output:
+        (array of element indices, array of device indices)
+    """
+    element_min_width = arrays.element_min_width
+    element_min_height = arrays.element_min_height
+    device_width = arrays.device_width
+    device_height = arrays.device_height
+
+    # (11) the min. width/height of an element should not exceed device width/height
+    fits_device = (element_min_width[:, np.newaxis] <= device_width) \
+        & (element_min_height[:, np.newaxis] <= device_height)
+
+    # Make sure element privacy is respected.
+    # All users must have access to a device as well as assigned elements.
+    # That is, if there is even one user who is not authorised to view an element, the element
+    # should not be assigned to the device.
+    # (12) user has no access to element so don't assign to user's device
+    element_device_access = np.dot(user_element_access.T.astype(np.float64),
+                                   user_device_access.astype(np.float64)) > 0
+
+    # (14) Do not assign 0-importance or 0-compatibility elements
+    admissible = fits_device & element_device_access \
+        & (element_device_imp >= 1e-5) & (element_device_comp >= 1e-5)
+
+    # (13) a device which is not accessible by any user should not have a element. This holds
+    # as no user has access to any element on such a device.
+    return np.nonzero(admissible)
@@ -0,0 +1,313 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Greedy assignment with local search for when an exact solve takes too long.
+
+Only pairs of an AssignmentProblem are considered, so size, privacy and importance
+constraints hold by construction. Capacity is respected by only assigning an element if
+the minimum areas of all elements on the device still fit.
+"""
+import numpy as np
+
+_eps = 1e-9
+
+
+def greedy_assignment(problem, max_passes=2, start=None):
+    """Find a good assignment for an AssignmentProblem.
+
+    Elements are assigned greedily by their gain in objective value. Elements missing for
+    the user with min. completeness are then added while worthwhile, followed by a local
+    search which swaps out the least valuable element of each device.
+
+    If `start` is given, the search begins with these pairs, e.g. of a previous
+    assignment, as far as they fit.
+
+    Output:
+        (x, s) arrays of pair assignments and areas
+    """
+    search = _Search(problem)
+    if start is not None:
+        search.seed(start)
+    search.construct()
+    search.raise_min_ratio()
+    search.improve(max_passes)
+    return search.x.astype(np.float64), search.s
+
+
+def fill_areas(problem, x):
+    """Best areas for the pairs assigned in x, which must fit on their devices."""
+    search = _Search(problem)
+    s = np.zeros(problem.num_pairs)
+    assigned = np.flatnonzero(x > 0.5)
+    for d in np.unique(problem.pair_device[assigned]):
+        sizes, _ = search.fill(d, assigned[problem.pair_device[assigned] == d])
+        for p, size in sizes.items():
+            s[p] = size
+    return s
+
+
+class _Search(object):
+    """Assignment state with incremental evaluation of the objective."""
+
+    def __init__(self, problem):
+        self.problem = problem
+        num_pairs = problem.num_pairs
+        num_devices = len(problem.device_names)
+
+        self.x = np.zeros(num_pairs, dtype=bool)
+        self.s = np.zeros(num_pairs)
+        self.blocked = np.zeros(num_pairs, dtype=bool)
+
+        self.assigned = [[] for _ in range(num_devices)]
+        self.min_area_used = np.zeros(num_devices)
+        self.free_area = problem.device_area.copy()
+        self.device_quality = np.zeros(num_devices)
+        # Lowest quality of an element on the device which can give up area
+        self.low_quality = np.zeros(num_devices)
+
+        # Coverage rows and ratio rows affected by each pair. The coverage rows of a pair
+        # belong to distinct users, so a pair changes each ratio row at most once.
+        self.pair_coverages = problem.coverage_pairs.T.tocsr()
+        user_ratios = problem.user_ratios.tocsc()
+        self.coverage_ratio_row = np.zeros(problem.num_coverages, dtype=np.int64)
+        self.coverage_ratio_value = np.zeros(problem.num_coverages)
+        columns = np.repeat(np.arange(problem.num_coverages), np.diff(user_ratios.indptr))
+        self.coverage_ratio_row[columns] = user_ratios.indices
+        self.coverage_ratio_value[columns] = user_ratios.data
+
+        self.cover_count = np.zeros(problem.num_coverages, dtype=np.int64)
+        self.ratio_value = problem.ratio_offset.copy()
+        self.update_min_ratio()
+
+    def rows(self, p):
+        indptr = self.pair_coverages.indptr
+        return self.pair_coverages.indices[indptr[p]:indptr[p + 1]]
+
+    def update_min_ratio(self):
+        if len(self.ratio_value) > 0:
+            self.min_ratio = self.ratio_value.min()
+            self.num_at_min = np.count_nonzero(self.ratio_value <= self.min_ratio + _eps)
+        else:
+            self.min_ratio, self.num_at_min = 1.0, 0
+
+    def min_ratio_delta(self, ratio_rows, ratio_change):
+        """Change in min. completeness when adding ratio_change to unique ratio_rows."""
+        if len(ratio_rows) == 0:
+            return 0.0
+        new_values = self.ratio_value[ratio_rows] + ratio_change
+        if ratio_change[0] < 0:
+            return min(new_values.min() - self.min_ratio, 0.0)
+        # Completeness only increases, so the min. stays unless all users at the min. gain
+        if np.count_nonzero(self.ratio_value[ratio_rows] <= self.min_ratio + _eps) \
+                < self.num_at_min:
+            return 0.0
+        ratio_value = self.ratio_value.copy()
+        ratio_value[ratio_rows] = new_values
+        return ratio_value.min() - self.min_ratio
+
+    def fits(self, p):
+        d = self.problem.pair_device[p]
+        return self.min_area_used[d] + self.problem.pair_min_area[p] \
+            <= self.problem.device_area[d]
+
+    def fill(self, d, pairs):
+        """Optimal areas for a fixed set of elements on a device and its quality."""
+        problem = self.problem
+        capacity = problem.device_area[d] - sum(problem.pair_min_area[p] for p in pairs)
+        sizes = {}
+        quality = 0.0
+        for p in sorted(pairs, key=lambda p: -problem.pair_quality[p]):
+            extra = min(problem.pair_max_area[p] - problem.pair_min_area[p], capacity)
+            sizes[p] = problem.pair_min_area[p] + extra
+            capacity -= extra
+            quality += problem.pair_quality[p] * sizes[p]
+        return sizes, quality
+
+    def quality_delta(self, p, add):
+        d = self.problem.pair_device[p]
+        if add:
+            pairs = self.assigned[d] + [p]
+        else:
+            pairs = [q for q in self.assigned[d] if q != p]
+        return self.fill(d, pairs)[1] - self.device_quality[d]
+
+    def delta(self, p, add):
+        """Change in objective value when adding or removing pair p."""
+        problem = self.problem
+        rows = self.rows(p)
+        changed = rows[self.cover_count[rows] == (0 if add else 1)]
+        sign = 1.0 if add else -1.0
+        completeness = sign * problem.coverage_weight[changed].sum() \
+            + self.min_ratio_delta(self.coverage_ratio_row[changed],
+                                   sign * self.coverage_ratio_value[changed])
+        return problem.quality_weight * self.quality_delta(p, add) \
+            + problem.completeness_weight * completeness
+
+    def apply(self, p, add):
+        problem = self.problem
+        d = problem.pair_device[p]
+        rows = self.rows(p)
+        if add:
+            changed = rows[self.cover_count[rows] == 0]
+            self.assigned[d].append(p)
+            self.min_area_used[d] += problem.pair_min_area[p]
+            self.cover_count[rows] += 1
+        else:
+            changed = rows[self.cover_count[rows] == 1]
+            self.assigned[d].remove(p)
+            self.min_area_used[d] -= problem.pair_min_area[p]
+            self.cover_count[rows] -= 1
+        self.ratio_value[self.coverage_ratio_row[changed]] += \
+            (1.0 if add else -1.0) * self.coverage_ratio_value[changed]
+        self.update_min_ratio()
+        self.x[p] = add
+
+        sizes, self.device_quality[d] = self.fill(d, self.assigned[d])
+        self.s[p] = 0.0
+        for q, size in sizes.items():
+            self.s[q] = size
+        self.free_area[d] = problem.device_area[d] - sum(sizes.values())
+        self.low_quality[d] = min([problem.pair_quality[q] for q, size in sizes.items()
+                                   if size > problem.pair_min_area[q]] or [0.0])
+
+    def coverage_delta(self, p):
+        rows = self.rows(p)
+        return self.problem.coverage_weight[rows[self.cover_count[rows] == 0]].sum()
+
+    def coverage_gains(self, pair_coverages, start, stop):
+        """Summed weight of uncovered rows for rows start:stop of a pair-coverage matrix."""
+        indptr = pair_coverages.indptr[start:stop + 1]
+        rows = pair_coverages.indices[indptr[0]:indptr[-1]]
+        uncovered = self.problem.coverage_weight[rows] * (self.cover_count[rows] == 0)
+        cumulative = np.concatenate([[0.0], np.cumsum(uncovered)])
+        return cumulative[indptr[1:] - indptr[0]] - cumulative[indptr[:-1] - indptr[0]]
+
+    def estimated_gains(self, pairs, coverage_gain):
+        """Gain of adding pairs, leaving out the min. completeness term.
+
+        Area missing for the min. size of an element is assumed to be taken from the
+        element with lowest quality on the device. Pairs which cannot be added get -inf.
+        """
+        problem = self.problem
+        d = problem.pair_device[pairs]
+        min_area = problem.pair_min_area[pairs]
+        size = np.maximum(np.minimum(problem.pair_max_area[pairs], self.free_area[d]), min_area)
+        displaced = np.maximum(min_area - self.free_area[d], 0.0)
+        quality_gain = problem.pair_quality[pairs] * size - displaced * self.low_quality[d]
+        gain = problem.quality_weight * quality_gain \
+            + problem.completeness_weight * coverage_gain
+
+        candidates = ~self.x[pairs] & ~self.blocked[pairs] \
+            & (self.min_area_used[d] + min_area <= problem.device_area[d])
+        gain[~candidates] = -np.inf
+        return gain
+
+    def seed(self, start):
+        """Add the pairs of an assignment by decreasing quality while they fit."""
+        pairs = np.flatnonzero(start)
+        for p in pairs[np.argsort(-self.problem.pair_quality[pairs], kind='mergesort')]:
+            if self.fits(p):
+                self.apply(p, add=True)
+
+    def construct(self):
+        """Add pairs by largest estimated gain in rounds.
+
+        Each round adds at most one pair per device, after checking its exact gain.
+        """
+        problem = self.problem
+        all_pairs = np.arange(problem.num_pairs)
+        while True:
+            coverage_gain = self.pair_coverages.dot(
+                problem.coverage_weight * (self.cover_count == 0))
+            gain = self.estimated_gains(all_pairs, coverage_gain)
+            chosen = np.flatnonzero(gain > _eps)
+            if len(chosen) == 0:
+                break
+            chosen = chosen[np.lexsort((-gain[chosen], problem.pair_device[chosen]))]
+            _, first = np.unique(problem.pair_device[chosen], return_index=True)
+            chosen = chosen[first]
+            for p in chosen[np.argsort(-gain[chosen])]:
+                exact_gain = problem.quality_weight * self.quality_delta(p, add=True) \
+                    + problem.completeness_weight * self.coverage_delta(p)
+                if exact_gain > _eps:
+                    self.apply(p, add=True)
+                else:
+                    self.blocked[p] = True
+
+    def raise_min_ratio(self, num_candidates=5):
+        """Add elements missing for the users with min. completeness while worthwhile.
+
+        Only the additions with largest estimated gain are evaluated exactly.
+        """
+        problem = self.problem
+        if len(self.ratio_value) == 0:
+            return
+        while self.min_ratio < 1.0 - _eps:
+            missing = (self.ratio_value[self.coverage_ratio_row] <= self.min_ratio + _eps) \
+                & (self.cover_count == 0)
+            pairs = np.flatnonzero(self.pair_coverages.dot(missing) > 0)
+            coverage_gain = self.pair_coverages.dot(
+                problem.coverage_weight * (self.cover_count == 0))
+            gain = self.estimated_gains(pairs, coverage_gain[pairs])
+            best = np.argsort(-gain)[:num_candidates]
+            candidates = pairs[best[gain[best] > -np.inf]]
+            gains = [self.delta(p, add=True) for p in candidates]
+            if len(gains) == 0 or max(gains) <= _eps:
+                break
+            self.apply(candidates[int(np.argmax(gains))], add=True)
+
+    def improve(self, max_passes, num_candidates=3):
+        """Swap out the least valuable element of each device while the objective improves.
+
+        Only the replacements with largest estimated gain are evaluated exactly. Space
+        freed up by a pass is then filled greedily again.
+        """
+        # Order pairs by device, so the coverage rows of a device are a contiguous block
+        problem = self.problem
+        order = np.argsort(problem.pair_device, kind='mergesort')
+        device_coverages = self.pair_coverages[order]
+        bounds = np.searchsorted(problem.pair_device[order], np.arange(len(self.assigned) + 1))
+        for _ in range(max_passes):
+            improved = False
+            for d in range(len(self.assigned)):
+                if len(self.assigned[d]) == 0:
+                    continue
+                removal_deltas = [self.delta(p, add=False) for p in self.assigned[d]]
+                worst = int(np.argmax(removal_deltas))
+                p, removal_delta = self.assigned[d][worst], removal_deltas[worst]
+                self.apply(p, add=False)
+                self.blocked[p] = True
+
+                pairs = order[bounds[d]:bounds[d + 1]]
+                gain = self.estimated_gains(
+                    pairs, self.coverage_gains(device_coverages, bounds[d], bounds[d + 1]))
+                best = np.argsort(-gain)[:num_candidates]
+                candidates = pairs[best[gain[best] > -np.inf]]
+                gains = [self.delta(q, add=True) for q in candidates]
+                if len(gains) > 0 and removal_delta + max(gains) > _eps:
+                    self.apply(candidates[int(np.argmax(gains))], add=True)
+                    improved = True
+                elif removal_delta > _eps:
+                    improved = True
+                else:
+                    self.apply(p, add=True)
+            if not improved:
+                break
+            self.blocked[:] = False
+            self.construct()
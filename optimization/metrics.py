@@ -0,0 +1,77 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Latencies of the requests handled by the server.
+
+The first request of a process is slower than the following ones if the solver was not
+warmed up, see `optimize.warm_up`, so it is reported apart from the steady state of all
+later requests.
+"""
+from collections import deque
+import threading
+
+import numpy as np
+
+
+class LatencyStats(object):
+    """Latency of the first request and of the most recent requests after it.
+
+    Input:
+        window (int): number of recent requests over which percentiles are taken
+    """
+
+    def __init__(self, window=1000):
+        self.first = None
+        self.count = 0
+        self.warm_up = None
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        """Record the latency of a request in seconds."""
+        with self._lock:
+            if self.first is None:
+                self.first = seconds
+            else:
+                self._recent.append(seconds)
+            self.count += 1
+
+    def summary(self):
+        """Dict of the warm-up time, first latency, and percentiles of later latencies."""
+        with self._lock:
+            recent = list(self._recent)
+            out = {'count': self.count, 'warm_up': self.warm_up, 'first': self.first,
+                   'steady': None}
+        if len(recent) > 0:
+            out['steady'] = dict(('p%d' % q, float(np.percentile(recent, q)))
+                                 for q in [50, 90, 99])
+            out['steady']['max'] = max(recent)
+        return out
+
+    def __str__(self):
+        summary = self.summary()
+        text = 'first %s' % ('%.3fs' % summary['first'] if summary['first'] is not None
+                              else '-')
+        if summary['steady'] is not None:
+            text += ', steady p50 %.3fs p90 %.3fs p99 %.3fs over %d requests' % (
+                summary['steady']['p50'], summary['steady']['p90'], summary['steady']['p99'],
+                summary['count'] - 1)
+        if summary['warm_up'] is not None:
+            text += ', warm-up %.3fs' % summary['warm_up']
+        return text
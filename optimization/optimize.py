@@ -17,20 +17,198 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
+import hashlib
+import json
+import logging
+import time
+import traceback
+
+from cache import canonical_key, changes, object_keys
+from device import Device
+from element import Element
+from properties import Properties
+from user import User
+import codec
 import converters
 import optimize_device_assignment
 
+logger = logging.getLogger('SoManyScreens_backend')
+
+
+def handle_web_input(web_input, backend='gurobi', time_limit=None, mip_gap=None, cache=None,
+                     processes=None, full_stats=False, sessions=None, local_repair=False,
+                     diff=False, compact=False, threads=None, scheduler=None,
+                     progressive=False, progress=None, progress_interval=0.1):
+    """Optimize a room sent by the frontend and return the assignment as JSON.
 
-def handle_web_input(web_input):
-    elements, devices, users, token = converters.json_to_our_inputs(web_input)
+    `web_input` is a JSON request, or a parsed one, see `converters.json_to_our_inputs`.
+
+    If a `cache.LRUCache` is given, rooms which were optimized before are answered from it.
+    If `sessions` is given, a `cache.LRUCache` of the last assignment of each token, the
+    solve starts from the last assignment of the request's token. With `local_repair`, only
+    devices affected by the changes since the last request of the token are re-solved, see
+    `repair`.
+    With `diff` and `sessions`, the reply only holds the devices whose elements changed since
+    the last reply to the token, see `_reply`, unless the request asks for a full reply with
+    the 'resync' option. With `compact`, the JSON of the reply is not indented.
+    With `progressive` or the 'progressive' option and a `progress` function, assignments
+    which improve on all before are passed to `progress` as full JSON replies while
+    solving, the first at once and later ones only if `progress_interval` seconds have
+    passed since the last. These replies and the final reply are tagged with a 'progress'
+    object of the 'sequence' number of the reply to the request, the 'gap' of the
+    assignment if known, whether it is the 'final' reply and, if so, whether it is
+    'optimal'.
+    The reply holds the solver status, gap and fallback, or with `full_stats` all statistics
+    of `optimize_device_assignment.optimize` except the list of pairs. Statistics of cached
+    assignments are those of their original solve and marked as cached. See
+    `optimize_device_assignment.optimize` for the other arguments.
+    """
+    elements, devices, users, token, options = converters.json_to_our_inputs(web_input)
     users = [user for user in users if user.name != 'anonymous']  # TODO: remove this hack
-    our_output = optimize(elements, devices, users)
-    return converters.our_output_to_json(our_output, token=token)
+
+    # Solver settings of the request override the defaults given here
+    time_limit = options.get('time_limit', time_limit)
+    mip_gap = options.get('mip_gap', mip_gap)
+    full_stats = options.get('stats', full_stats)
+    local_repair = options.get('local_repair', local_repair)
+    diff = options.get('diff', diff)
+    compact = options.get('compact', compact)
+    progressive = options.get('progressive', progressive) and progress is not None
+    keys = object_keys(elements, devices, users) if sessions is not None else None
+    session = sessions.get(token) if sessions is not None else None
+
+    def reply(our_output, stats):
+        final_progress = None
+        if progressive:
+            final_progress = {'sequence': sequence[0] + 1, 'gap': stats['gap'], 'final': True,
+                              'optimal': stats['status'] == 'optimal'}
+        if not full_stats:
+            stats = dict((key, stats[key]) for key in ['status', 'gap', 'fallback'])
+        assignment = dict((device.name, [element.name for element in assigned])
+                          for device, assigned in our_output.items())
+        if sessions is not None:
+            sessions.put(token, (assignment, keys))
+        last_assignment = session[0] if session is not None and not options.get('resync') \
+            else None
+        return _reply(our_output, assignment, last_assignment if diff else None, token, stats,
+                      with_version=diff, progress=final_progress, compact=compact)
+
+    # Pass improved assignments on while solving, skipping those which follow too soon
+    sequence = [0]
+    last_progress_time = [None]
+    incumbent = None
+    if progressive:
+        def incumbent(our_output, gap):
+            now = time.time()
+            if last_progress_time[0] is not None \
+                    and now - last_progress_time[0] < progress_interval:
+                return
+            last_progress_time[0] = now
+            sequence[0] += 1
+            # Failing to send must not stop the solve
+            try:
+                progress(converters.our_output_to_json(
+                    our_output, token=token, compact=compact,
+                    progress={'sequence': sequence[0], 'gap': gap, 'final': False}))
+            except:
+                logger.debug('\n%s\n' % traceback.format_exc())
+
+    if cache is not None:
+        key = canonical_key(elements, devices, users, backend, time_limit, mip_gap)
+        cached = cache.get(key)
+        if cached is not None:
+            assignment, sizes, stats = cached
+            if full_stats:
+                stats = dict(stats, cached=True)
+            elements_by_name = dict((element.name, element) for element in elements)
+            our_output = dict((device, [elements_by_name[name]
+                                        for name in assignment.get(device.name, [])])
+                              for device in devices)
+            # Areas of the elements as set by `optimize_device_assignment.optimize`
+            for element in elements:
+                element._optimizer_size = {}
+            for device, assigned in our_output.items():
+                for element, size in zip(assigned, sizes[device.name]):
+                    element._optimizer_size[device.name] = size
+            return reply(our_output, stats)
+
+    previous, room_changes = None, None
+    if session is not None:
+        last_assignment, previous_keys = session
+        previous = [(name, device_name) for device_name, names in last_assignment.items()
+                    for name in names]
+        if local_repair:
+            room_changes = changes(previous_keys, keys)
+    our_output, stats = optimize_device_assignment.optimize(
+        elements, devices, users, backend=backend, time_limit=time_limit, mip_gap=mip_gap,
+        processes=processes, previous=previous, changes=room_changes, threads=threads,
+        scheduler=scheduler, incumbent=incumbent)
+    del stats['pairs']
+
+    # Assignments of stopped solves may improve with another try, and those of local
+    # repairs depend on the previous assignment, so neither are cached
+    if cache is not None and stats['status'] in ['optimal', 'heuristic'] \
+            and stats['fallback'] is None and stats['num_free_devices'] == len(devices):
+        assignment = dict((device.name, [element.name for element in assigned])
+                          for device, assigned in our_output.items())
+        sizes = dict((device.name, [element._optimizer_size[device.name]
+                                    for element in assigned])
+                     for device, assigned in our_output.items())
+        cache.put(key, (assignment, sizes, stats))
+    return reply(our_output, stats)
+
+
+def warm_up(backend='gurobi', threads=None):
+    """Handle a request for a tiny room and return the seconds taken.
+
+    The first request of a process otherwise pays for creating the solver environment,
+    e.g. checking the Gurobi licence, and for first calls into NumPy, SciPy and the
+    solver, which take much longer than solving a small room.
+    """
+    start_time = time.time()
+    user = User(name='warm-up', id='warm-up')
+    device = Device('warm-up', 100, 100, Properties(5, 0, 0, 0), [user])
+    element = Element('warm-up', 1, 10, 100, 10, 100, Properties(5, 0, 0, 0))
+    handle_web_input(codec.encode_request([element], [device], [user], token='warm-up'),
+                     backend=backend, processes=1, threads=threads)
+    return time.time() - start_time
+
+
+def _reply(our_output, assignment, last_assignment, token, stats, with_version, progress,
+           compact):
+    """JSON reply with all devices, or only those changed since the last assignment.
+
+    Versions are digests of the assignment rather than counters, so that they stay
+    consistent when requests of a token are solved by different workers. A client applies a
+    reply whose `base_version` is the version it holds and otherwise asks to resync.
+    """
+    version = _version(assignment) if with_version else None
+    if last_assignment is None:
+        return converters.our_output_to_json(our_output, token=token, stats=stats,
+                                             version=version, progress=progress,
+                                             compact=compact)
+    changed = dict((device, assigned) for device, assigned in our_output.items()
+                   if last_assignment.get(device.name) != assignment[device.name])
+    removed = sorted(set(last_assignment) - set(assignment))
+    return converters.our_output_to_json(changed, token=token, stats=stats, version=version,
+                                         base_version=_version(last_assignment),
+                                         removed_devices=removed, progress=progress,
+                                         compact=compact)
+
+
+def _version(assignment):
+    return hashlib.sha1(json.dumps(assignment, sort_keys=True).encode('utf-8')).hexdigest()[:16]
 
 '''
 
 Input:
     elements (list of Element)
+    devices (list of Device)
+    users (list of User)
+    backend (str): name of solver backend, see `solvers.BACKENDS`
+    time_limit (float): max. seconds to solve for, see
+                        `optimize_device_assignment.optimize`
+    mip_gap (float): relative MIP gap at which to stop solving
 
 Output:
     dict (device_class => list of {element: Element, widget: Widget})
@@ -40,6 +218,7 @@ Output:
         'watch': [{Element1, Widget}],
     }
 '''
-def optimize(elements, devices, users):
-    output, _ = optimize_device_assignment.optimize(elements, devices, users)
+def optimize(elements, devices, users, backend='gurobi', time_limit=None, mip_gap=None):
+    output, _ = optimize_device_assignment.optimize(elements, devices, users, backend=backend,
+                                                    time_limit=time_limit, mip_gap=mip_gap)
     return output
@@ -17,18 +17,62 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
+import logging
 import time
 
-from gurobipy import *
 import numpy as np
 
-def optimize(elements, devices, users):
+from formulation import formulate
+from problem_arrays import ProblemArrays
+import compatibility
+import decomposition
+import repair
+import solvers
+
+logger = logging.getLogger('SoManyScreens_backend.optimizer')
+
+_eps = 1e-9
+
+def optimize(elements, devices, users, backend='gurobi', time_limit=None, mip_gap=None,
+             processes=None, readable_names=False, previous=None, changes=None, threads=None,
+             scheduler=None, incumbent=None):
     """Perform assignment of elements to devices.
 
     Input:
         elements (list of Element)
         devices (list of Device)
         users (list of User)
+        backend (str): name of solver backend in `solvers.BACKENDS`
+        time_limit (float): stop solving after this many seconds and use the best
+                            assignment found so far. If none was found, fall back to
+                            the greedy heuristic. No limit if None.
+        mip_gap (float): stop solving once the relative MIP gap is below this value.
+                         Solver default if None.
+        processes (int): number of processes solving independent parts of the problem
+                         in parallel, see `decomposition`. Number of CPUs if None.
+        threads (int): max. number of solver threads, shared by the processes of
+                       `decomposition`. Solver default if None, which for Gurobi is all
+                       cores in each process.
+        scheduler (scheduler.Scheduler): hands out threads to concurrent solves by the
+                                         size of their models. Used by exact backends,
+                                         capped by `threads` if given.
+        incumbent (function): called with (dict Device => list of Element, gap) of each
+                              assignment found while solving which improves on all
+                              before, starting with that of the greedy heuristic for
+                              exact backends. gap is None if unknown.
+        readable_names (bool): name variables and constraints after elements and
+                               devices, e.g. for debugging with `model.write`.
+                               Skipped by default as naming is costly on large
+                               problems.
+        previous (list of (str, str)): (element name, device name) pairs of a previous
+                                       assignment of the room to start from, e.g. before
+                                       a device joined. Used as MIP start by exact
+                                       backends and as initial assignment by the greedy
+                                       heuristic.
+        changes (dict): names of devices, users and elements which were added, removed or
+                        changed since the `previous` assignment, see
+                        `repair.free_devices`. If given, only the affected devices are
+                        re-solved and all others keep their previous elements.
 
     Output:
         dict (Device => list of Element)
@@ -37,327 +81,299 @@ def optimize(elements, devices, users):
             Device2: [Element1, Element3],
             Device3: [Element1],
         }
+        dict of statistics
+        {
+            'backend': name of solver backend,
+            'status': solver status such as 'optimal' or 'time_limit',
+            'gap': relative MIP gap of the assignment if known,
+            'fallback': name of backend used if it improved on a stopped solve,
+            'objective': objective value of the assignment,
+            'coverages': dict of user name => ratio of the user's elements shown,
+            'min_coverage': lowest of the above,
+            'preprocess_time': time taken to compute importances etc. in seconds,
+            'build_time': time taken to construct the model in seconds,
+            'solve_time': time taken by the solver in seconds,
+            'extract_time': time taken to read the assignment from the solution in seconds,
+            'time_taken': sum of the above,
+            'num_variables': number of variables of the model,
+            'num_constraints': number of constraints of the model,
+            'num_nonzeros': number of nonzero coefficients in linear constraints,
+            'num_nodes': number of explored branch-and-bound nodes,
+            'num_pairs': number of admissible element-device pairs,
+            'num_user_classes': number of groups of users with the same access, which
+                                are formulated once, see `formulation.user_classes`,
+            'num_start_pairs': number of pairs of `previous` which are still admissible,
+            'num_free_devices': number of devices which were solved for, less than all
+                                devices if only those affected by `changes` were,
+            'threads': number of solver threads, None for the solver default,
+            'wait_time': time waited for threads of the `scheduler` in seconds,
+            'changed_devices': names of devices whose elements differ from `previous`,
+                               None without `previous`,
+            'pairs': list of admissible (element name, device name) pairs,
+        }
+        Model sizes and node counts are None if not reported by the backend.
     """
+    solver = solvers.get_backend(backend)
+
     elements.sort(key=lambda x: x.name)
     devices.sort(key=lambda x: x.name)
     users.sort(key=lambda x: x.name)
 
+    # Create output list of elements (sorted)
+    output = {}
+    for device in devices:
+        output[device] = []
+    # Sizes of earlier solves, e.g. on devices which were removed since, are dropped. The
+    # dicts are replaced rather than cleared, as elements may be shared with other requests.
+    for element in elements:
+        element._optimizer_size = {}
+    stats = {'backend': backend, 'status': None, 'gap': None, 'fallback': None,
+             'objective': None, 'coverages': {}, 'min_coverage': None,
+             'preprocess_time': 0.0, 'build_time': 0.0, 'solve_time': 0.0,
+             'extract_time': 0.0, 'time_taken': 0.0, 'num_variables': None,
+             'num_constraints': None, 'num_nonzeros': None, 'num_nodes': None,
+             'num_pairs': 0, 'num_user_classes': 0, 'num_start_pairs': 0,
+             'num_free_devices': 0, 'threads': None, 'wait_time': 0.0,
+             'changed_devices': None, 'pairs': []}
+
     # Is there sufficient information to solve the assignment problem?
     if len(users) == 0 or len(devices) == 0 or len(elements) == 0:
-        output = {}
-        for device in devices:
-            output[device] = []
-        return output, 0.0
+        return output, stats
 
     # Form input data
+    start_time = time.time()
+    arrays = ProblemArrays.from_objects(elements, devices, users)
     element_user_imp, element_device_imp, element_device_comp, user_device_access, \
-    user_element_access = pre_process_objects(elements, devices, users)
+    user_element_access = pre_process_arrays(arrays)
+    stats['preprocess_time'] = time.time() - start_time
 
     start_time = time.time()
+    problem = formulate(arrays, element_device_imp, element_device_comp,
+                        user_device_access, user_element_access)
+    stats['num_pairs'] = problem.num_pairs
+    stats['num_user_classes'] = len(problem.user_names)
+    stats['pairs'] = [(elements[e].name, devices[d].name)
+                      for e, d in zip(problem.pair_element, problem.pair_device)]
+    formulate_time = time.time() - start_time
+
+    # Pairs of the previous assignment which are still admissible
+    start = None
+    if previous is not None:
+        start_x = problem.pairs_in(previous).astype(np.float64)
+        start = (start_x, np.zeros(problem.num_pairs))
+        stats['num_start_pairs'] = int(start_x.sum())
+
+    # Only solve for devices affected by the changes, if given
+    free = np.ones(len(devices), dtype=bool)
+    if previous is not None and changes is not None:
+        free = repair.free_devices(problem, arrays.user_names, user_device_access,
+                                   previous, changes)
+    stats['num_free_devices'] = int(free.sum())
+
+    def solve(backend, incumbent=None):
+        if free.all():
+            return decomposition.solve(backend, problem, readable_names=readable_names,
+                                       time_limit=time_limit, mip_gap=mip_gap,
+                                       processes=processes, start=start, threads=threads,
+                                       incumbent=incumbent)
+        return repair.solve(backend, problem, free, start[0], readable_names=readable_names,
+                            time_limit=time_limit, mip_gap=mip_gap, processes=processes,
+                            start=start, threads=threads, incumbent=incumbent)
+
+    # Report assignments which improve on all reported before
+    report = None
+    if incumbent is not None:
+        best_objective = [None]
+
+        def report(x, s, gap):
+            objective = problem.objective(x, s)
+            if best_objective[0] is not None and objective <= best_objective[0] + _eps:
+                return
+            best_objective[0] = objective
+            assigned = dict((device, []) for device in devices)
+            for p in np.flatnonzero(x > 0.5):
+                assigned[devices[problem.pair_device[p]]].append(
+                    elements[problem.pair_element[p]])
+            incumbent(assigned, gap)
+
+    # Report the greedy assignment while an exact backend solves, and fall back to it later
+    fallback = None
+    if report is not None and solver.exact:
+        fallback = solve(solvers.GreedyBackend())
+        if fallback.has_assignment:
+            report(fallback.x, fallback.s, None)
+
+    # Take threads from the scheduler while solving
+    granted = None
+    if scheduler is not None and solver.exact:
+        start_time = time.time()
+        granted = scheduler.acquire(problem.num_pairs + problem.num_coverages)
+        stats['wait_time'] = time.time() - start_time
+        threads = granted if threads is None else min(threads, granted)
+    stats['threads'] = threads
 
-    # np.set_printoptions(precision=1)
-    # print('element_user_imp:\n%s' % element_user_imp)
-    # print('element_device_comp:\n%s' % element_device_comp)
-    # print('element_device_imp:\n%s' % element_device_imp)
-    # print('user_device_access:\n%s' % user_device_access)
-
-    # Create empty model
-    model = Model('device_assignment')
-    model.params.LogToConsole = 0  # Uncomment to see logs in console
-
-    # (2) Add decision variables
-    x = {}
-    s = {}
-    for e, element in enumerate(elements):
-        for d, device in enumerate(devices):
-            x[e, d] = model.addVar(vtype=GRB.BINARY,
-                                   name='x_%s_%s' % (element.name, device.name))
-            s[e, d] = model.addVar(vtype=GRB.SEMIINT,
-                                   name='s_%s_%s' % (element.name, device.name))
-    model.update()
-
-    for d, device in enumerate(devices):
-        # (10) sum of widget areas shouldn't exceed device capacity (area)
-        model.addConstr(quicksum(s[e, d] for e, _ in enumerate(elements)) <= device._area,
-                        'capacity_constraint_%s' % device.name)
-
-        for e, element in enumerate(elements):
-            # (11) the min. width/height of an element should not exceed device width/height
-            if element.min_width > device.width or element.min_height > device.height:
-                model.addConstr(x[e, d] == 0,
-                                'min_size_exceeds_constraint_%s_on_%s' % (element.name, device.name))
-
-            # (9) Set s to zero if x is zero
-            model.addGenConstrIndicator(x[e, d], False, s[e, d] == 0)
-
-            # (9) Ensure s within possible min/max
-            model.addGenConstrIndicator(x[e, d], True, s[e, d] >= element._min_area)
-            model.addGenConstrIndicator(x[e, d], True, s[e, d] <= min(element._max_area, device._area))
-
-    model.update()
-
-    # Make sure element privacy is respected.
-    # All users must have access to a device as well as assigned elements.
-    # That is, if there is even one user who is not authorised to view an element, the element
-    # should not be assigned to the device.
-    element_device_access = np.ones((len(elements), len(devices)), dtype=bool)
-    for d, device in enumerate(devices):
-        for e, element in enumerate(elements):
-            # (12) user has no access to element so don't assign to user's device
-            if not np.any(np.dot(user_device_access[:, d], user_element_access[:, e])):
-                element_device_access[e, d] = 0
-
-    model.update()
-
-    for d, device in enumerate(devices):
-        for e, element in enumerate(elements):
-            # Do not assign inaccessible elements
-            if element_device_access[e, d] == 0:
-                model.addConstr(x[e, d] == 0,
-                                name='privacy_%s_%s' % (element.name, device.name))
-
-            # (14) Do not assign 0-importance elements
-            elif element_device_imp[e, d] < 1e-5:
-                element_device_access[e, d] = 0
-                model.addConstr(x[e, d] == 0,
-                                name='zero_importance_%s_%s' % (element.name, device.name))
-
-            # (14) Do not assign 0-compatibility elements
-            elif element_device_comp[e, d] < 1e-5:
-                element_device_access[e, d] = 0
-                model.addConstr(x[e, d] == 0,
-                                name='zero_compatibility_%s_%s' % (element.name, device.name))
-    model.update()
-
-    for d, device in enumerate(devices):
-        if not np.any(element_device_access[:, d]):
-            # (13) a device which is not accessible by any user should not have a element
-            model.addConstr(quicksum(x[e, d] for e, _ in enumerate(elements)) == 0,
-                            'no_element_constraint_%s' % device.name)
-    model.update()
-
-    # Elements Diversity
-    user_num_elements = {}
-    user_has_element = {}
-    user_num_unique_elements = {}
-    user_num_replicated_elements = {}
-    for u, user in enumerate(users):
-        user_elements = [(e, element) for e, element in enumerate(elements) if user_element_access[u, e]]
-        user_devices = [(d, device) for d, device in enumerate(devices) if user_device_access[u, d]]
-
-        for e, element in user_elements:
-            user_num_elements[u, e] = model.addVar(vtype=GRB.SEMIINT)
-            model.addConstr(user_num_elements[u, e]
-                            == quicksum(x[e, d] for d, _ in user_devices))
-
-            # (6) whether element has been made available to user
-            user_has_element[u, e] = model.addVar(vtype=GRB.SEMIINT)
-            model.addConstr(user_has_element[u, e] <= user_num_elements[u, e])
-            model.addConstr(user_has_element[u, e] <= 1)
-
-            user_num_replicated_elements[u, e] = model.addVar(vtype=GRB.SEMIINT)
-            model.addConstr(user_num_replicated_elements[u, e] + 1 >=
-                            quicksum(x[e, d] for d, device in user_devices))
-
-        user_num_unique_elements[u] = model.addVar(vtype=GRB.SEMIINT)
-        model.addConstr(user_num_unique_elements[u] ==
-                        quicksum(user_has_element[u, e] for e, element in user_elements))
-
-    # (7) completeness ratio of user with min. completeness
-    min_ratio_unique_elements = model.addVar(vtype=GRB.CONTINUOUS, lb=0.0)
-    for u, user in enumerate(users):
-        user_elements = [(e, element) for e, element in enumerate(elements) if user_element_access[u, e]]
-        num_user_elements = len(user_elements)
-        if num_user_elements > 0:
-            model.addConstr(min_ratio_unique_elements <= user_num_unique_elements[u] / num_user_elements)
-
-    # Objective function
-    quality_term      = 0.0
-    completeness_term = 0.0
-
-    quality_weight      = 0.8
-    completeness_weight = 0.2
-    # assert np.abs(compatibility_weight + quality_weight + completeness_weight - 1.0) < 1e-6
-
-    for d, device in enumerate(devices):
-        # (3)
-        # Maximize summed area of elements weighted by importance
-        # Also maximize compatibility in assignment
-        quality_term += quicksum(
-                    element_device_comp[e, d] * element_device_imp[e, d] * s[e, d]
-                    for e, element in enumerate(elements)
-                ) / (device._area)
-
-    # (8) Term for trying to assign all available elements
-    for u, user in enumerate(users):
-        user_devices = [(d, device) for d, device in enumerate(devices) if user_device_access[u, d]]
-        user_elements = [(e, element) for e, element in enumerate(elements) if user_element_access[u, e]]
-        if len(user_devices) > 0 and len(user_elements) > 0:
-            completeness_term += quicksum(
-                user_has_element[u, e]
-                for e, element in user_elements
-            ) / (len(user_elements) * len(users))
-
-    # (8) Additional term: ensure minimum coverage is optimized more
-    completeness_term += min_ratio_unique_elements
-
-    # (1) Register objective function terms
-    model.ModelSense = GRB.MAXIMIZE
-    model.setObjectiveN(
-        quality_term,
-        index=0,
-        weight=quality_weight,
-        priority=0,
-    )
-    model.setObjectiveN(
-        completeness_term,
-        index=1,
-        weight=completeness_weight,
-        priority=0,
-    )
+    # Solve
+    try:
+        solution = solve(solver, report)
+    finally:
+        if granted is not None:
+            scheduler.release(granted)
+    stats['status'] = solution.status
+    stats['gap'] = solution.gap
+    stats['build_time'] = formulate_time + solution.build_time
+    stats['solve_time'] = solution.solve_time
+    if fallback is not None:
+        stats['solve_time'] += fallback.solve_time
+    stats['num_variables'] = solution.num_variables
+    stats['num_constraints'] = solution.num_constraints
+    stats['num_nonzeros'] = solution.num_nonzeros
+    stats['num_nodes'] = solution.num_nodes
+    if solution.status != 'optimal' and solver.name != solvers.GreedyBackend.name:
+        # Respond in bounded time if the solver was stopped early. The incumbent may be
+        # poor or missing, so use the greedy heuristic if it does better.
+        if fallback is None:
+            fallback = solve(solvers.GreedyBackend())
+            stats['solve_time'] += fallback.solve_time
+        if not solution.has_assignment or problem.objective(fallback.x, fallback.s) \
+                > problem.objective(solution.x, solution.s):
+            solution = fallback
+            stats['gap'] = None
+            stats['fallback'] = solvers.GreedyBackend.name
+    if not solution.has_assignment:
+        stats['time_taken'] = stats['preprocess_time'] + stats['build_time'] \
+            + stats['solve_time']
+        _log_stats(stats)
+        return output, stats
 
-    # Create output list of elements (sorted)
-    output = {}
-    for device in devices:
-        output[device] = []
+    start_time = time.time()
+    stats['objective'] = problem.objective(solution.x, solution.s)
 
-    # Solve
-    model.optimize()
-    end_time = time.time()
-    time_taken = end_time - start_time
-    if model.status != GRB.status.OPTIMAL:
-        return output, time_taken
-
-    # for d, device in enumerate(devices):
-    #     for e, element in enumerate(elements):
-    #         print('%s [%d] - %s [%d] has size %d' % (device.name, d, element.name, e, s[e, d].x))
-
-    # for e, element in enumerate(elements):
-    #     for d, device in enumerate(devices):
-    #         x_ = x[e,d].x
-    #         s_ = s[e,d].x
-    #         print('(%d,%d): x = %d, s = %d' % (e, d, x_, s_))
-
-    # for u, user in enumerate(users):
-    #     user_elements = [(e, element) for e, element in enumerate(elements) if user_element_access[u, e]]
-    #     for e, element in user_elements:
-    #         print('user_num_elements[%s, %s] = %d'
-    #               % (user.name, element.name, user_num_elements[u, e].x))
-    #         print('user_has_element[%s, %s] = %d'
-    #               % (user.name, element.name, user_has_element[u, e].x))
-    #         print('user_num_replicated_elements[%s, %s] = %d'
-    #               % (user.name, element.name, user_num_replicated_elements[u, e].x))
-
-    # for u, user in enumerate(users):
-    #     user_assigned_elements = np.unique(sorted([element.name
-    #           for d, _ in enumerate(devices)
-    #           for e, element in enumerate(elements)
-    #           if x[e, d].x == 1 and user_device_access[u, d]]))
-    #     print('%s has %d elements assigned:\n> %s' %
-    #           (user.name, len(user_assigned_elements), ', '.join(user_assigned_elements)))
-
-    print('Coverages:')
-    for u, user in enumerate(users):
-        user_elements = [(e, element) for e, element in enumerate(elements) if user_element_access[u, e]]
-        if len(user_elements) > 0:
-            print('- %s: %.2f' % (user.name, user_num_unique_elements[u].x / len(user_elements)))
-        else:
-            print('- %s: 0.0' % user.name)
-    print('- min: %.2f' % min_ratio_unique_elements.x)
+    user_has_element, min_ratio_unique_elements = problem.completeness(solution.x)
+    class_num_unique_elements = np.bincount(problem.coverage_user, weights=user_has_element,
+                                            minlength=len(problem.user_names))
+    class_num_elements = problem.user_num_elements
+    class_coverages = class_num_unique_elements / np.maximum(class_num_elements, 1)
+    stats['coverages'] = dict((user.name, float(class_coverages[problem.user_class[u]]))
+                              for u, user in enumerate(users))
+    stats['min_coverage'] = float(min_ratio_unique_elements)
 
     # Fill output with optimizer result
-    for key, var in x.items():
-        if var.x != 1:  # Ignore if not 1.0 (assignment)
-            continue
-        e, d = key
-
-        element = elements[e]
-        device = devices[d]
-        if not hasattr(element, '_optimizer_size'):
-            element._optimizer_size = {}
-        element._optimizer_size[device.name] = s[e, d].x
+    for p in np.flatnonzero(solution.x > 0.5):  # Ignore if not 1.0 (assignment)
+        element = elements[problem.pair_element[p]]
+        device = devices[problem.pair_device[p]]
+        element._optimizer_size[device.name] = solution.s[p]
         output[device].append(element)
-    return output, time_taken
-
-
-def pre_process_objects(elements, devices, users):
-    # compatibility_metric = 'distance'
-    compatibility_metric = 'dot'
+    if previous is not None:
+        previous_elements = {}
+        for element_name, device_name in previous:
+            previous_elements.setdefault(device_name, set()).add(element_name)
+        stats['changed_devices'] = sorted(
+            device.name for device, assigned in output.items()
+            if set(element.name for element in assigned)
+            != previous_elements.get(device.name, set()))
+    stats['extract_time'] = time.time() - start_time
+    stats['time_taken'] = stats['preprocess_time'] + stats['build_time'] \
+        + stats['solve_time'] + stats['extract_time']
+    _log_stats(stats)
+    return output, stats
+
+
+def _log_stats(stats):
+    logger.debug('Coverages:\n%s\n- min: %s' % (
+        '\n'.join('- %s: %.2f' % item for item in sorted(stats['coverages'].items())),
+        '%.2f' % stats['min_coverage'] if stats['min_coverage'] is not None else '-'))
+    logger.info('Solved with %s (%s%s%s) in %.3fs: preprocess %.3fs, build %.3fs, '
+                'solve %.3fs, extract %.3fs; %s threads, %s free devices, %s pairs, '
+                '%s user classes, %s variables, %s constraints, %s nonzeros, %s nodes'
+                % (stats['backend'], stats['status'],
+                   ', gap %.2g' % stats['gap'] if stats['gap'] is not None else '',
+                   ', %s fallback' % stats['fallback'] if stats['fallback'] else '',
+                   stats['time_taken'], stats['preprocess_time'], stats['build_time'],
+                   stats['solve_time'], stats['extract_time'],
+                   stats['threads'] if stats['threads'] is not None else 'default',
+                   stats['num_free_devices'],
+                   stats['num_pairs'],
+                   stats['num_user_classes'],
+                   stats['num_variables'], stats['num_constraints'], stats['num_nonzeros'],
+                   stats['num_nodes']))
+
+
+def pre_process_objects(elements, devices, users, compatibility_metric='dot',
+                        compatibility_table=False):
+    """Matrices of `pre_process_arrays` for lists of Elements, Devices and Users."""
+    return pre_process_arrays(ProblemArrays.from_objects(elements, devices, users),
+                              compatibility_metric, compatibility_table)
+
+
+def pre_process_arrays(arrays, compatibility_metric='dot', compatibility_table=False):
+    """Importance, compatibility and access matrices of a room given as ProblemArrays.
+
+    The compatibility metric and the use of its precomputed table are passed on to
+    `compatibility.compatibility_matrix`.
 
-    num_elements = len(elements)
-    num_devices = len(devices)
-    num_users = len(users)
+    Output:
+        (element-user importance, element-device importance, element-device
+         compatibility, user-device access, user-element access)
+    """
+    num_devices = arrays.num_devices
 
-    # Normalize so values are in [0, 1]
-    def normalized(vector):
-        v_max = vector.max()
-        v_min = 0.0  # vector.min()
-        v_dif = v_max - v_min
-        vector = vector - v_min
-        if v_dif > 1e-6:
-            vector = vector / v_dif
-        return vector
+    # Normalize each column so values are in [0, 1]
+    def normalized(matrix):
+        c_max = matrix.max(axis=0)
+        c_min = 0.0  # matrix.min(axis=0)
+        c_dif = c_max - c_min
+        matrix = matrix - c_min
+        scale = np.where(c_dif > 1e-6, c_dif, 1.0)
+        return matrix / scale
 
     # Retrieve, store and normalize user-specific element importance
-    element_user_imp = np.zeros((num_elements, num_users))
-    element_name_index = dict((element.name, i) for i, element in enumerate(elements))
-    for u, user in enumerate(users):
-        element_user_imp[:, u] = [element.importance for element in elements]
-        for element_name, importance in user.importance.iteritems():
-            if element_name in element_name_index:
-                element_user_imp[element_name_index[element_name], u] = importance
+    element_user_imp = np.empty((arrays.num_elements, arrays.num_users))
+    element_user_imp[:] = arrays.element_importance[:, np.newaxis]
+    element_user_imp[arrays.importance_element, arrays.importance_user] = \
+        arrays.importance_value
 
     # Calculate and create normalized matrix of element-device compatibility
-    element_device_comp = np.zeros((num_elements, num_devices))
-    for d, device in enumerate(devices):
-        for e, element in enumerate(elements):
-            element_device_comp[e, d] = device.calculate_compatibility(element, compatibility_metric)
-        element_device_comp[:, d] = normalized(element_device_comp[:, d])
+    element_device_comp = compatibility.compatibility_matrix(
+        arrays.element_requirements, arrays.device_affordances, compatibility_metric,
+        table=compatibility_table)
+    element_device_comp = normalized(element_device_comp)
 
-    # Set boolean matrix of user-device access
+    # Boolean matrices of user-device and user-element access
     # TODO: try continuous numbers
-    user_device_access = np.zeros((num_users, num_devices), dtype=bool)
-    for d, device in enumerate(devices):
-        for user in device.users:
-            user_device_access[users.index(user), d] = 1
-
-    # Set boolean matrix of user-element access
-    user_element_access = np.zeros((num_users, num_elements), dtype=bool)
-    for e, element in enumerate(elements):
-        for u, user in enumerate(users):
-            # NOTE: we set access to False if importance 0
-            if element.user_has_access(user):
-                user_element_access[u, e] = 1
-            else:
-                element_user_imp[e, u] = 0
-
-    element_user_imp = np.multiply(element_user_imp, user_element_access.transpose())
-    for u, user in enumerate(users):
-        element_user_imp[:, u] = normalized(element_user_imp[:, u])
+    user_device_access = arrays.user_device_access.copy()
+    user_element_access = arrays.user_element_access.copy()
+
+    # NOTE: we set importance to 0 if no access
+    element_user_imp = normalized(element_user_imp * user_element_access.T)
 
     # If close to zero importance, set access to 0
-    for e, element in enumerate(elements):
-        for u, user in enumerate(users):
-            if element_user_imp[e, u] < 1e-6:
-                user_element_access[u, e] = 0
+    user_element_access &= (element_user_imp >= 1e-6).T
 
     # Normalize element importances per device
-    element_device_imp = np.asmatrix(element_user_imp) * np.asmatrix(user_device_access)
-    for d, device in enumerate(devices):
-        num_users_on_device = np.sum(user_device_access[:, d])
-        if num_users_on_device > 0:
-            element_device_imp[:, d] /= num_users_on_device
-
-    # Set accumulated element-device to zero if no users with access to both e and d
-    for d, device in enumerate(devices):
-        for e, element in enumerate(elements):
-            comp = np.multiply(user_element_access[:, e], user_device_access[:, d])
-            if np.count_nonzero(user_device_access[:, d]) > 1 and np.count_nonzero(comp) == 1:
-                element_device_imp[e, d] = 0
-                for u, v in enumerate(comp):
-                    if v == 0:
-                        user_element_access[u, e] = 0
-        element_device_imp[:, d] = normalized(element_device_imp[:, d])
+    element_device_imp = np.dot(element_user_imp, user_device_access)
+    num_users_on_device = np.sum(user_device_access, axis=0)
+    element_device_imp /= np.maximum(num_users_on_device, 1)
+
+    # Set accumulated element-device to zero if no users with access to both e and d.
+    #
+    # Devices are visited in order. The first device d1 with multiple users of which only a
+    # single user u1 has access to e removes e from all other users. On later devices, e then
+    # only remains accessible through u1.
+    num_shared_users = np.dot(user_element_access.T.astype(np.float64),
+                              user_device_access.astype(np.float64))
+    is_multi_user = num_users_on_device > 1
+    is_single_access = (num_shared_users == 1) & is_multi_user
+    single_elements = np.flatnonzero(np.any(is_single_access, axis=1))
+    if len(single_elements) > 0:
+        first_devices = np.argmax(is_single_access[single_elements, :], axis=1)
+        single_users = np.argmax(user_element_access[:, single_elements]
+                                 & user_device_access[:, first_devices], axis=0)
+        zero_mask = (np.arange(num_devices) >= first_devices[:, np.newaxis]) \
+            & is_multi_user & user_device_access[single_users, :]
+        element_device_imp[single_elements, :] *= ~zero_mask
+        user_element_access[:, single_elements] = 0
+        user_element_access[single_users, single_elements] = 1
+    element_device_imp = normalized(element_device_imp)
 
     # Add noise to prevent stalemates
     def add_noise(array):
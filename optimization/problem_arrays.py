@@ -0,0 +1,157 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Elements, devices and users of a room as arrays, as consumed by the optimizer.
+
+Reading attributes of model objects one by one is slow for rooms with thousands of users
+and costs a Python object per value. `ProblemArrays.from_objects` reads the objects once
+into arrays, and the preprocessing and formulation only use those.
+"""
+import numpy as np
+
+
+class ProblemArrays(object):
+    """Struct of arrays describing a room.
+
+    Arrays over elements, devices and users are in the order of the lists they were made
+    from. Properties are rows of `element_requirements` and `device_affordances` with
+    columns as in `Properties.names`. Importances which users set for elements are given
+    by the triplets importance_element, importance_user and importance_value, as users
+    only set a few of them. `user_device_access` and `user_element_access` tell whether
+    each user has access to each device and element, as given by `Device.users` and
+    `Element.allowed_users` or `Element.prohibited_users`.
+    """
+
+    def __init__(self, element_names, element_importance, element_min_width,
+                 element_max_width, element_min_height, element_max_height,
+                 element_requirements, device_names, device_width, device_height,
+                 device_affordances, user_names, user_device_access, user_element_access,
+                 importance_element, importance_user, importance_value):
+        self.element_names = element_names
+        self.element_importance = element_importance
+        self.element_min_width = element_min_width
+        self.element_max_width = element_max_width
+        self.element_min_height = element_min_height
+        self.element_max_height = element_max_height
+        self.element_requirements = element_requirements
+
+        self.device_names = device_names
+        self.device_width = device_width
+        self.device_height = device_height
+        self.device_affordances = device_affordances
+
+        self.user_names = user_names
+        self.user_device_access = user_device_access
+        self.user_element_access = user_element_access
+        self.importance_element = importance_element
+        self.importance_user = importance_user
+        self.importance_value = importance_value
+
+    @property
+    def num_elements(self):
+        return len(self.element_names)
+
+    @property
+    def num_devices(self):
+        return len(self.device_names)
+
+    @property
+    def num_users(self):
+        return len(self.user_names)
+
+    @property
+    def element_min_area(self):
+        return self.element_min_width * self.element_min_height
+
+    @property
+    def element_max_area(self):
+        return self.element_max_width * self.element_max_height
+
+    @property
+    def device_area(self):
+        return self.device_width * self.device_height
+
+    @classmethod
+    def from_objects(cls, elements, devices, users):
+        """Arrays of lists of Element, Device and User.
+
+        Users are matched by identity, and users of devices or elements which are not in
+        `users` are ignored, as are importances of unknown elements.
+        """
+        user_index = dict((id(user), u) for u, user in enumerate(users))
+
+        def user_indices(user_list):
+            return [user_index[id(user)] for user in user_list if id(user) in user_index]
+
+        element_values = np.array([(e.importance, e.min_width, e.max_width, e.min_height,
+                                    e.max_height) for e in elements],
+                                  dtype=np.float64).reshape(-1, 5)
+        device_sizes = np.array([(d.width, d.height) for d in devices],
+                                dtype=np.float64).reshape(-1, 2)
+
+        user_device_access = np.zeros((len(users), len(devices)), dtype=bool)
+        device_users = [user_indices(device.users) for device in devices]
+        user_device_access[np.concatenate([[]] + device_users).astype(np.int64),
+                           np.repeat(np.arange(len(devices)),
+                                     [len(u) for u in device_users])] = True
+
+        user_element_access = np.ones((len(users), len(elements)), dtype=bool)
+        for e, element in enumerate(elements):
+            if len(element.prohibited_users) > 0:
+                assert len(element.allowed_users) == 0
+                user_element_access[user_indices(element.prohibited_users), e] = False
+            elif len(element.allowed_users) > 0:
+                assert len(element.prohibited_users) == 0
+                user_element_access[:, e] = False
+                user_element_access[user_indices(element.allowed_users), e] = True
+
+        element_index = dict((element.name, e) for e, element in enumerate(elements))
+        importances = [(element_index[element_name], u, importance)
+                       for u, user in enumerate(users)
+                       for element_name, importance in user.importance.items()
+                       if element_name in element_index]
+        importance_element, importance_user, importance_value = \
+            [np.array(column) for column in zip(*importances)] if len(importances) > 0 \
+            else (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0))
+
+        return cls(
+            element_names=[element.name for element in elements],
+            element_importance=element_values[:, 0],
+            element_min_width=element_values[:, 1],
+            element_max_width=element_values[:, 2],
+            element_min_height=element_values[:, 3],
+            element_max_height=element_values[:, 4],
+            element_requirements=_property_rows([e.requirements for e in elements]),
+            device_names=[device.name for device in devices],
+            device_width=device_sizes[:, 0],
+            device_height=device_sizes[:, 1],
+            device_affordances=_property_rows([d.affordances for d in devices]),
+            user_names=[user.name for user in users],
+            user_device_access=user_device_access,
+            user_element_access=user_element_access,
+            importance_element=importance_element,
+            importance_user=importance_user,
+            importance_value=importance_value.astype(np.float64),
+        )
+
+
+def _property_rows(properties):
+    """Array of the vectors of a list of Properties, one row each."""
+    vectors = bytearray().join(p.vector for p in properties)
+    return np.frombuffer(vectors, dtype=np.uint8).reshape(-1, 4)
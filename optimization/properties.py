@@ -17,29 +17,46 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
-class Properties:
+def _value(value):
+    """Property value as int, raising ValueError unless it is a whole number from 0 to 5."""
+    if not 0 <= value <= 5 or value != int(value):
+        raise ValueError('property values are whole numbers from 0 to 5, not %r' % (value,))
+    return int(value)
 
-    visual_display = 0  # 0...5
-    text_input = 0      # 0...5
-    touch_pointing = 0  # 0...5
-    mouse_pointing = 0  # 0...5
+
+def _property(index):
+    def get(self):
+        return self.vector[index]
+
+    def set(self, value):
+        self.vector[index] = _value(value)
+    return property(get, set)
+
+
+class Properties(object):
+    """Capabilities of a device or requirements of an element, each from 0 to 5.
+
+    The four values are held in a bytearray `vector`, in the order of `names`, so that the
+    properties of many objects are joined into one array without reading each attribute.
+    Values which are not whole numbers from 0 to 5 raise ValueError rather than being
+    truncated.
+    """
+
+    __slots__ = ('vector',)
+
+    names = ('visual_display', 'text_input', 'touch_pointing', 'mouse_pointing')
 
     def __init__(self, visual_display=0, text_input=0, touch_pointing=0, mouse_pointing=0):
-        assert 0 <= visual_display <= 5
-        assert 0 <= text_input <= 5
-        assert 0 <= touch_pointing <= 5
-        assert 0 <= mouse_pointing <= 5
+        self.vector = bytearray([_value(visual_display), _value(text_input),
+                                 _value(touch_pointing), _value(mouse_pointing)])
 
-        self.visual_display = visual_display
-        self.text_input = text_input
-        self.touch_pointing = touch_pointing
-        self.mouse_pointing = mouse_pointing
+    visual_display = _property(0)
+    text_input = _property(1)
+    touch_pointing = _property(2)
+    mouse_pointing = _property(3)
 
     def dot(self, other):
-        return self.visual_display * other.visual_display + \
-               self.text_input * other.text_input + \
-               self.touch_pointing * other.touch_pointing + \
-               self.mouse_pointing * other.mouse_pointing
+        return sum(a * b for a, b in zip(self.vector, other.vector))
 
     def __repr__(self):
-        return '%d|%d|%d|%d' % (self.visual_display, self.text_input, self.touch_pointing, self.mouse_pointing)
+        return '%d|%d|%d|%d' % tuple(self.vector)
@@ -0,0 +1,127 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Re-solve only the devices of a room which are affected by a change.
+
+When a device joins or leaves, a user changes or an element is edited, the previous
+assignment stays good for devices which do not share users with the change. Devices named
+in the change and devices of changed users are freed together with all other devices of
+their users, so that elements may move between a user's devices, e.g. from a shared
+display to the phone the user just took out. Changed elements and elements of removed
+devices are placed anew on the devices which may show them. All other devices keep their
+previous elements and only take part in the completeness of their users.
+
+The result is not optimal for the whole room in general, but the model only grows with
+the neighbourhood of the change.
+"""
+import numpy as np
+
+import decomposition
+import heuristic
+import solvers
+
+_eps = 1e-9
+
+
+def free_devices(problem, user_names, user_device_access, previous, changes):
+    """Devices to re-solve after a change to a room.
+
+    Input:
+        problem (AssignmentProblem): problem of the changed room
+        user_names (list of str): names of all users of the room
+        user_device_access (array): whether each user has access to each device
+        previous (list of (str, str)): (element name, device name) pairs of the previous
+                                       assignment
+        changes (dict): names of objects which were added, removed or changed since the
+                        previous assignment, under the keys 'devices', 'users' and
+                        'elements'. Devices whose users changed are changed devices.
+
+    Output:
+        array of whether each device is re-solved
+    """
+    device_index = dict((name, d) for d, name in enumerate(problem.device_names))
+    element_index = dict((name, e) for e, name in enumerate(problem.element_names))
+    num_devices = len(problem.device_names)
+    affected = np.zeros(num_devices, dtype=bool)
+
+    # Changed devices, devices of changed users and devices whose previous elements are
+    # no longer admissible or no longer fit
+    affected[[device_index[name] for name in changes.get('devices', [])
+              if name in device_index]] = True
+    changed_users = set(changes.get('users', []))
+    user_rows = [u for u, name in enumerate(user_names) if name in changed_users]
+    affected |= np.any(user_device_access[user_rows, :], axis=0)
+    previous_x = problem.pairs_in(previous).astype(np.float64)
+    num_previous = np.bincount([device_index[d] for _, d in set(previous) if d in device_index],
+                               minlength=num_devices)
+    num_admissible = np.bincount(problem.pair_device, weights=previous_x,
+                                 minlength=num_devices)
+    affected |= num_previous != num_admissible
+    min_area_used = np.bincount(problem.pair_device, weights=previous_x * problem.pair_min_area,
+                                minlength=num_devices)
+    affected |= min_area_used > problem.device_area + _eps
+
+    # All devices of the users of affected devices
+    affected_users = np.any(user_device_access[:, affected], axis=1)
+    free = affected | np.any(user_device_access[affected_users, :], axis=0)
+
+    # Devices which may show changed elements or elements of removed devices
+    changed_elements = set(changes.get('elements', []))
+    changed_elements.update(e for e, d in previous if d not in device_index)
+    elements = [element_index[name] for name in changed_elements if name in element_index]
+    free[problem.pair_device[np.isin(problem.pair_element, elements)]] = True
+    return free
+
+
+def solve(backend, problem, free, x, readable_names=False, time_limit=None, mip_gap=None,
+          processes=None, start=None, threads=None, incumbent=None):
+    """Solve the pairs of some devices of an AssignmentProblem with a Backend.
+
+    The pairs of all other devices are fixed to an assignment x, with the best areas for
+    the assigned elements. Incumbents are passed to `incumbent` as assignments of the
+    whole problem with the gap of the re-solved devices. See `decomposition.solve` for the
+    other arguments.
+
+    Output:
+        Solution of the whole problem
+    """
+    pairs = np.flatnonzero(free[problem.pair_device])
+    fixed_x = np.where(free[problem.pair_device], 0.0, x)
+    fixed_s = heuristic.fill_areas(problem, fixed_x)
+    if len(pairs) == 0:
+        return solvers.Solution(status='optimal', x=fixed_x, s=fixed_s)
+
+    part = problem.restricted(pairs, fixed_x)
+    part_start = (start[0][pairs], start[1][pairs]) if start is not None else None
+    part_incumbent = None
+    if incumbent is not None:
+        def part_incumbent(part_x, part_s, gap):
+            incumbent_x, incumbent_s = fixed_x.copy(), fixed_s.copy()
+            incumbent_x[pairs] = part_x
+            incumbent_s[pairs] = part_s
+            incumbent(incumbent_x, incumbent_s, gap)
+    solution = decomposition.solve(backend, part, readable_names=readable_names,
+                                   time_limit=time_limit, mip_gap=mip_gap,
+                                   processes=processes, start=part_start, threads=threads,
+                                   incumbent=part_incumbent)
+    if solution.has_assignment:
+        fixed_x[pairs] = solution.x
+        fixed_s[pairs] = solution.s
+        solution.x, solution.s = fixed_x, fixed_s
+    return solution
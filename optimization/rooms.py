@@ -0,0 +1,256 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Rooms held by the server, which clients change by sending deltas.
+
+A client sends the full room once as a snapshot, with the usual 'data' of elements,
+devices and users and an optional 'version' (0 by default):
+
+    {"type": "snapshot", "token": ..., "version": 0, "data": {...}}
+
+Changes are then sent as deltas of operations, each with the next version number:
+
+    {"type": "delta", "token": ..., "version": 1, "operations": [
+        {"op": "add_device", "device": {"__class__": "Device", "name": "phone", ...}},
+        {"op": "update_user_importance", "id": "u1", "element_importances": {"map": 0.5}},
+        {"op": "remove_element", "name": "chat"}]}
+
+Elements and devices are identified by name and users by id. The operations are
+add_element, update_element, remove_element, add_device, update_device, remove_device,
+add_user, update_user, remove_user and update_user_importance, which sets the importance
+of the given elements for a user. Objects are given as in snapshots and add and update
+replace any object with the same name or id.
+
+A delta whose version does not follow the version of the room, e.g. as an earlier delta
+got lost, or a delta for an unknown room is rejected with a `VersionError`. The client
+then needs to send a snapshot again.
+"""
+from collections import OrderedDict
+import copy
+
+import cache
+import codec
+from device import Device
+from user import User
+
+
+class VersionError(ValueError):
+    """Delta which does not apply to the room held by the server.
+
+    `version` is the version of the room, or None if the room is unknown.
+    """
+
+    def __init__(self, message, version):
+        ValueError.__init__(self, message)
+        self.version = version
+
+
+class Room(object):
+    """Elements, devices and users of a room as model objects.
+
+    Deltas only decode the objects they add or update, so that applying them takes time
+    in the size of the change rather than of the room. Devices and elements refer to
+    users by object, so there is a single User for each id. Users which are not part of
+    the room, such as removed users or users which were referred to before they were
+    added, are ignored by the optimizer, see `ProblemArrays.from_objects`.
+
+    Objects are replaced rather than changed, as earlier requests may still be solving
+    them. A user which is updated is replaced together with the elements and devices
+    which refer to it.
+    """
+
+    def __init__(self, data, version=0):
+        self._user_by_id = {}  # Users of all ids referred to, including those not in the room
+        self._referrers = {}  # User id => (kind, name) of elements and devices referring to it
+        self.users = OrderedDict()
+        self.elements = OrderedDict()
+        self.devices = OrderedDict()
+        for u in data['users']:
+            self._set_user(codec.decode_user(u))
+        for e in data['elements']:
+            self._set(codec.decode_element(e, self._users_of))
+        for d in data['devices']:
+            self._set(codec.decode_device(d, self._users_of))
+        self.version = version
+
+    def objects(self):
+        """Lists of the Elements, Devices and Users of the room."""
+        return (list(self.elements.values()), list(self.devices.values()),
+                list(self.users.values()))
+
+    def apply(self, operations):
+        """Apply the operations of a delta.
+
+        All operations are checked and their objects decoded before any is applied, so
+        that the room is left unchanged if one of them is invalid.
+        """
+        present = {}  # user id => whether in the room after the operations so far
+        changes = [self._change(operation, present) for operation in operations]
+        for change in changes:
+            change()
+
+    def _change(self, operation, present):
+        """Function which applies a decoded operation."""
+        op = operation['op']
+        kind, _, target = op.partition('_')
+        if op == 'update_user_importance':
+            uid = operation['id']
+            if not present.get(uid, uid in self.users):
+                raise KeyError('Unknown user "%s"' % uid)
+            importances = dict(operation['element_importances'])
+
+            def update_importance():
+                user = self._user_by_id[uid]
+                importance = dict(user.importance)
+                importance.update(importances)
+                self._set_user(User(name=user.name, id=uid, importance=importance))
+            return update_importance
+        elif target not in ['element', 'device', 'user'] \
+                or kind not in ['add', 'update', 'remove']:
+            raise ValueError('Unknown operation "%s"' % op)
+
+        objects = getattr(self, target + 's')
+        if kind == 'remove':
+            key = operation['id' if target == 'user' else 'name']
+            if target == 'user':
+                present[key] = False
+            return lambda: objects.pop(key, None)
+        fields = operation[target]
+        if target == 'user':
+            user = codec.decode_user(fields)
+            present[user.id] = True
+            return lambda: self._set_user(user)
+        decode = codec.decode_element if target == 'element' else codec.decode_device
+        o = decode(fields, self._users_of)
+        return lambda: self._set(o)
+
+    def _user(self, uid):
+        """The User of an id, which is created if not referred to before."""
+        user = self._user_by_id.get(uid)
+        if user is None:
+            user = self._user_by_id[uid] = User(id=uid)
+        return user
+
+    def _users_of(self, ids):
+        return [self._user(uid) for uid in ids]
+
+    def _set(self, o):
+        """Add a decoded element or device to the room, replacing the one of the same name."""
+        kind = 'device' if isinstance(o, Device) else 'element'
+        getattr(self, kind + 's')[o.name] = o
+        for user in _users_of(o):
+            self._referrers.setdefault(user.id, set()).add((kind, o.name))
+
+    def _set_user(self, user):
+        """Add a decoded user to the room, replacing the user of the same id.
+
+        Elements and devices which refer to the replaced user are replaced by copies which
+        refer to the new one.
+        """
+        old = self._user_by_id.get(user.id)
+        self._user_by_id[user.id] = user
+        self.users[user.id] = user
+        if old is None:
+            return
+        referrers = set()
+        for kind, name in self._referrers.pop(user.id, ()):
+            objects = getattr(self, kind + 's')
+            o = objects.get(name)
+            if o is not None and any(u is old for u in _users_of(o)):
+                objects[name] = _with_user(o, old, user)
+                referrers.add((kind, name))
+        if referrers:
+            self._referrers[user.id] = referrers
+
+
+class Rooms(object):
+    """Rooms of the most recently active tokens.
+
+    Input:
+        capacity (int): max. number of rooms to keep, the least recently used room is
+                        dropped first
+    """
+
+    def __init__(self, capacity):
+        self._rooms = cache.LRUCache(capacity)
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def snapshot(self, token, data, version=0):
+        """Replace the room of a token and return its objects, see `Room.objects`."""
+        room = Room(data, version)
+        self._rooms.put(token, room)
+        return room.objects()
+
+    def apply(self, token, version, operations):
+        """Apply a delta to the room of a token and return its objects, see `Room.objects`.
+
+        The room is left unchanged if the delta is rejected. The deltas of a token are
+        expected from a single client, which sends them one after another.
+        """
+        room = self._rooms.get(token)
+        if room is None:
+            raise VersionError('Unknown room, send a snapshot', None)
+        if version != room.version + 1:
+            raise VersionError('Expected version %d but got %s' % (room.version + 1, version),
+                               room.version)
+        room.apply(operations)
+        room.version = version
+        return room.objects()
+
+    def web_input(self, request):
+        """Keep the room of a snapshot or apply a delta, and return the request to solve.
+
+        The request to solve holds the objects of the room, see `codec.decode_request`.
+        Other requests are returned unchanged. Raises a `VersionError` as `apply`.
+        """
+        if request.get('type') == 'snapshot':
+            objects = self.snapshot(request['token'], request['data'],
+                                    request.get('version', 0))
+        elif request.get('type') == 'delta':
+            objects = self.apply(request['token'], request.get('version'),
+                                 request.get('operations', []))
+        else:
+            return request
+        return {'token': request['token'], 'objects': objects,
+                'options': request.get('options', {})}
+
+
+def _users_of(o):
+    """Users which an element or device refers to."""
+    if isinstance(o, Device):
+        return o.users
+    return o.allowed_users + o.prohibited_users
+
+
+def _with_user(o, old, new):
+    """Copy of an element or device which refers to a new user instead of an old one."""
+    o = copy.copy(o)
+
+    def replaced(users):
+        return [new if user is old else user for user in users]
+    if isinstance(o, Device):
+        o.users = replaced(o.users)
+    elif len(o.allowed_users) > 0:
+        o.allowed_users = replaced(o.allowed_users)
+    else:
+        o.prohibited_users = replaced(o.prohibited_users)
+    return o
+
@@ -19,18 +19,123 @@
 # DEALINGS IN THE SOFTWARE.
 """Websocket server for handling messages and passing to optimizer."""
 from websocket_server import WebsocketServer
+import argparse
+import cache
+import dispatcher
 import logging
+import metrics
 import optimize
 import json
+import rooms
+import scheduler
+import shards
+import solvers
+import time
 import traceback
 
 logger = logging.getLogger('SoManyScreens_backend')
 logger.addHandler(logging.StreamHandler())
 logger.setLevel(logging.DEBUG)
 
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--port', type=int, default=8001)
+parser.add_argument('--backend', default='gurobi', choices=sorted(solvers.BACKENDS.keys()),
+                    help='solver backend used for optimization')
+parser.add_argument('--time-limit', type=float, default=None,
+                    help='default max. seconds per solve, requests may override this')
+parser.add_argument('--mip-gap', type=float, default=None,
+                    help='default relative MIP gap at which to stop solving')
+parser.add_argument('--cache-size', type=int, default=256,
+                    help='number of assignments of previous rooms to keep, 0 to disable')
+parser.add_argument('--session-size', type=int, default=256,
+                    help='number of tokens whose last assignment is kept to start the next '
+                         'solve from, 0 to disable')
+parser.add_argument('--local-repair', action='store_true',
+                    help='only re-solve devices affected by the changes since the last request '
+                         'of a token, requests may also ask for this with the "local_repair" '
+                         'option')
+parser.add_argument('--diff', action='store_true',
+                    help='only reply with devices whose elements changed since the last reply '
+                         'to a token, requests may also ask for this with the "diff" option')
+parser.add_argument('--compact', action='store_true',
+                    help='reply with JSON without indentation, requests may also ask for this '
+                         'with the "compact" option')
+parser.add_argument('--max-rooms', type=int, default=256,
+                    help='number of rooms kept for clients which send deltas instead of '
+                         'full rooms, see rooms.py')
+parser.add_argument('--stats', action='store_true',
+                    help='include timings and model sizes in replies, requests may also ask '
+                         'for them with the "stats" option')
+parser.add_argument('--workers', type=int, default=0,
+                    help='number of worker processes solving requests concurrently, '
+                         '0 to solve one request at a time in the server process')
+parser.add_argument('--max-pending', type=int, default=64,
+                    help='max. number of requests waiting for a worker, further requests '
+                         'are answered with a busy error')
+parser.add_argument('--shards', type=int, default=0,
+                    help='number of shard processes which each keep the rooms of the tokens '
+                         'routed to them by consistent hashing, see shards.py. --max-pending '
+                         'then applies per shard.')
+parser.add_argument('--threads', type=int, default=None,
+                    help='max. number of solver threads per solve, solver default if not '
+                         'given')
+parser.add_argument('--cores', type=int, default=None,
+                    help='number of solver threads handed out to concurrent solves by the '
+                         'size of their models, number of CPUs by default, 0 to leave thread '
+                         'counts to the solver, see scheduler.py')
+parser.add_argument('--progressive', action='store_true',
+                    help='send improved assignments while solving before the final reply, '
+                         'requests may also ask for this with the "progressive" option')
+parser.add_argument('--progress-interval', type=float, default=0.1,
+                    help='min. seconds between assignments sent while solving')
+parser.add_argument('--no-warm-up', action='store_true',
+                    help='do not solve a tiny room before accepting connections, which '
+                         'creates the solver environment ahead of the first request')
+args = parser.parse_args()
+
+client_rooms = rooms.Rooms(args.max_rooms)
+latency = metrics.LatencyStats()
+solve_scheduler = scheduler.Scheduler(args.cores) if args.cores != 0 else None
+solution_cache = None
+sessions = None
+request_dispatcher = None
+shard_router = None
+if args.shards > 0:
+    # Rooms, cache and sessions are kept by the shard of their token
+    shard_router = shards.Shards(
+        args.shards, args.max_pending, max_rooms=args.max_rooms, cache_size=args.cache_size,
+        session_size=args.session_size, backend=args.backend, time_limit=args.time_limit,
+        mip_gap=args.mip_gap, full_stats=args.stats, local_repair=args.local_repair,
+        diff=args.diff, compact=args.compact, threads=args.threads,
+        progressive=args.progressive, progress_interval=args.progress_interval,
+        warm_up=not args.no_warm_up, scheduler=solve_scheduler)
+    latency.warm_up = shard_router.warm_up_time
+elif args.workers > 0:
+    # Each worker keeps its own cache, while sessions are passed along with requests
+    request_dispatcher = dispatcher.Dispatcher(
+        args.workers, args.max_pending, cache_size=args.cache_size,
+        session_size=args.session_size, backend=args.backend, time_limit=args.time_limit,
+        mip_gap=args.mip_gap, full_stats=args.stats, local_repair=args.local_repair,
+        diff=args.diff, compact=args.compact, threads=args.threads,
+        progressive=args.progressive, progress_interval=args.progress_interval,
+        warm_up=not args.no_warm_up, scheduler=solve_scheduler)
+    latency.warm_up = request_dispatcher.warm_up_time
+else:
+    if args.cache_size > 0:
+        solution_cache = cache.LRUCache(args.cache_size)
+    if args.session_size > 0:
+        sessions = cache.LRUCache(args.session_size)
+    if not args.no_warm_up:
+        try:
+            latency.warm_up = optimize.warm_up(args.backend, threads=args.threads)
+        except:
+            logger.debug('Warm-up failed:\n%s\n' % traceback.format_exc())
+
 
 def handle_message(client, server, message):
     """Handle message from client."""
+    received_time = time.time()
+
     # Handle keep-alive
     try:
         json_request = json.loads(message)
@@ -39,21 +144,104 @@ def handle_message(client, server, message):
     if 'type' in json_request and json_request['type'] == 'alive':
         return
 
+    # Report latencies of requests
+    if json_request.get('type') == 'metrics':
+        server.send_message(client, json.dumps({
+            'type': 'metrics',
+            'latency': latency.summary(),
+            'scheduler': solve_scheduler.summary() if solve_scheduler is not None else None,
+            'dispatcher': request_dispatcher.summary() if request_dispatcher is not None
+            else None,
+            'shards': shard_router.summary() if shard_router is not None else None,
+        }))
+        return
+
+    def reply(web_output):
+        server.send_message(client, web_output)
+        latency.add(time.time() - received_time)
+        logger.debug('Latency: %s' % latency)
+
+    def progress(web_output):
+        server.send_message(client, web_output)
+
+    # Pass the message to the shard of its token, which keeps its room
+    if shard_router is not None:
+        token = json_request['token']
+        if not shard_router.submit(token, message, reply, progress):
+            logger.debug('Rejected request as %d are waiting' % args.max_pending)
+            server.send_message(client, json.dumps({
+                'error': 'busy',
+                'token': token,
+            }))
+        return
+
+    # Keep the room of snapshots and apply deltas to it
+    web_input = message
+    try:
+        if json_request.get('type') in ['snapshot', 'delta']:
+            web_input = client_rooms.web_input(json_request)
+    except rooms.VersionError as e:
+        logger.debug('Rejected delta: %s' % e)
+        server.send_message(client, json.dumps({
+            'error': 'version',
+            'token': json_request['token'],
+            'room_version': e.version,
+        }))
+        return
+    except:
+        tb = traceback.format_exc()
+        logger.debug('\n%s\n' % tb)
+        server.send_message(client, json.dumps({
+            'error': tb,
+            'token': json_request['token'],
+        }))
+        return
+
+    # Solve on a worker, replacing any older request of the same token
+    if request_dispatcher is not None:
+        token = json_request['token']
+        accepted = request_dispatcher.submit(token, web_input, reply, progress)
+        if not accepted:
+            logger.debug('Rejected request as %d are waiting' % args.max_pending)
+            server.send_message(client, json.dumps({
+                'error': 'busy',
+                'token': token,
+            }))
+        return
+
     # Handle proper input
     try:
-        web_output = optimize.handle_web_input(message)
+        web_output = optimize.handle_web_input(web_input, backend=args.backend,
+                                               time_limit=args.time_limit,
+                                               mip_gap=args.mip_gap, cache=solution_cache,
+                                               full_stats=args.stats, sessions=sessions,
+                                               local_repair=args.local_repair,
+                                               diff=args.diff, compact=args.compact,
+                                               threads=args.threads,
+                                               scheduler=solve_scheduler,
+                                               progressive=args.progressive,
+                                               progress=progress,
+                                               progress_interval=args.progress_interval)
+        if solution_cache is not None:
+            logger.debug('Cache: %d hits, %d misses' % (solution_cache.hits, solution_cache.misses))
         # logger.info(web_output)
-        server.send_message(client, web_output)
+        reply(web_output)
     except:
         tb = traceback.format_exc()
         logger.debug('\n%s\n' % tb)
         server.send_message(client, json.dumps({
             'error': tb,
             'token': json_request['token'],
-        }).decode('utf-8'))
+        }))
 
-port = 8001
-logger.info('Starting backend at port %d' % port)
+port = args.port
+logger.info('Starting backend at port %d using %s' % (port, args.backend))
+if shard_router is not None:
+    logger.info('Handling rooms on %d shard processes' % args.shards)
+elif request_dispatcher is not None:
+    logger.info('Solving on %d worker processes' % args.workers)
+if latency.warm_up is not None:
+    logger.info('Warmed up in %.3fs' % latency.warm_up)
 server = WebsocketServer(port, host='0.0.0.0')  # , loglevel=logging.INFO)
 server.set_fn_new_client(
     lambda client, server:
@@ -0,0 +1,195 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Thread budgets of concurrent solves.
+
+If every solve used all cores, as Gurobi does by default, concurrent solves would
+oversubscribe the machine, while a single thread per solve leaves cores idle on a quiet
+server. The scheduler hands out threads from a fixed number of cores: each solve asks for
+threads by the size of its model after pruning, and gets what is free, but at least one.
+A solve waits while all cores are taken. The dispatcher sheds requests beyond its queue,
+see `dispatcher.Dispatcher`.
+
+The threads held by each process are kept in shared memory, so that a scheduler created
+before forking worker processes is shared by them, and the threads of a process which died
+can be given back. Waiting solves poll for free threads rather than wait on a Condition,
+whose notify blocks until all waiters woke up, forever if one of them died.
+"""
+import math
+import multiprocessing
+import os
+import time
+
+# Number of variables and rows of a model per thread asked for, as small models are solved
+# faster on one thread than parallel branch-and-bound can start on several
+size_per_thread = 2000
+
+# Max. number of processes holding or waiting for threads at the same time
+max_processes = 256
+
+# Seconds between checks for free threads while all are taken
+poll_interval = 0.01
+
+# Seconds after which threads of processes which died are given back while solves wait,
+# and after which the lock is taken over if held by a process which died
+check_interval = 1.0
+
+# Columns of the rows of processes
+_PID, _THREADS, _SOLVES, _WAITING = range(4)
+
+
+class Scheduler(object):
+    """Hands out threads of a number of cores to solves.
+
+    Input:
+        cores (int): number of threads to hand out at a time, number of CPUs if None
+    """
+
+    def __init__(self, cores=None):
+        self.cores = cores or multiprocessing.cpu_count()
+        self._lock = multiprocessing.Lock()
+        self._takeover_lock = multiprocessing.Lock()
+        self._owner = multiprocessing.Value('i', 0, lock=False)  # pid of last holder
+        # Rows of (pid, threads, solves, waiting solves) of processes, pid 0 if unused
+        self._rows = multiprocessing.Array('i', 4 * max_processes, lock=False)
+
+    def threads_wanted(self, size):
+        """Number of threads for a model with a number of variables and rows."""
+        return int(min(self.cores, max(1, math.ceil(size / float(size_per_thread)))))
+
+    def acquire(self, size):
+        """Wait until a core is free and return the number of threads granted to a solve.
+
+        The threads must be given back with `release` once the solve is done.
+        """
+        wanted = self.threads_wanted(size)
+        pid = os.getpid()
+        waiting = False
+        checked = time.time()
+        while True:
+            self._acquire_lock()
+            try:
+                free = self.cores - self._total(_THREADS)
+                if free > 0:
+                    granted = min(wanted, free)
+                    self._add(pid, granted, 1, -1 if waiting else 0)
+                    return granted
+                if not waiting:
+                    self._add(pid, 0, 0, 1)
+                    waiting = True
+                if time.time() - checked >= check_interval:
+                    for row in range(max_processes):
+                        row_pid = self._rows[4 * row + _PID]
+                        if row_pid != 0 and not _is_alive(row_pid):
+                            self._clear(row)
+                    checked = time.time()
+            finally:
+                self._release_lock()
+            time.sleep(poll_interval)
+
+    def release(self, threads):
+        self._acquire_lock()
+        try:
+            self._add(os.getpid(), -threads, -1, 0)
+        finally:
+            self._release_lock()
+
+    def reclaim(self, pid):
+        """Give back the threads of a process which died, and the lock if it held it.
+
+        Output:
+            number of threads given back
+        """
+        self._acquire_lock()
+        try:
+            row = self._row(pid)
+            if row is None:
+                return 0
+            threads = self._rows[4 * row + _THREADS]
+            self._clear(row)
+            return threads
+        finally:
+            self._release_lock()
+
+    def summary(self):
+        """Dict of the number of cores, threads in use and solves running and waiting."""
+        self._acquire_lock()
+        try:
+            return {'cores': self.cores, 'threads_in_use': self._total(_THREADS),
+                    'running': self._total(_SOLVES), 'waiting': self._total(_WAITING)}
+        finally:
+            self._release_lock()
+
+    def _acquire_lock(self):
+        while not self._lock.acquire(timeout=check_interval):
+            # Take over the lock if it is still held by a process which died. Only one
+            # process takes over, the others then see it as the owner.
+            owner = self._owner.value
+            if _is_alive(owner) or not self._takeover_lock.acquire(timeout=check_interval):
+                continue
+            try:
+                if self._lock.acquire(timeout=check_interval) or self._owner.value == owner:
+                    break
+            finally:
+                self._takeover_lock.release()
+        self._owner.value = os.getpid()
+
+    def _release_lock(self):
+        # The owner is kept, so that a process which died after releasing is not mistaken
+        # for one which died while holding the lock
+        self._lock.release()
+
+    def _row(self, pid):
+        for row in range(max_processes):
+            if self._rows[4 * row + _PID] == pid:
+                return row
+        return None
+
+    def _add(self, pid, threads, solves, waiting):
+        row = self._row(pid)
+        if row is None:
+            row = self._row(0)
+            if row is None:
+                raise RuntimeError('More than %d processes use the scheduler' % max_processes)
+            self._rows[4 * row + _PID] = pid
+        self._rows[4 * row + _THREADS] += threads
+        self._rows[4 * row + _SOLVES] += solves
+        self._rows[4 * row + _WAITING] += waiting
+        if self._rows[4 * row + _SOLVES] == 0 and self._rows[4 * row + _WAITING] == 0:
+            self._clear(row)
+
+    def _clear(self, row):
+        for column in range(4):
+            self._rows[4 * row + column] = 0
+
+    def _total(self, column):
+        return sum(self._rows[column::4])
+
+
+def _is_alive(pid):
+    """Whether a process exists, which is not known for pid 0."""
+    if pid == 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
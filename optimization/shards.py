@@ -0,0 +1,293 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Rooms sharded over processes by the token of their clients.
+
+In the sharded mode of the server, the front process only accepts connections and routes
+the messages of each token to one of several shard processes by consistent hashing. A shard
+keeps the rooms, solution cache and last assignments of its tokens, so that deltas, warm
+starts and local repair work as in a single process, and solves its requests one after
+another. Room state is never shared between shards.
+
+If a shard process dies, only its tokens are affected. Its waiting requests are answered with
+a `shard` error and the shard is restarted without rooms, so that deltas of its clients are
+answered with a `version` error, upon which they send a snapshot again.
+"""
+import bisect
+import hashlib
+import json
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+import traceback
+
+import cache
+import optimize
+import rooms
+
+logger = logging.getLogger('SoManyScreens_backend')
+
+# Rooms, solution cache and last assignments of tokens of a shard process, and the scheduler
+# shared by all shards
+_rooms = None
+_cache = None
+_sessions = None
+_scheduler = None
+
+
+class HashRing(object):
+    """Consistent hashing of tokens to shards.
+
+    Each shard is placed at `replicas` points on a ring of hashes, and a token belongs to the
+    shard of the first point after the hash of the token. Adding or removing a shard only
+    moves the tokens of that shard, rather than almost all tokens as with a modulo.
+
+    Input:
+        shards (list): shards, e.g. their indices
+        replicas (int): number of points per shard, more points spread tokens more evenly
+    """
+
+    def __init__(self, shards, replicas=64):
+        points = sorted((_hash('%s-%d' % (shard, r)), shard)
+                        for shard in shards for r in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard(self, token):
+        """Shard of a token."""
+        i = bisect.bisect(self._hashes, _hash(token)) % len(self._hashes)
+        return self._shards[i]
+
+
+class Shards(object):
+    """Shard processes which handle the messages of the tokens routed to them.
+
+    Input:
+        num_shards (int): number of shard processes
+        max_pending (int): max. number of requests waiting for each shard
+        max_rooms (int): number of rooms kept by each shard, see rooms.py
+        cache_size (int): number of assignments cached by each shard, 0 to disable
+        session_size (int): number of tokens whose last assignment each shard keeps to
+                            start from, 0 to disable
+        warm_up (bool): warm up each shard with `optimize.warm_up` before returning. The
+                        longest warm-up of a shard is kept in seconds as `warm_up_time`.
+        scheduler (scheduler.Scheduler): hands out threads to the solves of all shards
+        handler_args: keyword arguments of `optimize.handle_web_input`
+    """
+
+    def __init__(self, num_shards, max_pending, max_rooms=256, cache_size=0, session_size=0,
+                 warm_up=False, scheduler=None, **handler_args):
+        self.max_pending = max_pending
+        self.superseded = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.warm_up_time = None
+        self.ring = HashRing(range(num_shards))
+
+        # Shards are daemons, which cannot start processes of their own
+        handler_args['processes'] = 1
+        warm_up_args = None
+        if warm_up:
+            warm_up_args = dict((key, handler_args[key]) for key in ['backend', 'threads']
+                                if key in handler_args)
+        self._shard_args = (max_rooms, cache_size, session_size, scheduler, warm_up_args,
+                            handler_args)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._next_id = 0
+        self._shards = [_Shard(i, self._shard_args) for i in range(num_shards)]
+        times = [shard.replies.get()[2] for shard in self._shards]
+        if warm_up:
+            self.warm_up_time = max([t for t in times if t is not None] or [None])
+        for shard in self._shards:
+            thread = threading.Thread(target=self._read, args=(shard,))
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, token, message, reply, progress=None):
+        """Pass a message to the shard of its token.
+
+        `reply` is called with the JSON output from another thread once handled, unless the
+        request is superseded by a newer one of the same token which is waiting already.
+        `progress` is called with progressive replies before, see
+        `optimize.handle_web_input`.
+
+        Output:
+            False if the request was rejected as too many requests wait for the shard
+        """
+        shard = self._shards[self.ring.shard(token)]
+        with self._lock:
+            if len(shard.pending) >= self.max_pending:
+                self.rejected += 1
+                return False
+            request_id = self._next_id
+            self._next_id += 1
+            shard.pending[request_id] = (token, reply, progress)
+            shard.requests.put((request_id, token, message))
+        return True
+
+    def summary(self):
+        """Dict of the numbers of waiting, superseded and rejected requests, of restarts of
+        shards and of the process ids of the shards."""
+        with self._lock:
+            return {'pending': sum(len(shard.pending) for shard in self._shards),
+                    'superseded': self.superseded, 'rejected': self.rejected,
+                    'restarts': self.restarts,
+                    'pids': [shard.process.pid for shard in self._shards]}
+
+    def close(self):
+        self._closed = True
+        for shard in self._shards:
+            shard.requests.put(None)
+        for shard in self._shards:
+            shard.process.join(1)
+            if shard.process.is_alive():
+                shard.process.terminate()
+
+    def _read(self, shard):
+        """Reply with the outputs of a shard and restart it if it died.
+
+        Progressive replies and outputs of a shard come through the same queue, so that
+        they arrive in order.
+        """
+        while not self._closed:
+            try:
+                request_id, is_final, web_output = shard.replies.get(timeout=0.5)
+            except queue.Empty:
+                if not shard.process.is_alive() and not self._closed:
+                    self._restart(shard)
+                continue
+            with self._lock:
+                if is_final:
+                    token, reply, _ = shard.pending.pop(request_id, (None, None, None))
+                    if reply is not None and web_output is None:
+                        self.superseded += 1
+                else:
+                    token, _, reply = shard.pending.get(request_id, (None, None, None))
+            if reply is None or web_output is None:
+                continue
+
+            # Exceptions would stop replying to the tokens of the shard
+            try:
+                reply(web_output)
+            except:
+                logger.debug('\n%s\n' % traceback.format_exc())
+
+    def _restart(self, shard):
+        # Threads held by the solve of the shard would never be given back otherwise
+        scheduler = self._shard_args[3]
+        if scheduler is not None:
+            scheduler.reclaim(shard.process.pid)
+        with self._lock:
+            failed = list(shard.pending.values())
+            shard.pending = {}
+            self.restarts += 1
+            logger.info('Shard %d exited with code %s, restarting it' % (
+                shard.index, shard.process.exitcode))
+            shard.start()
+        for token, reply, _ in failed:
+            try:
+                reply(json.dumps({'error': 'shard', 'token': token}))
+            except:
+                logger.debug('\n%s\n' % traceback.format_exc())
+
+
+class _Shard(object):
+    """Process of a shard with its queues of requests and replies."""
+
+    def __init__(self, index, args):
+        self.index = index
+        self.args = args
+        self.start()
+
+    def start(self):
+        # Queues of a process which died may be left locked, so they are not reused
+        self.pending = {}  # request id => (token, reply function, progress function)
+        self.requests = multiprocessing.Queue()
+        self.replies = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=_run_shard,
+                                               args=(self.requests, self.replies) + self.args)
+        self.process.daemon = True
+        self.process.start()
+
+
+def _run_shard(requests, replies, max_rooms, cache_size, session_size, scheduler,
+               warm_up_args, handler_args):
+    global _rooms, _cache, _sessions, _scheduler
+    # Let the front process handle interrupts
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _rooms = rooms.Rooms(max_rooms)
+    if cache_size > 0:
+        _cache = cache.LRUCache(cache_size)
+    if session_size > 0:
+        _sessions = cache.LRUCache(session_size)
+    _scheduler = scheduler
+    seconds = None
+    if warm_up_args is not None:
+        try:
+            seconds = optimize.warm_up(**warm_up_args)
+        except:
+            logger.debug('\n%s\n' % traceback.format_exc())
+    replies.put((None, True, seconds))
+
+    while True:
+        # Deltas of all waiting requests apply in order, but only the latest request of each
+        # token is solved
+        batch = [requests.get()]
+        while True:
+            try:
+                batch.append(requests.get_nowait())
+            except queue.Empty:
+                break
+        if None in batch:
+            return
+        latest = dict((token, i) for i, (_, token, _) in enumerate(batch))
+        for i, (request_id, token, message) in enumerate(batch):
+            def progress(web_output):
+                replies.put((request_id, False, web_output))
+            replies.put((request_id, True, _handle(message, token, latest[token] == i, progress,
+                                                   handler_args)))
+
+
+def _handle(message, token, solve, progress, handler_args):
+    """JSON output for a message, or None if it is not to be solved."""
+    try:
+        request = json.loads(message)
+        web_input = message
+        if request.get('type') in ['snapshot', 'delta']:
+            web_input = _rooms.web_input(request)
+        if not solve:
+            return None
+        return optimize.handle_web_input(web_input, cache=_cache, sessions=_sessions,
+                                         scheduler=_scheduler, progress=progress,
+                                         **handler_args)
+    except rooms.VersionError as e:
+        return json.dumps({'error': 'version', 'token': token,
+                           'room_version': e.version})
+    except:
+        tb = traceback.format_exc()
+        return json.dumps({'error': tb, 'token': token})
+
+
+def _hash(key):
+    if not isinstance(key, bytes):
+        key = (u'%s' % key).encode('utf-8')
+    return int(hashlib.md5(key).hexdigest()[:16], 16)
@@ -0,0 +1,560 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Solver backends which solve an AssignmentProblem."""
+import os
+import threading
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+import heuristic
+
+try:
+    import gurobipy
+except ImportError:
+    gurobipy = None
+
+try:
+    import pulp
+except ImportError:
+    pulp = None
+
+# Whether the Gurobi backend links x and s by the linear bounds min_area * x <= s <=
+# max_area * x with a continuous s instead of indicator constraints with a semi-integer s,
+# see `GurobiBackend`
+big_m = False
+
+# Whether solves of this process are cancelled, see `cancel`, and the Gurobi models which are
+# being solved
+_cancel_lock = threading.Lock()
+_cancelled = False
+_running_models = set()
+
+
+class Solution(object):
+    """Values of the decision variables of an AssignmentProblem as found by a backend.
+
+    `x` and `s` are None if no feasible assignment was found. If the solve was stopped
+    early, they hold the best assignment found so far (the incumbent) and `gap` is its
+    relative MIP gap, if known. The size of the model and the number of explored
+    branch-and-bound nodes are None if the backend does not report them.
+    """
+
+    def __init__(self, status, x=None, s=None, gap=None, build_time=0.0, solve_time=0.0):
+        self.status = status
+        self.x = x
+        self.s = s
+        self.gap = gap
+        self.build_time = build_time
+        self.solve_time = solve_time
+        self.num_variables = None
+        self.num_constraints = None
+        self.num_nonzeros = None
+        self.num_nodes = None
+
+    @property
+    def has_assignment(self):
+        return self.x is not None
+
+
+class Cancelled(Exception):
+    """Raised by solves of a process which were cancelled with `cancel`."""
+
+
+def cancel():
+    """Stop the solves of this process, e.g. from another thread as their request is stale.
+
+    Running Gurobi solves are interrupted, while CBC runs as a separate program until it
+    finishes. All solves then raise `Cancelled`, as do further solves until `resume`.
+    """
+    global _cancelled
+    with _cancel_lock:
+        _cancelled = True
+        for model in _running_models:
+            model.terminate()
+
+
+def resume():
+    """Let solves of this process run again after `cancel`."""
+    global _cancelled
+    with _cancel_lock:
+        _cancelled = False
+
+
+def _start_solve(model=None):
+    """Raise `Cancelled` if cancelled, or else keep a Gurobi model to interrupt."""
+    with _cancel_lock:
+        if _cancelled:
+            raise Cancelled()
+        if model is not None:
+            _running_models.add(model)
+
+
+def _end_solve(model=None):
+    """Forget a Gurobi model and raise `Cancelled` if the solve was cancelled."""
+    with _cancel_lock:
+        _running_models.discard(model)
+        if _cancelled:
+            raise Cancelled()
+
+
+class Backend(object):
+    """Interface of solver backends.
+
+    Exact backends find an optimal assignment and respect `fixed_min_ratio`.
+    """
+
+    name = ''
+    exact = True
+
+    def is_available(self):
+        """Whether the backend can be used in this environment."""
+        raise NotImplementedError()
+
+    def solve(self, problem, readable_names=False, time_limit=None, mip_gap=None, start=None,
+              threads=None, incumbent=None):
+        """Maximize the objective of an AssignmentProblem and return a Solution.
+
+        The solve stops after `time_limit` seconds or once the relative MIP gap is below
+        `mip_gap`, returning the best assignment found so far. `start` is an optional
+        (x, s) assignment to start from, e.g. that of a previous solve, which need not be
+        feasible. The solver uses at most `threads` threads, or its default if None.
+        `incumbent` is called with (x, s, gap) of each new incumbent found while solving,
+        if the backend reports them. `gap` is None if unknown.
+        """
+        raise NotImplementedError()
+
+
+def _feasible_start(problem, start):
+    """Complete a start assignment with the greedy heuristic to a feasible one.
+
+    Output:
+        (x, s, user_has_element, min_ratio_unique_elements) values of all variables
+    """
+    x, s = heuristic.greedy_assignment(problem, start=start[0] > 0.5)
+    x, s = problem.order_symmetric(x, s)
+    user_has_element, min_ratio = problem.completeness(x)
+    low, high = _min_ratio_bounds(problem)
+    return x, s, user_has_element, min(max(min_ratio, low), high)
+
+
+def _min_ratio_bounds(problem):
+    if problem.fixed_min_ratio is not None:
+        return problem.fixed_min_ratio, problem.fixed_min_ratio
+    return 0.0, 1.0
+
+
+class GurobiBackend(Backend):
+    """Solve with Gurobi using the matrix API.
+
+    By default, x and s are linked by indicator constraints. With `big_m`, they are linked
+    by linear bounds instead, which hold the same assignments: s = 0 if x = 0 and
+    pair_min_area <= s <= pair_max_area otherwise, where pair_max_area is at most the
+    area of the device. The LP relaxation is then solved directly instead of branching on
+    indicators. Areas are continuous, as no constraint needs them to be integral, and
+    user_has_element is binary. min_ratio_unique_elements is also bounded by the lowest
+    completeness that the users could reach with all their coverable elements shown.
+    """
+
+    name = 'gurobi'
+
+    def is_available(self):
+        return gurobipy is not None
+
+    def solve(self, problem, readable_names=False, time_limit=None, mip_gap=None, start=None,
+              threads=None, incumbent=None):
+        env = gurobi_environments.acquire()
+        try:
+            return self._solve(env, problem, readable_names, time_limit, mip_gap, start,
+                               threads, incumbent)
+        finally:
+            gurobi_environments.release(env)
+
+    def _solve(self, env, problem, readable_names, time_limit, mip_gap, start, threads,
+               incumbent):
+        GRB = gurobipy.GRB
+        start_time = time.time()
+
+        num_pairs = problem.num_pairs
+        num_coverages = problem.num_coverages
+
+        # Create empty model
+        model = gurobipy.Model('device_assignment', env=env)
+        model.params.LogToConsole = 0  # Uncomment to see logs in console
+        if time_limit is not None:
+            model.params.TimeLimit = time_limit
+        if mip_gap is not None:
+            model.params.MIPGap = mip_gap
+        if threads is not None:
+            model.params.Threads = threads
+
+        def names(prefix, suffixes):
+            if not readable_names:
+                return ''
+            return ['%s_%s' % (prefix, suffix) for suffix in suffixes]
+
+        pair_names = problem.pair_names() if readable_names else []
+        coverage_names = problem.coverage_names() if readable_names else []
+
+        # (2) Add decision variables
+        x = model.addMVar(num_pairs, vtype=GRB.BINARY, name=names('x', pair_names))
+        if big_m:
+            s = model.addMVar(num_pairs, vtype=GRB.CONTINUOUS, ub=problem.pair_max_area,
+                              name=names('s', pair_names))
+        else:
+            s = model.addMVar(num_pairs, vtype=GRB.SEMIINT, name=names('s', pair_names))
+
+        # (10) sum of widget areas shouldn't exceed device capacity (area)
+        model.addMConstr(problem.capacity_pairs, s, GRB.LESS_EQUAL,
+                         problem.device_area[problem.capacity_devices],
+                         name=names('capacity_constraint',
+                                    [problem.device_names[d] for d in problem.capacity_devices]))
+
+        if not big_m:
+            # (9) Set s to zero if x is zero
+            model.addGenConstrIndicator(x, False, s, GRB.EQUAL, 0.0)
+
+            # (9) Ensure s within possible min/max
+            model.addGenConstrIndicator(x, True, s, GRB.GREATER_EQUAL, problem.pair_min_area)
+            model.addGenConstrIndicator(x, True, s, GRB.LESS_EQUAL, problem.pair_max_area)
+
+        # Order interchangeable devices and elements
+        for order_pairs, variables, name in [(problem.device_order_pairs, s, 'device_order'),
+                                             (problem.element_order_pairs, x, 'element_order')]:
+            if order_pairs.shape[0] > 0:
+                model.addMConstr(order_pairs, variables, GRB.GREATER_EQUAL,
+                                 np.zeros(order_pairs.shape[0]),
+                                 name=names(name, range(order_pairs.shape[0])))
+
+        # (6) whether element has been made available to user
+        user_has_element = model.addMVar(num_coverages,
+                                         vtype=GRB.BINARY if big_m else GRB.SEMIINT, ub=1.0,
+                                         name=names('user_has_element', coverage_names))
+
+        # (7) completeness ratio of user with min. completeness
+        min_ratio_bounds = _min_ratio_bounds(problem)
+        if big_m and problem.fixed_min_ratio is None and len(problem.ratio_users) > 0:
+            max_ratios = problem.ratio_offset + np.asarray(problem.user_ratios.sum(axis=1)).ravel()
+            min_ratio_bounds = (0.0, min(1.0, max_ratios.min()))
+        min_ratio_unique_elements = model.addMVar(1, vtype=GRB.CONTINUOUS,
+                                                  lb=min_ratio_bounds[0], ub=min_ratio_bounds[1],
+                                                  name='min_ratio_unique_elements')
+        model.update()
+
+        # Constraints below span several variable blocks and are given over all variables in
+        # the order [x, s, user_has_element, min_ratio_unique_elements].
+        def all_variables(num_rows, x_block=None, s_block=None, user_has_element_block=None,
+                          min_ratio_block=None):
+            blocks = [x_block, s_block, user_has_element_block, min_ratio_block]
+            sizes = [num_pairs, num_pairs, num_coverages, 1]
+            return sp.hstack([sp.csr_matrix(b) if b is not None else sp.csr_matrix((num_rows, n))
+                              for b, n in zip(blocks, sizes)]).tocsr()
+
+        if big_m:
+            # (9) s = 0 if x = 0 and min. area <= s <= max. area if x = 1
+            identity = sp.identity(num_pairs)
+            model.addMConstr(all_variables(num_pairs, x_block=sp.diags(problem.pair_min_area),
+                                           s_block=-identity),
+                             None, GRB.LESS_EQUAL, np.zeros(num_pairs),
+                             name=names('min_area_constraint', pair_names))
+            model.addMConstr(all_variables(num_pairs, x_block=-sp.diags(problem.pair_max_area),
+                                           s_block=identity),
+                             None, GRB.LESS_EQUAL, np.zeros(num_pairs),
+                             name=names('max_area_constraint', pair_names))
+
+        # (6) the element has to be assigned to at least one of the user's devices
+        model.addMConstr(all_variables(num_coverages, x_block=-problem.coverage_pairs,
+                                       user_has_element_block=sp.identity(num_coverages)),
+                         None, GRB.LESS_EQUAL, np.zeros(num_coverages),
+                         name=names('user_has_element_constraint', coverage_names))
+
+        # (7) for all users with elements to see
+        num_ratios = len(problem.ratio_users)
+        model.addMConstr(all_variables(num_ratios, user_has_element_block=-problem.user_ratios,
+                                       min_ratio_block=np.ones((num_ratios, 1))),
+                         None, GRB.LESS_EQUAL, problem.ratio_offset,
+                         name=names('min_ratio_constraint',
+                                    [problem.user_names[u] for u in problem.ratio_users]))
+
+        # (3) Maximize summed area of elements weighted by importance and compatibility
+        quality_term = np.zeros(model.NumVars)
+        quality_term[num_pairs:2 * num_pairs] = problem.pair_quality
+
+        # (8) Term for trying to assign all available elements
+        completeness_term = np.zeros(model.NumVars)
+        completeness_term[2 * num_pairs:2 * num_pairs + num_coverages] = problem.coverage_weight
+
+        # (8) Additional term: ensure minimum coverage is optimized more
+        completeness_term[-1] = 1.0
+
+        # (1) Register objective function terms. Both terms have the same priority, so give
+        # their weighted sum as a single objective, which keeps the MIP gap available.
+        model.ModelSense = GRB.MAXIMIZE
+        model.setAttr(GRB.Attr.Obj, model.getVars(),
+                      problem.quality_weight * quality_term
+                      + problem.completeness_weight * completeness_term)
+        model.update()
+
+        # Start from a given assignment as MIP start
+        if start is not None:
+            for variables, values in zip([x, s, user_has_element, min_ratio_unique_elements],
+                                         _feasible_start(problem, start)):
+                variables.Start = values
+
+        # Report new incumbents from a callback
+        callback = None
+        if incumbent is not None:
+            def callback(model, where):
+                if where == GRB.Callback.MIPSOL:
+                    objective = model.cbGet(GRB.Callback.MIPSOL_OBJ)
+                    bound = model.cbGet(GRB.Callback.MIPSOL_OBJBND)
+                    gap = abs(bound - objective) / abs(objective) \
+                        if objective != 0 and abs(bound) < GRB.INFINITY else None
+                    incumbent(model.cbGetSolution(x), model.cbGetSolution(s), gap)
+
+        # Solve
+        build_end_time = time.time()
+        _start_solve(model)
+        try:
+            model.optimize(callback)
+        finally:
+            _end_solve(model)
+        end_time = time.time()
+
+        solution = Solution(status=_gurobi_status_names.get(model.status, str(model.status)),
+                            build_time=build_end_time - start_time,
+                            solve_time=end_time - build_end_time)
+        solution.num_variables = model.NumVars
+        solution.num_constraints = model.NumConstrs + model.NumGenConstrs
+        solution.num_nonzeros = model.NumNZs
+        solution.num_nodes = int(model.NodeCount) if model.IsMIP else 0
+        if model.SolCount > 0:
+            solution.x = x.X
+            solution.s = s.X
+            solution.gap = model.MIPGap if model.IsMIP else 0.0
+        model.dispose()
+        return solution
+
+
+class GurobiEnvironments(object):
+    """Pool of started Gurobi environments of the current process.
+
+    Starting an environment checks the licence, which takes long compared to solving a
+    small room, so environments are kept for the lifetime of the process. A solve acquires
+    an environment which no other thread uses and releases it afterwards, so concurrent
+    solves in several threads each get their own.
+
+    Environments must not be shared with forked processes, such as those of
+    `decomposition` and `dispatcher`, so a forked process starts its own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._idle = []
+        self.created = 0
+
+    def acquire(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._idle = []
+                self.created = 0
+            if len(self._idle) > 0:
+                return self._idle.pop()
+            self.created += 1
+        env = gurobipy.Env(empty=True)
+        env.setParam('OutputFlag', 0)
+        env.start()
+        return env
+
+    def release(self, env):
+        with self._lock:
+            if self._pid == os.getpid():
+                self._idle.append(env)
+
+
+gurobi_environments = GurobiEnvironments()
+
+
+_gurobi_status_names = {
+    2: 'optimal',
+    3: 'infeasible',
+    4: 'infeasible_or_unbounded',
+    5: 'unbounded',
+    9: 'time_limit',
+    11: 'interrupted',
+}
+
+
+class CbcBackend(Backend):
+    """Solve with the open-source COIN-OR CBC solver as bundled with PuLP.
+
+    CBC runs as a separate program, which does not report incumbents while solving.
+    """
+
+    name = 'cbc'
+
+    def is_available(self):
+        return pulp is not None and pulp.PULP_CBC_CMD(msg=0).available()
+
+    def solve(self, problem, readable_names=False, time_limit=None, mip_gap=None, start=None,
+              threads=None, incumbent=None):
+        start_time = time.time()
+
+        num_pairs = problem.num_pairs
+        num_coverages = problem.num_coverages
+
+        # PuLP requires unique names, so fall back to indices if not human-readable
+        if readable_names:
+            pair_names = problem.pair_names()
+            coverage_names = problem.coverage_names()
+        else:
+            pair_names = [str(p) for p in range(num_pairs)]
+            coverage_names = [str(k) for k in range(num_coverages)]
+
+        model = pulp.LpProblem('device_assignment', pulp.LpMaximize)
+
+        # (2) Add decision variables
+        x = [pulp.LpVariable('x_%s' % n, cat=pulp.LpBinary) for n in pair_names]
+        s = [pulp.LpVariable('s_%s' % n, lowBound=0, cat=pulp.LpInteger) for n in pair_names]
+
+        # (10) sum of widget areas shouldn't exceed device capacity (area)
+        capacity_pairs = problem.capacity_pairs.tolil()
+        for row, d in enumerate(problem.capacity_devices):
+            model += pulp.lpSum(s[p] for p in capacity_pairs.rows[row]) <= problem.device_area[d]
+
+        # (9) Set s to zero if x is zero and ensure s within possible min/max. CBC has no
+        # indicator constraints, so use the equivalent linear bounds on s.
+        for p in range(num_pairs):
+            model += s[p] >= problem.pair_min_area[p] * x[p]
+            model += s[p] <= problem.pair_max_area[p] * x[p]
+
+        # Order interchangeable devices and elements
+        for order_pairs, variables in [(problem.device_order_pairs, s),
+                                       (problem.element_order_pairs, x)]:
+            order_pairs = order_pairs.tolil()
+            for row in range(order_pairs.shape[0]):
+                model += pulp.lpSum(value * variables[p] for p, value
+                                    in zip(order_pairs.rows[row], order_pairs.data[row])) >= 0
+
+        # (6) whether element has been made available to user
+        user_has_element = [pulp.LpVariable('user_has_element_%s' % n, cat=pulp.LpBinary)
+                            for n in coverage_names]
+
+        # (7) completeness ratio of user with min. completeness
+        min_ratio_unique_elements = pulp.LpVariable('min_ratio_unique_elements',
+                                                    *_min_ratio_bounds(problem))
+
+        # (6) the element has to be assigned to at least one of the user's devices
+        coverage_pairs = problem.coverage_pairs.tolil()
+        for k in range(num_coverages):
+            model += user_has_element[k] <= pulp.lpSum(x[p] for p in coverage_pairs.rows[k])
+
+        # (7) for all users with elements to see
+        user_ratios = problem.user_ratios.tolil()
+        for row in range(len(problem.ratio_users)):
+            model += min_ratio_unique_elements <= pulp.lpSum(
+                value * user_has_element[k]
+                for k, value in zip(user_ratios.rows[row], user_ratios.data[row])) \
+                + problem.ratio_offset[row]
+
+        # (1) Objective function of blended quality (3) and completeness (8) terms
+        model += problem.quality_weight * pulp.lpSum(
+            problem.pair_quality[p] * s[p] for p in range(num_pairs)) \
+            + problem.completeness_weight * (pulp.lpSum(
+                problem.coverage_weight[k] * user_has_element[k] for k in range(num_coverages))
+                + min_ratio_unique_elements)
+
+        # Start from a given assignment
+        if start is not None:
+            values = _feasible_start(problem, start)
+            for variables, variable_values in zip([x, s, user_has_element], values):
+                for variable, value in zip(variables, variable_values):
+                    variable.setInitialValue(value)
+            min_ratio_unique_elements.setInitialValue(values[3])
+
+        # Solve
+        build_end_time = time.time()
+        _start_solve()
+        try:
+            model.solve(pulp.PULP_CBC_CMD(msg=0, timeLimit=time_limit, gapRel=mip_gap,
+                                          warmStart=start is not None, threads=threads))
+        finally:
+            _end_solve()
+        end_time = time.time()
+
+        solution = Solution(status=pulp.LpStatus[model.status].lower().replace(' ', '_'),
+                            build_time=build_end_time - start_time,
+                            solve_time=end_time - build_end_time)
+        solution.num_variables = len(x) + len(s) + len(user_has_element) + 1
+        solution.num_constraints = len(model.constraints)
+        solution.num_nonzeros = sum(len(c) for c in model.constraints.values())
+        # CBC reports an incumbent of a stopped solve as optimal, but not its gap
+        if model.sol_status == pulp.LpSolutionIntegerFeasible:
+            solution.status = 'time_limit'
+        elif model.sol_status == pulp.LpSolutionOptimal and mip_gap is None:
+            solution.gap = 0.0
+        if model.sol_status in [pulp.LpSolutionOptimal, pulp.LpSolutionIntegerFeasible]:
+            solution.x = np.array([v.varValue for v in x], dtype=np.float64)
+            solution.s = np.array([v.varValue for v in s], dtype=np.float64)
+        return solution
+
+
+class GreedyBackend(Backend):
+    """Approximate the optimum with a fast greedy heuristic and local search.
+
+    Only uses NumPy, so it is always available and runs in a fraction of the time of an
+    exact solve. Its objective value can be compared against the exact backends. The gap
+    is unknown and `time_limit`, `mip_gap`, `threads` and `incumbent` are ignored.
+    """
+
+    name = 'greedy'
+    exact = False
+
+    def is_available(self):
+        return True
+
+    def solve(self, problem, readable_names=False, time_limit=None, mip_gap=None, start=None,
+              threads=None, incumbent=None):
+        start_time = time.time()
+        _start_solve()
+        try:
+            x, s = heuristic.greedy_assignment(
+                problem, start=start[0] > 0.5 if start is not None else None)
+        finally:
+            _end_solve()
+        return Solution(status='heuristic', x=x, s=s, solve_time=time.time() - start_time)
+
+
+BACKENDS = dict((backend.name, backend)
+                for backend in [GurobiBackend, CbcBackend, GreedyBackend])
+
+
+def get_backend(name):
+    """Create the backend registered under a name, e.g. 'gurobi' or 'cbc'."""
+    if name not in BACKENDS:
+        raise ValueError('Unknown solver backend "%s". Choose from: %s'
+                         % (name, ', '.join(sorted(BACKENDS.keys()))))
+    backend = BACKENDS[name]()
+    if not backend.is_available():
+        raise RuntimeError('Solver backend "%s" is not available. Is it installed?' % name)
+    return backend
@@ -0,0 +1,108 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Check keys of rooms and answers from the solution cache."""
+import json
+
+from user import User
+from device import Device
+from element import Element
+from properties import Properties
+from test_pre_process_objects import random_problem
+import cache
+import codec
+import optimize
+
+
+def twin_users_room():
+    """Room with two users of the same name and importances but different devices."""
+    a, b = User(name='twin', id='a'), User(name='twin', id='b')
+    shared = Element('shared', 5, 10, 100, 10, 100, Properties(5, 0, 0, 0))
+    private = Element('private', 5, 10, 100, 10, 100, Properties(5, 0, 0, 0))
+    private.user_give_access([a])
+    devices = [Device('phone', 100, 100, Properties(5, 0, 0, 0), users=[a]),
+               Device('tv', 300, 300, Properties(5, 0, 0, 0), users=[a, b]),
+               Device('watch', 20, 20, Properties(5, 0, 0, 0), users=[b])]
+    return [shared, private], devices, [a, b]
+
+
+def test_canonical_key_does_not_depend_on_order():
+    elements, devices, users = twin_users_room()
+    key = cache.canonical_key(elements, devices, users, 'gurobi')
+    for order in [[1, 0], [0, 1]]:
+        reordered = [users[u] for u in order]
+        assert cache.canonical_key(elements[::-1], devices[::-1], reordered, 'gurobi') == key
+
+    # Renamed user ids give the same key, while a changed room or option does not
+    renamed_elements, renamed_devices, renamed_users = twin_users_room()
+    for user in renamed_users:
+        user.id = 'other-' + user.id
+    assert cache.canonical_key(renamed_elements, renamed_devices, renamed_users,
+                               'gurobi') == key
+    assert cache.canonical_key(elements, devices, users, 'cbc') != key
+    devices[2].users = [users[0]]
+    assert cache.canonical_key(elements, devices, users, 'gurobi') != key
+
+
+def test_lru_cache_evicts_least_recently_used():
+    lru = cache.LRUCache(2)
+    lru.put('a', 1)
+    lru.put('b', 2)
+    assert lru.get('a') == 1
+    lru.put('c', 3)
+    assert lru.get('b') is None
+    assert lru.get('a') == 1 and lru.get('c') == 3
+    assert len(lru) == 2
+    assert (lru.hits, lru.misses) == (3, 1)
+
+
+def test_handle_web_input_answers_from_cache():
+    solution_cache = cache.LRUCache(4)
+
+    def solve(seed):
+        elements, devices, users = random_problem(seed, 6, 3, 3)
+        reply = optimize.handle_web_input(
+            {'token': 't', 'objects': (elements, devices, users),
+             'options': {'stats': True}}, backend='greedy', cache=solution_cache)
+        sizes = dict((e.name, dict(getattr(e, '_optimizer_size', {}))) for e in elements)
+        return json.loads(reply), sizes
+
+    first, first_sizes = solve(0)
+    assert (solution_cache.hits, solution_cache.misses) == (0, 1)
+    assert 'cached' not in first['stats']
+
+    second, second_sizes = solve(0)
+    assert (solution_cache.hits, solution_cache.misses) == (1, 1)
+    assert second['stats']['cached']
+    assert second['data'] == first['data']
+    assert second_sizes == first_sizes
+    assert any(len(sizes) > 0 for sizes in second_sizes.values())
+
+    solve(1)
+    assert (solution_cache.hits, solution_cache.misses) == (1, 2)
+
+
+def test_handle_web_input_cache_hit_for_reordered_request():
+    solution_cache = cache.LRUCache(4)
+    elements, devices, users = twin_users_room()
+    optimize.handle_web_input(codec.encode_request(elements, devices, users),
+                              backend='greedy', cache=solution_cache)
+    optimize.handle_web_input(codec.encode_request(elements, devices, users[::-1]),
+                              backend='greedy', cache=solution_cache)
+    assert (solution_cache.hits, solution_cache.misses) == (1, 1)
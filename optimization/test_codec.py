@@ -0,0 +1,115 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Check that requests survive encoding and decoding."""
+import numpy as np
+import pytest
+
+from problem_arrays import ProblemArrays
+from properties import Properties
+from test_pre_process_objects import random_problem
+import codec
+
+
+def room_fields(elements, devices, users):
+    """Comparable fields of a room, with users given by name."""
+    def names(user_list):
+        return sorted(user.name for user in user_list)
+    return ([(e.name, e.importance, e.min_width, e.max_width, e.min_height, e.max_height,
+              bytes(e.requirements.vector), names(e.allowed_users), names(e.prohibited_users))
+             for e in elements],
+            [(d.name, d.width, d.height, bytes(d.affordances.vector), names(d.users))
+             for d in devices],
+            [(u.name, u.id, sorted(u.importance.items())) for u in users])
+
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_request_round_trip(binary):
+    if binary and codec.msgpack is None:
+        pytest.skip('msgpack is not installed')
+    for seed in range(20):
+        elements, devices, users = random_problem(seed, 8, 5, 4)
+        message = codec.encode_request(elements, devices, users, token='t',
+                                       options={'time_limit': 0.5}, binary=binary)
+        decoded_elements, decoded_devices, decoded_users, token, options = \
+            codec.decode_request(message, binary=binary)
+        assert token == 't'
+        assert options == {'time_limit': 0.5}
+        assert room_fields(decoded_elements, decoded_devices, decoded_users) \
+            == room_fields(elements, devices, users)
+        assert np.array_equal(
+            ProblemArrays.from_objects(decoded_elements, decoded_devices,
+                                       decoded_users).user_element_access,
+            ProblemArrays.from_objects(elements, devices, users).user_element_access)
+
+
+def test_request_round_trip_restricted_users():
+    elements, devices, users = random_problem(0, 3, 2, 3)
+    elements[0].prohibited_users, elements[0].allowed_users = (), [users[1]]
+    elements[1].allowed_users, elements[1].prohibited_users = (), [users[0], users[2]]
+    decoded_elements, _, _, _, _ = codec.decode_request(
+        codec.encode_request(elements, devices, users))
+    assert [u.name for u in decoded_elements[0].allowed_users] == [users[1].name]
+    assert decoded_elements[0].prohibited_users == ()
+    assert decoded_elements[1].allowed_users == ()
+    assert [u.name for u in decoded_elements[1].prohibited_users] \
+        == [users[0].name, users[2].name]
+
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_properties_round_trip(binary):
+    if binary and codec.msgpack is None:
+        pytest.skip('msgpack is not installed')
+    elements, devices, users = random_problem(0, 6, 6, 2)
+    for i, (element, device) in enumerate(zip(elements, devices)):
+        element.requirements = Properties(*[(i + j) % 6 for j in range(4)])
+        device.affordances = Properties(*[5 - (i + j) % 6 for j in range(4)])
+    decoded_elements, decoded_devices, _, _, _ = codec.decode_request(
+        codec.encode_request(elements, devices, users, binary=binary), binary=binary)
+    for element, decoded in zip(elements, decoded_elements):
+        assert [getattr(decoded.requirements, name) for name in Properties.names] \
+            == [getattr(element.requirements, name) for name in Properties.names]
+    for device, decoded in zip(devices, decoded_devices):
+        assert bytes(decoded.affordances.vector) == bytes(device.affordances.vector)
+
+
+def test_properties_must_be_whole_numbers():
+    assert Properties(1.0, 2, 3, 5).vector == bytearray([1, 2, 3, 5])
+    for value in [2.5, -1, 6, 5.01]:
+        with pytest.raises(ValueError):
+            Properties(value)
+        properties = Properties()
+        with pytest.raises(ValueError):
+            properties.text_input = value
+        assert properties.text_input == 0
+
+    # Fractional values in requests are not truncated
+    elements, devices, users = random_problem(0, 2, 2, 2)
+    message = codec.loads(codec.encode_request(elements, devices, users))
+    message['data']['elements'][0]['requirements']['text_input'] = 2.5
+    with pytest.raises(ValueError):
+        codec.decode_request(codec.dumps(message))
+
+
+def test_binary_without_msgpack(monkeypatch):
+    monkeypatch.setattr(codec, 'msgpack', None)
+    with pytest.raises(ValueError):
+        codec.dumps({'token': 't'}, binary=True)
+    with pytest.raises(ValueError):
+        codec.loads(b'', binary=True)
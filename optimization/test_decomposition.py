@@ -0,0 +1,126 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Check that solving independent parts finds the optimum of the whole problem."""
+import numpy as np
+import pytest
+
+from user import User
+from device import Device
+from element import Element
+from properties import Properties
+from formulation import formulate
+from optimize_device_assignment import pre_process_arrays
+from problem_arrays import ProblemArrays
+import decomposition
+import solvers
+
+cbc = solvers.CbcBackend()
+requires_cbc = pytest.mark.skipif(not cbc.is_available(), reason='CBC is not installed')
+
+
+@pytest.fixture(scope='module', autouse=True)
+def close_pool():
+    yield
+    if decomposition._pool is not None:
+        decomposition._pool.terminate()
+        decomposition._pool = None
+
+
+def component_problem(seed, components):
+    """AssignmentProblem of a room whose users only share devices within components.
+
+    Each component is given as (number of users, number of devices, device size). Every
+    user of a component has access to all of its devices.
+    """
+    rng = np.random.RandomState(seed)
+
+    def random_properties():
+        return Properties(*[int(v) for v in rng.randint(0, 6, size=4)])
+
+    elements = [Element(name='element%03d' % e, importance=int(rng.randint(1, 10)),
+                        min_width=10, max_width=100, min_height=10, max_height=100,
+                        requirements=random_properties())
+                for e in range(8)]
+    devices, users = [], []
+    for c, (num_users, num_devices, size) in enumerate(components):
+        component_users = [User(name='user%d_%d' % (c, u)) for u in range(num_users)]
+        for user in component_users:
+            for element in elements:
+                if rng.random_sample() < 0.3:
+                    user.importance[element.name] = float(rng.randint(0, 10))
+        devices += [Device(name='device%d_%d' % (c, d), width=size, height=size,
+                           affordances=random_properties(), users=component_users)
+                    for d in range(num_devices)]
+        users += component_users
+
+    arrays = ProblemArrays.from_objects(elements, devices, users)
+    _, element_device_imp, element_device_comp, user_device_access, user_element_access = \
+        pre_process_arrays(arrays)
+    return formulate(arrays, element_device_imp, element_device_comp, user_device_access,
+                     user_element_access)
+
+
+@requires_cbc
+@pytest.mark.parametrize('seed, components', [
+    (0, [(1, 1, 100), (1, 2, 100)]),
+    (1, [(2, 2, 60), (1, 1, 80), (3, 3, 100)]),
+    # The single small device of the first component bounds the min. completeness, while
+    # the last component is the largest
+    (2, [(1, 1, 20), (2, 3, 100), (3, 4, 100)]),
+    (3, [(2, 3, 100), (1, 1, 30), (2, 4, 100)]),
+])
+def test_solve_matches_whole_problem(monkeypatch, seed, components):
+    monkeypatch.setattr(decomposition, 'min_part_size', 1)
+    problem = component_problem(seed, components)
+    parts, _ = decomposition.split(problem, len(components))
+    assert len(parts) == len(components)
+
+    expected = cbc.solve(problem)
+    actual = decomposition.solve(cbc, problem, processes=len(components))
+    assert actual.status == 'optimal'
+    assert np.isclose(problem.objective(actual.x, actual.s),
+                      problem.objective(expected.x, expected.s))
+
+
+@requires_cbc
+def test_solve_binding_min_ratio_in_small_component(monkeypatch):
+    monkeypatch.setattr(decomposition, 'min_part_size', 1)
+    problem = component_problem(2, [(1, 1, 20), (2, 3, 100), (3, 4, 100)])
+    solution = decomposition.solve(cbc, problem, processes=3)
+    ratios = problem.user_ratios.dot(problem.completeness(solution.x)[0])
+    assert ratios.min() < 1.0
+    assert problem.user_names[problem.ratio_users[ratios.argmin()]] == 'user0_0'
+
+
+@requires_cbc
+def test_solve_shares_time_limit(monkeypatch):
+    monkeypatch.setattr(decomposition, 'min_part_size', 1)
+    time_limits = []
+
+    def sequential_map(function, tasks, processes):
+        time_limits.extend(task[3] for task in tasks)
+        return [function(task) for task in tasks]
+    monkeypatch.setattr(decomposition, '_map', sequential_map)
+
+    problem = component_problem(2, [(1, 1, 20), (2, 3, 100), (3, 4, 100)])
+    decomposition.solve(cbc, problem, processes=3, time_limit=30.0)
+    assert len(time_limits) > 3
+    assert all(0.0 <= t <= 30.0 for t in time_limits)
+    assert time_limits == sorted(time_limits, reverse=True)
@@ -0,0 +1,166 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Check cancellation of outdated requests and restarts of workers which died."""
+import json
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from formulation import formulate
+from optimize_device_assignment import pre_process_arrays
+from problem_arrays import ProblemArrays
+from test_pre_process_objects import random_problem
+import codec
+import dispatcher
+import optimize
+import scheduler
+import solvers
+
+
+def fake_handle_web_input(web_input, **kwargs):
+    """Solve 'slow' until cancelled, exit on 'die', hold all threads of the scheduler on
+    'hold', count the 'count <token>' requests of the token in its session and echo other
+    web inputs."""
+    if web_input.startswith('count '):
+        token = web_input.split()[1]
+        count = kwargs['sessions'].get(token) or 0
+        kwargs['sessions'].put(token, count + 1)
+        return json.dumps({'data': count})
+    elif web_input == 'hold':
+        kwargs['scheduler'].acquire(10 ** 6)
+        time.sleep(60)
+    elif web_input == 'slow':
+        arrays = ProblemArrays.from_objects(*random_problem(0, 3, 2, 2))
+        problem = formulate(arrays, *pre_process_arrays(arrays)[1:])
+        while True:
+            solvers.GreedyBackend().solve(problem)
+    elif web_input == 'die':
+        os._exit(1)
+    return json.dumps({'data': web_input})
+
+
+class Replies(object):
+
+    def __init__(self):
+        self.replies = []
+        self._condition = threading.Condition()
+
+    def reply(self, web_output):
+        with self._condition:
+            self.replies.append(json.loads(web_output))
+            self._condition.notify_all()
+
+    def wait(self, count, timeout=30.0):
+        with self._condition:
+            self._condition.wait_for(lambda: len(self.replies) >= count, timeout)
+            return list(self.replies)
+
+
+def wait_until(condition, timeout=30.0):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def fake_dispatcher(monkeypatch):
+    # Workers are forked and inherit the fake handler
+    monkeypatch.setattr(optimize, 'handle_web_input', fake_handle_web_input)
+    request_dispatcher = dispatcher.Dispatcher(1, 4, scheduler=scheduler.Scheduler(2))
+    yield request_dispatcher
+    request_dispatcher.close()
+
+
+def test_running_request_is_cancelled(fake_dispatcher):
+    replies = Replies()
+    assert fake_dispatcher.submit('t', 'slow', replies.reply)
+    time.sleep(0.5)
+    assert fake_dispatcher.submit('t', 'fast', replies.reply)
+    assert replies.wait(1) == [{'data': 'fast'}]
+    summary = fake_dispatcher.summary()
+    assert summary['superseded'] == 1 and summary['restarts'] == 0
+
+
+def test_worker_which_died_is_restarted(fake_dispatcher):
+    replies = Replies()
+    assert fake_dispatcher.submit('a', 'die', replies.reply)
+    assert fake_dispatcher.submit('b', 'after', replies.reply)
+    assert replies.wait(2) == [{'error': 'worker', 'token': 'a'}, {'data': 'after'}]
+    assert fake_dispatcher.summary()['restarts'] == 1
+
+
+def test_threads_of_killed_worker_are_reclaimed(fake_dispatcher):
+    replies = Replies()
+    solve_scheduler = fake_dispatcher._scheduler
+    assert fake_dispatcher.submit('a', 'hold', replies.reply)
+    assert wait_until(lambda: solve_scheduler.summary()['threads_in_use'] == 2)
+    os.kill(fake_dispatcher._workers[0].process.pid, signal.SIGKILL)
+    assert replies.wait(1) == [{'error': 'worker', 'token': 'a'}]
+    assert solve_scheduler.summary()['threads_in_use'] == 0
+    assert fake_dispatcher.submit('b', 'after', replies.reply)
+    assert replies.wait(2)[1] == {'data': 'after'}
+
+
+def test_sessions_do_not_depend_on_worker(monkeypatch):
+    monkeypatch.setattr(optimize, 'handle_web_input', fake_handle_web_input)
+    request_dispatcher = dispatcher.Dispatcher(2, 4, session_size=4)
+    try:
+        replies = Replies()
+        assert request_dispatcher.submit('t', 'count t', replies.reply)
+        assert replies.wait(1) == [{'data': 0}]
+
+        # The first worker is busy, so the second one counts
+        assert request_dispatcher.submit('x', 'slow', replies.reply)
+        assert request_dispatcher.submit('t', 'count t', replies.reply)
+        assert replies.wait(2)[1] == {'data': 1}
+        assert request_dispatcher.submit('x', 'fast', replies.reply)
+        assert replies.wait(3)[2] == {'data': 'fast'}
+        assert request_dispatcher.submit('t', 'count t', replies.reply)
+        assert replies.wait(4)[3] == {'data': 2}
+
+        # Outputs which are dropped do not count
+        assert request_dispatcher.submit('t', 'slow', replies.reply)
+        time.sleep(0.5)
+        assert request_dispatcher.submit('t', 'count t', replies.reply)
+        assert replies.wait(5)[4] == {'data': 3}
+    finally:
+        request_dispatcher.close()
+
+
+@pytest.mark.skipif(not solvers.CbcBackend().is_available(), reason='CBC is not installed')
+def test_progressive_replies_arrive_in_order():
+    request_dispatcher = dispatcher.Dispatcher(2, 4, backend='cbc', progressive=True,
+                                               progress_interval=0.0)
+    try:
+        for seed in range(3):
+            replies = Replies()
+            elements, devices, users = random_problem(seed, 12, 5, 4)
+            assert request_dispatcher.submit('t', codec.encode_request(elements, devices, users),
+                                             replies.reply, progress=replies.reply)
+            assert wait_until(lambda: any(r['progress']['final'] for r in replies.wait(0)))
+            progress = [reply['progress'] for reply in replies.wait(0)]
+            assert [p['sequence'] for p in progress] == list(range(1, len(progress) + 1))
+            assert [p['final'] for p in progress] == [False] * (len(progress) - 1) + [True]
+    finally:
+        request_dispatcher.close()
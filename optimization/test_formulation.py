@@ -0,0 +1,219 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Check the routing of tokens to shards by consistent hashing, and restarts of shards."""
+"""Check that reductions of the model keep its optimum."""
+import numpy as np
+import pytest
+
+from user import User
+from device import Device
+from element import Element
+from properties import Properties
+from formulation import formulate
+from optimize_device_assignment import pre_process_arrays
+from problem_arrays import ProblemArrays
+from test_pre_process_objects import loop_pre_process_objects, random_problem
+import formulation
+import heuristic
+import solvers
+
+cbc = solvers.CbcBackend()
+requires_cbc = pytest.mark.skipif(not cbc.is_available(), reason='CBC is not installed')
+exact_backends = [
+    pytest.param(solvers.CbcBackend(), id='cbc', marks=requires_cbc),
+    pytest.param(solvers.GurobiBackend(), id='gurobi', marks=pytest.mark.skipif(
+        not solvers.GurobiBackend().is_available(), reason='Gurobi is not installed')),
+]
+
+
+def twins_problem(seed):
+    """Room where some users have a twin with the same access but other importances."""
+    elements, devices, users = random_problem(seed, 8, 5, 4)
+    rng = np.random.RandomState(seed)
+    for user in users[:2]:
+        twin = User(name=user.name + '_twin')
+        twin.importance = dict((name, float(rng.randint(1, 10)) if value > 0 else 0.0)
+                               for name, value in user.importance.items())
+        for device in devices:
+            if user in device.users:
+                device.users = list(device.users) + [twin]
+        for element in elements:
+            if user in element.allowed_users:
+                element.allowed_users = element.allowed_users + (twin,)
+            if user in element.prohibited_users:
+                element.prohibited_users = element.prohibited_users + (twin,)
+        users.append(twin)
+    return ProblemArrays.from_objects(elements, devices, users)
+
+
+def problem_of(arrays):
+    return formulate(arrays, *pre_process_arrays(arrays)[1:])
+
+
+def user_coverages(problem, x):
+    """Completeness of each user of the room for an assignment."""
+    user_has_element, _ = problem.completeness(x)
+    class_elements = np.bincount(problem.coverage_user, weights=user_has_element,
+                                 minlength=len(problem.user_names))
+    coverages = class_elements / np.maximum(problem.user_num_elements, 1)
+    return coverages[problem.user_class]
+
+
+@requires_cbc
+@pytest.mark.parametrize('seed', range(8))
+def test_user_classes_keep_optimum(monkeypatch, seed):
+    arrays = twins_problem(seed)
+    grouped = problem_of(arrays)
+    num_users = arrays.num_users
+    assert len(grouped.user_names) < num_users
+    assert grouped.user_class[0] == grouped.user_class[num_users - 2]
+
+    # Formulate every user on their own
+    monkeypatch.setattr(formulation, 'user_classes', lambda user_device_access, _: (
+        np.arange(user_device_access.shape[0]), np.arange(user_device_access.shape[0])))
+    single = problem_of(arrays)
+    assert len(single.user_names) == num_users
+    assert np.array_equal(single.pair_element, grouped.pair_element)
+    assert np.array_equal(single.pair_device, grouped.pair_device)
+
+    grouped_solution, single_solution = cbc.solve(grouped), cbc.solve(single)
+    assert np.isclose(grouped.objective(grouped_solution.x, grouped_solution.s),
+                      single.objective(single_solution.x, single_solution.s))
+    for solution in [grouped_solution, single_solution]:
+        assert np.isclose(grouped.objective(solution.x, solution.s),
+                          single.objective(solution.x, solution.s))
+        assert np.allclose(user_coverages(grouped, solution.x),
+                           user_coverages(single, solution.x))
+
+
+def symmetric_room(seed):
+    """ProblemArrays of a room with groups of identical devices and of identical elements."""
+    rng = np.random.RandomState(seed)
+
+    def random_properties():
+        return Properties(*[int(v) for v in rng.randint(0, 6, size=4)])
+
+    users = [User(name='user%d' % u) for u in range(3)]
+    elements = []
+    for group in range(3):
+        size, requirements = int(rng.randint(10, 40)), random_properties()
+        importance = int(rng.randint(1, 10))
+        elements += [Element('element%d_%d' % (group, e), importance, size, 2 * size, size,
+                             2 * size, requirements) for e in range(int(rng.randint(1, 4)))]
+    devices = []
+    for group in range(3):
+        width, height, affordances = int(rng.randint(40, 120)), int(rng.randint(40, 120)), \
+            random_properties()
+        group_users = [user for user in users if rng.random_sample() < 0.6] or users[:1]
+        devices += [Device('device%d_%d' % (group, d), width, height, affordances,
+                           users=group_users) for d in range(int(rng.randint(1, 4)))]
+    return ProblemArrays.from_objects(elements, devices, users)
+
+
+def satisfies_order(problem, x, s):
+    return np.all(problem.device_order_pairs.dot(s) >= -1e-6) \
+        and np.all(problem.element_order_pairs.dot(x) >= -1e-6)
+
+
+@pytest.mark.parametrize('backend', exact_backends)
+def test_symmetry_breaking_keeps_optimum(monkeypatch, backend):
+    num_rows = 0
+    for seed in range(8):
+        arrays = symmetric_room(seed)
+        ordered = problem_of(arrays)
+        monkeypatch.setattr(formulation, 'break_symmetries', False)
+        unordered = problem_of(arrays)
+        monkeypatch.setattr(formulation, 'break_symmetries', True)
+        assert unordered.device_order_pairs.shape[0] == 0
+        num_rows += ordered.device_order_pairs.shape[0] + ordered.element_order_pairs.shape[0]
+
+        ordered_solution = backend.solve(ordered, mip_gap=1e-6)
+        unordered_solution = backend.solve(unordered, mip_gap=1e-6)
+        assert satisfies_order(ordered, ordered_solution.x, ordered_solution.s)
+        assert np.isclose(ordered.objective(ordered_solution.x, ordered_solution.s),
+                          unordered.objective(unordered_solution.x, unordered_solution.s),
+                          rtol=1e-5)
+    assert num_rows > 0
+
+
+def test_start_satisfies_symmetry_breaking_rows():
+    for seed in range(8):
+        problem = problem_of(symmetric_room(seed))
+        rng = np.random.RandomState(seed)
+        for start_x in [heuristic.greedy_assignment(problem)[0],
+                        (rng.random_sample(problem.num_pairs) < 0.5).astype(np.float64)]:
+            start = (start_x, np.zeros(problem.num_pairs))
+            x, s, user_has_element, min_ratio = solvers._feasible_start(problem, start)
+            assert satisfies_order(problem, x, s)
+            assert np.isclose(problem.objective(x, s),
+                              problem.objective(*heuristic.greedy_assignment(
+                                  problem, start=start_x > 0.5)))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_pruned_pairs_and_rows_match_dense_rules(seed):
+    elements, devices, users = random_problem(seed, 10, 6, 4)
+    # Some elements do not fit on small devices
+    for device in devices[::3]:
+        device.width, device.height = 30, 20
+    for element in elements[::4]:
+        element.min_width = 40
+    arrays = ProblemArrays.from_objects(elements, devices, users)
+    problem = problem_of(arrays)
+    _, element_device_imp, element_device_comp, user_device_access, user_element_access = \
+        loop_pre_process_objects(elements, devices, users)
+    element_device_imp = np.asarray(element_device_imp)
+
+    # Pairs which fit, may be seen by a user of the device and have importance and
+    # compatibility
+    admissible = np.zeros((len(elements), len(devices)), dtype=bool)
+    for e, element in enumerate(elements):
+        for d, device in enumerate(devices):
+            admissible[e, d] = element.min_width <= device.width \
+                and element.min_height <= device.height \
+                and np.any(user_device_access[:, d] & user_element_access[:, e]) \
+                and element_device_imp[e, d] >= 1e-5 and element_device_comp[e, d] >= 1e-5
+    assert sorted(zip(problem.pair_element, problem.pair_device)) \
+        == sorted(zip(*np.nonzero(admissible)))
+
+    # Coverage rows of the elements which may be shown to each user, while the completeness
+    # of a user counts all elements the user has access to
+    for u in range(len(users)):
+        c = problem.user_class[u]
+        coverable = np.any(admissible & user_device_access[u, :], axis=1) \
+            & user_element_access[u, :]
+        assert sorted(problem.coverage_element[problem.coverage_user == c]) \
+            == list(np.flatnonzero(coverable))
+        assert problem.user_num_elements[c] == user_element_access[u, :].sum()
+        if c in problem.ratio_users:
+            ratio_row = problem.user_ratios[list(problem.ratio_users).index(c)]
+            assert np.allclose(ratio_row.data, 1.0 / user_element_access[u, :].sum())
+
+
+def test_elements_which_cannot_be_shown_count_for_completeness():
+    user = User(name='user')
+    elements = [Element('small', 5, 10, 20, 10, 20, Properties(3, 3, 3, 3)),
+                Element('large', 5, 50, 100, 50, 100, Properties(3, 3, 3, 3))]
+    devices = [Device('watch', 30, 30, Properties(3, 3, 3, 3), users=[user])]
+    problem = problem_of(ProblemArrays.from_objects(elements, devices, [user]))
+    assert [problem.element_names[e] for e in problem.pair_element] == ['small']
+    assert list(problem.user_num_elements) == [2]
+    _, min_ratio = problem.completeness(np.ones(problem.num_pairs))
+    assert min_ratio == 0.5
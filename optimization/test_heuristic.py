@@ -0,0 +1,102 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Check that the greedy heuristic finds feasible assignments and only improves them."""
+import numpy as np
+import pytest
+
+from formulation import formulate
+from optimize_device_assignment import pre_process_arrays
+from problem_arrays import ProblemArrays
+from test_pre_process_objects import loop_pre_process_objects, random_problem
+import heuristic
+
+
+def room_problem(seed, num_elements=12, num_devices=5, num_users=4):
+    elements, devices, users = random_problem(seed, num_elements, num_devices, num_users)
+    # Vary the sizes, so both the area bounds of elements and capacities of devices bind
+    rng = np.random.RandomState(seed)
+    for element in elements:
+        element.min_width, element.min_height = rng.randint(10, 60, size=2)
+        element.max_width = element.min_width + rng.randint(0, 80)
+        element.max_height = element.min_height + rng.randint(0, 80)
+    for device in devices:
+        device.width, device.height = rng.randint(30, 150, size=2)
+    arrays = ProblemArrays.from_objects(elements, devices, users)
+    problem = formulate(arrays, *pre_process_arrays(arrays)[1:])
+    return (elements, devices, users), problem
+
+
+def assert_feasible(objects, problem, x, s):
+    """Check an assignment against the rules of the room, not the admissible pairs."""
+    elements, devices, users = objects
+    _, element_device_imp, element_device_comp, user_device_access, user_element_access = \
+        loop_pre_process_objects(elements, devices, users)
+    element_device_imp = np.asarray(element_device_imp)
+
+    assigned = np.flatnonzero(x > 0.5)
+    assert np.all((x < 0.5) | (x > 0.5))
+    assert np.all(s[x < 0.5] == 0.0)
+    used_area = np.zeros(len(devices))
+    for p in assigned:
+        e, d = problem.pair_element[p], problem.pair_device[p]
+        element, device = elements[e], devices[d]
+
+        # Some user of the device may see the element, and the element is not hidden by
+        # the single user access rule or incompatible
+        assert np.any(user_device_access[:, d] & user_element_access[:, e])
+        assert any(element.user_has_access(user) for user in device.users)
+        assert element_device_imp[e, d] >= 1e-5
+        assert element_device_comp[e, d] >= 1e-5
+
+        min_area = element.min_width * element.min_height
+        max_area = min(element.max_width * element.max_height, device.width * device.height)
+        assert element.min_width <= device.width and element.min_height <= device.height
+        assert min_area - 1e-6 <= s[p] <= max_area + 1e-6
+        used_area[d] += s[p]
+    assert np.all(used_area <= np.array([d.width * d.height for d in devices]) + 1e-6)
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_greedy_assignment_is_feasible(seed):
+    objects, problem = room_problem(seed)
+    x, s = heuristic.greedy_assignment(problem)
+    assert_feasible(objects, problem, x, s)
+    assert np.allclose(heuristic.fill_areas(problem, x)[x > 0.5], s[x > 0.5])
+
+    # Seeding with another assignment, which may not fit, stays feasible too
+    start = np.random.RandomState(seed).random_sample(problem.num_pairs) < 0.5
+    x, s = heuristic.greedy_assignment(problem, start=start)
+    assert_feasible(objects, problem, x, s)
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_improve_never_worsens_objective(seed):
+    objects, problem = room_problem(seed)
+    search = heuristic._Search(problem)
+    search.construct()
+    search.raise_min_ratio()
+    objective = problem.objective(search.x.astype(np.float64), search.s)
+    for _ in range(3):
+        search.improve(1)
+        x = search.x.astype(np.float64)
+        assert_feasible(objects, problem, x, search.s)
+        improved = problem.objective(x, search.s)
+        assert improved >= objective - 1e-9
+        objective = improved
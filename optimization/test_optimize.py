@@ -0,0 +1,84 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Check progressive replies of requests and the warm-up of solver environments."""
+import json
+
+import pytest
+
+from test_pre_process_objects import random_problem
+import codec
+import optimize
+import solvers
+
+exact_backends = [
+    pytest.param('cbc', marks=pytest.mark.skipif(
+        not solvers.CbcBackend().is_available(), reason='CBC is not installed')),
+    pytest.param('gurobi', marks=pytest.mark.skipif(
+        not solvers.GurobiBackend().is_available(), reason='Gurobi is not installed'))]
+
+
+def check_progress(replies):
+    """Check that sequence numbers count up and only the last reply is final."""
+    progress = [reply['progress'] for reply in replies]
+    assert [p['sequence'] for p in progress] == list(range(1, len(replies) + 1))
+    assert [p['final'] for p in progress] == [False] * (len(replies) - 1) + [True]
+
+
+@pytest.mark.parametrize('backend', exact_backends)
+def test_progressive_replies_end_with_final(backend):
+    for seed in range(5):
+        elements, devices, users = random_problem(seed, 12, 5, 4)
+        replies = []
+        web_output = optimize.handle_web_input(
+            codec.encode_request(elements, devices, users, token='t',
+                                 options={'progressive': True}),
+            backend=backend, processes=1, progress=lambda r: replies.append(json.loads(r)),
+            progress_interval=0.0)
+        replies.append(json.loads(web_output))
+        # The greedy assignment is passed on before the exact solve
+        assert len(replies) >= 2
+        check_progress(replies)
+        assert replies[-1]['progress']['optimal'] \
+            == (replies[-1]['stats']['status'] == 'optimal')
+
+
+@pytest.mark.skipif(not solvers.GurobiBackend().is_available(),
+                    reason='Gurobi is not installed')
+def test_warm_up_keeps_environment_for_requests():
+    environments = solvers.GurobiEnvironments()
+    original = solvers.gurobi_environments
+    solvers.gurobi_environments = environments
+    try:
+        assert optimize.warm_up(backend='gurobi') > 0.0
+        assert environments.created == 1
+        elements, devices, users = random_problem(0, 12, 5, 4)
+        for _ in range(3):
+            optimize.handle_web_input(codec.encode_request(elements, devices, users),
+                                      backend='gurobi', processes=1)
+        assert environments.created == 1
+
+        # Concurrent solves each get their own environment
+        first, second = environments.acquire(), environments.acquire()
+        assert first is not second and environments.created == 2
+        environments.release(first)
+        environments.release(second)
+        assert environments.acquire() in [first, second]
+    finally:
+        solvers.gurobi_environments = original
@@ -0,0 +1,184 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Check vectorized pre-processing against the original loop-based implementation."""
+import numpy as np
+import pytest
+
+from user import User
+from device import Device
+from element import Element
+from properties import Properties
+from optimize_device_assignment import pre_process_objects
+from problem_arrays import ProblemArrays
+import compatibility
+
+
+def loop_pre_process_objects(elements, devices, users, compatibility_metric='dot'):
+    """Original (loop-based) implementation of `pre_process_objects`."""
+
+    num_elements = len(elements)
+    num_devices = len(devices)
+    num_users = len(users)
+
+    def normalized(vector):
+        v_max = vector.max()
+        v_min = 0.0
+        v_dif = v_max - v_min
+        vector = vector - v_min
+        if v_dif > 1e-6:
+            vector = vector / v_dif
+        return vector
+
+    element_user_imp = np.zeros((num_elements, num_users))
+    element_name_index = dict((element.name, i) for i, element in enumerate(elements))
+    for u, user in enumerate(users):
+        element_user_imp[:, u] = [element.importance for element in elements]
+        for element_name, importance in user.importance.items():
+            if element_name in element_name_index:
+                element_user_imp[element_name_index[element_name], u] = importance
+
+    element_device_comp = np.zeros((num_elements, num_devices))
+    for d, device in enumerate(devices):
+        for e, element in enumerate(elements):
+            element_device_comp[e, d] = device.calculate_compatibility(element, compatibility_metric)
+        element_device_comp[:, d] = normalized(element_device_comp[:, d])
+
+    user_device_access = np.zeros((num_users, num_devices), dtype=bool)
+    for d, device in enumerate(devices):
+        for user in device.users:
+            user_device_access[users.index(user), d] = 1
+
+    user_element_access = np.zeros((num_users, num_elements), dtype=bool)
+    for e, element in enumerate(elements):
+        for u, user in enumerate(users):
+            if element.user_has_access(user):
+                user_element_access[u, e] = 1
+            else:
+                element_user_imp[e, u] = 0
+
+    element_user_imp = np.multiply(element_user_imp, user_element_access.transpose())
+    for u, user in enumerate(users):
+        element_user_imp[:, u] = normalized(element_user_imp[:, u])
+
+    for e, element in enumerate(elements):
+        for u, user in enumerate(users):
+            if element_user_imp[e, u] < 1e-6:
+                user_element_access[u, e] = 0
+
+    element_device_imp = np.asmatrix(element_user_imp) * np.asmatrix(user_device_access)
+    for d, device in enumerate(devices):
+        num_users_on_device = np.sum(user_device_access[:, d])
+        if num_users_on_device > 0:
+            element_device_imp[:, d] /= num_users_on_device
+
+    for d, device in enumerate(devices):
+        for e, element in enumerate(elements):
+            comp = np.multiply(user_element_access[:, e], user_device_access[:, d])
+            if np.count_nonzero(user_device_access[:, d]) > 1 and np.count_nonzero(comp) == 1:
+                element_device_imp[e, d] = 0
+                for u, v in enumerate(comp):
+                    if v == 0:
+                        user_element_access[u, e] = 0
+        element_device_imp[:, d] = normalized(element_device_imp[:, d])
+
+    return element_user_imp, element_device_imp, element_device_comp, user_device_access, \
+           user_element_access
+
+
+def random_problem(seed, num_elements, num_devices, num_users):
+    """Generate a room with private/shared devices and restricted elements."""
+    rng = np.random.RandomState(seed)
+
+    def random_properties():
+        return Properties(*[int(v) for v in rng.randint(0, 6, size=4)])
+
+    users = [User(name='user%03d' % u) for u in range(num_users)]
+    elements = []
+    for e in range(num_elements):
+        element = Element(name='element%03d' % e,
+                          importance=int(rng.randint(0, 10)),
+                          min_width=10, max_width=100, min_height=10, max_height=100,
+                          requirements=random_properties())
+        restriction = rng.randint(0, 4)
+        restricted_users = [user for user in users if rng.random_sample() < 0.3]
+        if restriction == 1 and len(restricted_users) > 0:
+            element.user_give_access(restricted_users)
+        elif restriction == 2 and len(restricted_users) > 0:
+            element.user_prohibit_access(restricted_users)
+        elements.append(element)
+
+    devices = []
+    for d in range(num_devices):
+        if rng.random_sample() < 0.5:
+            device_users = [users[rng.randint(num_users)]]
+        else:
+            device_users = [user for user in users if rng.random_sample() < 0.5]
+        devices.append(Device(name='device%03d' % d, width=100, height=100,
+                              affordances=random_properties(), users=device_users))
+
+    for user in users:
+        for element in elements:
+            if rng.random_sample() < 0.3:
+                user.importance[element.name] = float(rng.randint(0, 3)) * rng.random_sample()
+    return elements, devices, users
+
+
+@pytest.mark.parametrize('metric, table', [('dot', False), ('distance', False),
+                                           ('distance', True)])
+def test_pre_process_objects_matches_loop_implementation(metric, table):
+    for seed in range(50):
+        rng = np.random.RandomState(seed)
+        elements, devices, users = random_problem(seed, *rng.randint(1, 12, size=3))
+        expected = loop_pre_process_objects(elements, devices, users, metric)
+        actual = pre_process_objects(elements, devices, users, metric, table)
+        for expected_matrix, actual_matrix in zip(expected, actual):
+            expected_matrix = np.asarray(expected_matrix)
+            assert actual_matrix.shape == expected_matrix.shape
+            assert actual_matrix.dtype == expected_matrix.dtype
+            assert np.allclose(actual_matrix, expected_matrix)
+
+
+def test_pre_process_objects_single_user_access():
+    # Only "a" can see "secret", so showing it on the shared screen is penalized
+    # and it is then removed from everybody but "a".
+    a, b = User(name='a'), User(name='b')
+    secret = Element('secret', 5, 10, 100, 10, 100, Properties(5, 0, 0, 0))
+    secret.user_give_access([a])
+    public = Element('public', 5, 10, 100, 10, 100, Properties(5, 0, 0, 0))
+    shared = Device('shared', 100, 100, Properties(5, 0, 0, 0), users=[a, b])
+    private = Device('private', 100, 100, Properties(5, 0, 0, 0), users=[a])
+
+    _, element_device_imp, _, _, user_element_access = \
+        pre_process_objects([public, secret], [private, shared], [a, b])
+    assert element_device_imp[1, 1] == 0.0
+    assert element_device_imp[1, 0] > 0.0
+    assert user_element_access.tolist() == [[True, True], [True, False]]
+
+
+def test_compatibility_matrix_matches_device_methods():
+    elements, devices, users = random_problem(0, 30, 20, 3)
+    arrays = ProblemArrays.from_objects(elements, devices, users)
+    for metric, table in [('dot', False), ('distance', False), ('distance', True)]:
+        expected = [[device.calculate_compatibility(element, metric) for device in devices]
+                    for element in elements]
+        actual = compatibility.compatibility_matrix(arrays.element_requirements,
+                                                    arrays.device_affordances, metric,
+                                                    table=table)
+        assert actual.tolist() == expected
@@ -0,0 +1,136 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Check that repairing an assignment after a change keeps the devices it did not free."""
+import numpy as np
+import pytest
+
+from user import User
+from device import Device
+from element import Element
+from properties import Properties
+from formulation import formulate
+from optimize_device_assignment import optimize, pre_process_arrays
+from problem_arrays import ProblemArrays
+from test_heuristic import assert_feasible
+from test_pre_process_objects import random_problem
+import cache
+import decomposition
+import repair
+import solvers
+
+backends = ['greedy', pytest.param('cbc', marks=pytest.mark.skipif(
+    not solvers.CbcBackend().is_available(), reason='CBC is not installed'))]
+
+
+@pytest.fixture(scope='module', autouse=True)
+def close_pool():
+    yield
+    if decomposition._pool is not None:
+        decomposition._pool.terminate()
+        decomposition._pool = None
+
+
+def small_room():
+    """Room of three users, of which only the first may see the private element."""
+    a, b, c = User(name='a'), User(name='b'), User(name='c')
+
+    def element(name, importance, requirements):
+        return Element(name, importance, 10, 60, 10, 60, Properties(*requirements))
+    elements = [element('video', 8, (5, 0, 2, 0)), element('chat', 6, (0, 5, 0, 1)),
+                element('slides', 5, (3, 1, 5, 0)), element('private', 7, (1, 4, 0, 3))]
+    elements[3].user_give_access([a])
+    devices = [Device('a_phone', 60, 100, Properties(2, 5, 1, 3), users=[a]),
+               Device('a_laptop', 120, 80, Properties(4, 3, 5, 2), users=[a]),
+               Device('b_phone', 60, 100, Properties(2, 5, 1, 3), users=[b]),
+               Device('bc_display', 200, 120, Properties(5, 1, 4, 0), users=[b, c]),
+               Device('c_tablet', 80, 100, Properties(3, 4, 3, 2), users=[c])]
+    return elements, devices, [a, b, c]
+
+
+def assignment_of(output):
+    return sorted((element.name, device.name)
+                  for device, assigned in output.items() for element in assigned)
+
+
+def check_repair(elements, devices, users, previous, changes, backend):
+    """Repair an assignment and check it against the previous one.
+
+    Output:
+        names of the devices which were not freed
+    """
+    output, stats = optimize(elements, devices, users, backend=backend, processes=1,
+                             previous=previous, changes=changes)
+    assert stats['status'] in ['optimal', 'heuristic']
+
+    arrays = ProblemArrays.from_objects(elements, devices, users)
+    _, element_device_imp, element_device_comp, user_device_access, user_element_access = \
+        pre_process_arrays(arrays)
+    problem = formulate(arrays, element_device_imp, element_device_comp, user_device_access,
+                        user_element_access)
+    assignment = assignment_of(output)
+    x = problem.pairs_in(assignment).astype(np.float64)
+    assert x.sum() == len(assignment)
+    s = np.array([elements[e]._optimizer_size[devices[d].name] if x[p] > 0.5 else 0.0
+                  for p, (e, d) in enumerate(zip(problem.pair_element, problem.pair_device))])
+    assert_feasible((elements, devices, users), problem, x, s)
+
+    # Devices which were not freed keep their previous elements
+    free = repair.free_devices(problem, arrays.user_names, user_device_access, previous,
+                               changes)
+    assert stats['num_free_devices'] == free.sum()
+    kept = [device.name for d, device in enumerate(devices) if not free[d]]
+    assert not set(stats['changed_devices']) & set(kept)
+    for device in devices:
+        if device.name in kept:
+            assert sorted(element.name for element in output[device]) \
+                == sorted(e for e, d in previous if d == device.name)
+    return kept
+
+
+@pytest.mark.parametrize('backend', backends)
+def test_changed_private_element_keeps_other_devices(backend):
+    elements, devices, users = small_room()
+    output, _ = optimize(elements, devices, users, backend=backend, processes=1)
+    previous = assignment_of(output)
+    old_keys = cache.object_keys(elements, devices, users)
+
+    # The optimizer sorts the room by name
+    [private] = [element for element in elements if element.name == 'private']
+    private.importance = 1
+    changes = cache.changes(old_keys, cache.object_keys(elements, devices, users))
+    assert changes == {'devices': [], 'users': [], 'elements': ['private']}
+    kept = check_repair(elements, devices, users, previous, changes, backend)
+    assert kept == ['b_phone', 'bc_display', 'c_tablet']
+
+
+@pytest.mark.parametrize('backend', backends)
+def test_changed_element_in_random_rooms(backend):
+    num_kept = 0
+    for seed in range(10):
+        elements, devices, users = random_problem(seed, 6, 6, 4)
+        output, _ = optimize(elements, devices, users, backend=backend, processes=1)
+        previous = assignment_of(output)
+        old_keys = cache.object_keys(elements, devices, users)
+
+        element = elements[np.random.RandomState(seed).randint(len(elements))]
+        element.importance = (element.importance + 5) % 10
+        changes = cache.changes(old_keys, cache.object_keys(elements, devices, users))
+        num_kept += len(check_repair(elements, devices, users, previous, changes, backend))
+    assert num_kept > 0
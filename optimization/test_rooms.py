@@ -0,0 +1,188 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Check that deltas change rooms as sending the whole room would."""
+import copy
+import json
+
+import pytest
+
+from test_pre_process_objects import random_problem
+import cache
+import codec
+import optimize
+import rooms
+
+
+def room_data(seed):
+    elements, devices, users = random_problem(seed, 6, 4, 3)
+    return json.loads(codec.encode_request(elements, devices, users))['data']
+
+
+def keys_of(objects):
+    elements, devices, users = objects
+    return cache.object_keys(elements, devices, users)
+
+
+def decoded_keys(data):
+    elements, devices, users, _, _ = codec.decode_request({'token': 't', 'data': data})
+    return cache.object_keys(elements, devices, users)
+
+
+def test_delta_matches_snapshot_of_changed_room():
+    data = room_data(0)
+    client_rooms = rooms.Rooms(4)
+    client_rooms.snapshot('t', copy.deepcopy(data))
+
+    user_ids = [u['id'] for u in data['users']]
+    new_device = dict(data['devices'][0], name='phone', users=[user_ids[1], 'newcomer'])
+    new_user = {'__class__': 'User', 'name': 'newcomer', 'id': 'newcomer',
+                'element_importances': {'element000': 3.0}}
+    changed_element = dict(data['elements'][1], importance=9,
+                           prohibited_users=[user_ids[0]])
+    changed_element.pop('allowed_users', None)
+    operations = [
+        {'op': 'add_device', 'device': new_device},
+        {'op': 'add_user', 'user': new_user},
+        {'op': 'update_user_importance', 'id': user_ids[2],
+         'element_importances': {'element002': 0.5}},
+        {'op': 'update_element', 'element': changed_element},
+        {'op': 'remove_element', 'name': 'element003'},
+        {'op': 'remove_user', 'id': user_ids[0]},
+    ]
+    objects = client_rooms.apply('t', 1, operations)
+
+    data['devices'].append(new_device)
+    data['users'].append(new_user)
+    importances = data['users'][2].setdefault('element_importances', {})
+    importances['element002'] = 0.5
+    data['elements'][1] = changed_element
+    del data['elements'][3]
+    del data['users'][0]
+    assert keys_of(objects) == decoded_keys(data)
+
+
+def test_delta_keeps_unchanged_objects():
+    client_rooms = rooms.Rooms(4)
+    elements, devices, users = client_rooms.snapshot('t', room_data(1))
+    changed = dict(codec.object_fields(devices[0]), width=7)
+    new_elements, new_devices, new_users = client_rooms.apply(
+        't', 1, [{'op': 'update_device', 'device': changed}])
+    assert all(a is b for a, b in zip(new_elements, elements))
+    assert all(a is b for a, b in zip(new_users, users))
+    assert new_devices[0] is not devices[0] and new_devices[0].width == 7
+    assert all(a is b for a, b in zip(new_devices[1:], devices[1:]))
+    # Users of the changed device are those of the room
+    assert set(id(u) for u in new_devices[0].users) <= set(id(u) for u in users)
+
+
+def test_user_added_after_device_referring_to_it():
+    data = room_data(2)
+    device = dict(data['devices'][0], name='phone', users=['later'])
+    client_rooms = rooms.Rooms(4)
+    client_rooms.snapshot('t', data)
+    objects = client_rooms.apply('t', 1, [{'op': 'add_device', 'device': device}])
+    assert keys_of(objects)['devices']['phone'][-1] == []
+    objects = client_rooms.apply(
+        't', 2, [{'op': 'add_user', 'user': {'name': 'later', 'id': 'later'}}])
+    assert keys_of(objects)['devices']['phone'][-1] == ['later']
+
+
+def test_version_mismatch():
+    data = room_data(3)
+    client_rooms = rooms.Rooms(4)
+    with pytest.raises(rooms.VersionError) as error:
+        client_rooms.apply('t', 1, [])
+    assert error.value.version is None
+
+    client_rooms.snapshot('t', data, version=5)
+    before = keys_of(client_rooms.apply('t', 6, []))
+    for version in [6, 8, None]:
+        with pytest.raises(rooms.VersionError) as error:
+            client_rooms.apply('t', version, [{'op': 'remove_element', 'name': 'element000'}])
+        assert error.value.version == 6
+    assert keys_of(client_rooms.apply('t', 7, [])) == before
+
+
+def test_invalid_delta_leaves_room_unchanged():
+    data = room_data(4)
+    client_rooms = rooms.Rooms(4)
+    client_rooms.snapshot('t', data)
+    before = keys_of(client_rooms.apply('t', 1, []))
+    for operations in [
+            [{'op': 'remove_element', 'name': 'element000'}, {'op': 'rename_element'}],
+            [{'op': 'remove_user', 'id': data['users'][0]['id']},
+             {'op': 'update_user_importance', 'id': data['users'][0]['id'],
+              'element_importances': {}}]]:
+        with pytest.raises((KeyError, ValueError)):
+            client_rooms.apply('t', 2, operations)
+    assert keys_of(client_rooms.apply('t', 2, [])) == before
+
+
+def test_web_input_of_delta_is_solved():
+    data = room_data(5)
+    client_rooms = rooms.Rooms(4)
+    client_rooms.web_input({'type': 'snapshot', 'token': 't', 'data': data})
+    web_input = client_rooms.web_input({
+        'type': 'delta', 'token': 't', 'version': 1, 'options': {'compact': True},
+        'operations': [{'op': 'remove_device', 'name': data['devices'][0]['name']}]})
+    reply = json.loads(optimize.handle_web_input(web_input, backend='greedy'))
+    assert reply['token'] == 't'
+    assert sorted(reply['data']) == sorted(d['name'] for d in data['devices'][1:])
+
+
+def test_updates_leave_objects_of_earlier_requests_unchanged():
+    data = room_data(6)
+    uid = data['users'][0]['id']
+    data['elements'][0]['allowed_users'] = [uid]
+    data['elements'][0].pop('prohibited_users', None)
+    client_rooms = rooms.Rooms(4)
+    objects = client_rooms.snapshot('t', data)
+    before = keys_of(objects)
+    new_objects = client_rooms.apply('t', 1, [
+        {'op': 'update_user', 'user': dict(data['users'][0], name='renamed')},
+        {'op': 'update_user_importance', 'id': uid,
+         'element_importances': {'element001': 0.5}}])
+    assert keys_of(objects) == before
+    assert keys_of(new_objects) == decoded_keys(dict(data, users=[
+        dict(data['users'][0], name='renamed',
+             element_importances=dict(data['users'][0].get('element_importances', {}),
+                                      element001=0.5))] + data['users'][1:]))
+
+    # Elements and devices refer to the new user
+    user = new_objects[2][0]
+    assert user is not objects[2][0]
+    assert new_objects[0][0].allowed_users == (user,)
+    assert all(user in device.users for device in new_objects[1]
+               if uid in [u.id for u in device.users])
+
+
+def test_sizes_of_removed_devices_are_dropped():
+    data = room_data(7)
+    client_rooms = rooms.Rooms(4)
+    web_input = client_rooms.web_input({'type': 'snapshot', 'token': 't', 'data': data})
+    optimize.handle_web_input(web_input, backend='greedy')
+    elements = web_input['objects'][0]
+    removed = data['devices'][0]['name']
+    assert any(removed in element._optimizer_size for element in elements)
+    web_input = client_rooms.web_input({
+        'type': 'delta', 'token': 't', 'version': 1,
+        'operations': [{'op': 'remove_device', 'name': removed}]})
+    optimize.handle_web_input(web_input, backend='greedy')
+    assert all(removed not in element._optimizer_size for element in elements)
@@ -0,0 +1,117 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Check that the scheduler never hands out more threads than cores, even if holders die."""
+import multiprocessing
+import os
+import random
+import signal
+import threading
+import time
+
+import scheduler
+
+
+def acquired_within(solve_scheduler, seconds):
+    """Threads granted to a solve, or None if it still waits after some seconds."""
+    granted = []
+    thread = threading.Thread(target=lambda: granted.append(solve_scheduler.acquire(1)))
+    thread.daemon = True
+    thread.start()
+    thread.join(seconds)
+    return granted[0] if granted else None
+
+
+def killed_holder(hold):
+    """Pid of a process which was killed after calling `hold`."""
+    ready = multiprocessing.Event()
+
+    def run():
+        hold()
+        ready.set()
+        time.sleep(60)
+    process = multiprocessing.Process(target=run)
+    process.start()
+    assert ready.wait(10)
+    os.kill(process.pid, signal.SIGKILL)
+    process.join()
+    return process.pid
+
+
+def test_threads_never_exceed_cores():
+    solve_scheduler = scheduler.Scheduler(3)
+    in_use = multiprocessing.Value('i', 0)
+    most = multiprocessing.Value('i', 0)
+
+    def solve(seed):
+        rng = random.Random(seed)
+        for _ in range(20):
+            granted = solve_scheduler.acquire(rng.randint(1, 3 * scheduler.size_per_thread))
+            with in_use.get_lock():
+                in_use.value += granted
+                most.value = max(most.value, in_use.value)
+            time.sleep(0.002)
+            with in_use.get_lock():
+                in_use.value -= granted
+            solve_scheduler.release(granted)
+
+    def solve_on_threads(seed):
+        threads = [threading.Thread(target=solve, args=(seed * 10 + i,)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    # Solves on several threads of several processes
+    processes = [multiprocessing.Process(target=solve_on_threads, args=(seed,))
+                 for seed in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+    assert 1 < most.value <= 3
+    assert solve_scheduler.summary() == {'cores': 3, 'threads_in_use': 0, 'running': 0,
+                                         'waiting': 0}
+
+
+def test_threads_of_killed_holder_are_reclaimed():
+    solve_scheduler = scheduler.Scheduler(2)
+    pid = killed_holder(lambda: solve_scheduler.acquire(10 ** 6))
+    assert solve_scheduler.summary()['threads_in_use'] == 2
+    assert solve_scheduler.reclaim(pid) == 2
+    assert solve_scheduler.reclaim(pid) == 0
+    assert acquired_within(solve_scheduler, 5) == 1
+
+
+def test_waiting_solve_reclaims_killed_holder(monkeypatch):
+    monkeypatch.setattr(scheduler, 'check_interval', 0.1)
+    solve_scheduler = scheduler.Scheduler(2)
+    killed_holder(lambda: solve_scheduler.acquire(10 ** 6))
+    assert acquired_within(solve_scheduler, 5) == 1
+    assert solve_scheduler.summary()['threads_in_use'] == 1
+
+
+def test_lock_of_killed_holder_is_taken_over(monkeypatch):
+    monkeypatch.setattr(scheduler, 'check_interval', 0.1)
+    solve_scheduler = scheduler.Scheduler(2)
+    killed_holder(solve_scheduler._acquire_lock)
+    assert acquired_within(solve_scheduler, 5) == 1
+    solve_scheduler.release(1)
+    assert solve_scheduler.summary()['threads_in_use'] == 0
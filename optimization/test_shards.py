@@ -0,0 +1,83 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Check the routing of tokens to shards by consistent hashing, and restarts of shards."""
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from test_dispatcher import Replies, wait_until
+import optimize
+import scheduler
+import shards
+
+tokens = ['token%04d' % t for t in range(2000)]
+
+
+def routes(ring):
+    return dict((token, ring.shard(token)) for token in tokens)
+
+
+def test_same_token_same_shard():
+    ring = shards.HashRing(range(4))
+    assert routes(ring) == routes(shards.HashRing(range(4)))
+    assert routes(ring) == routes(shards.HashRing([3, 1, 0, 2]))
+    assert set(routes(ring).values()) == set(range(4))
+
+    # Routes do not depend on the hash seed of the process
+    script = 'import shards; print([shards.HashRing(range(4)).shard(t) for t in %r])' \
+        % tokens[:50]
+    env = dict(os.environ, PYTHONHASHSEED='123')
+    output = subprocess.check_output([sys.executable, '-c', script], env=env,
+                                     cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert output.decode().strip() == str([ring.shard(t) for t in tokens[:50]])
+
+
+def test_removing_shard_only_moves_its_tokens():
+    before = routes(shards.HashRing(range(5)))
+    after = routes(shards.HashRing([0, 1, 3, 4]))
+    moved = [token for token in tokens if before[token] != after[token]]
+    assert moved == [token for token in tokens if before[token] == 2]
+    # Tokens are spread over the shards, not all moved to one
+    assert len(set(after[token] for token in moved)) > 1
+
+
+def hold_threads(web_input, **kwargs):
+    """Hold all threads of the scheduler."""
+    kwargs['scheduler'].acquire(10 ** 6)
+    time.sleep(60)
+
+
+def test_threads_of_killed_shard_are_reclaimed(monkeypatch):
+    # Shards are forked and inherit the fake handler
+    monkeypatch.setattr(optimize, 'handle_web_input', hold_threads)
+    solve_scheduler = scheduler.Scheduler(2)
+    shard_router = shards.Shards(1, 4, scheduler=solve_scheduler)
+    try:
+        replies = Replies()
+        assert shard_router.submit('a', json.dumps({'token': 'a'}), replies.reply)
+        assert wait_until(lambda: solve_scheduler.summary()['threads_in_use'] == 2)
+        os.kill(shard_router.summary()['pids'][0], signal.SIGKILL)
+        assert replies.wait(1) == [{'error': 'shard', 'token': 'a'}]
+        assert solve_scheduler.summary()['threads_in_use'] == 0
+    finally:
+        shard_router.close()
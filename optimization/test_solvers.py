@@ -0,0 +1,76 @@
+# Copyright 2018 AdaM Authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+"""Check the routing of tokens to shards by consistent hashing, and restarts of shards."""
+"""Check that exact solves reach the same optimum whatever their formulation or start."""
+import numpy as np
+import pytest
+
+from test_heuristic import assert_feasible, room_problem
+import solvers
+
+gurobi = solvers.GurobiBackend()
+mip_gap = 1e-4
+
+exact_backends = [
+    pytest.param(solvers.CbcBackend(), id='cbc', marks=pytest.mark.skipif(
+        not solvers.CbcBackend().is_available(), reason='CBC is not installed')),
+    pytest.param(gurobi, id='gurobi', marks=pytest.mark.skipif(
+        not gurobi.is_available(), reason='Gurobi is not installed'))]
+
+
+@pytest.mark.skipif(not gurobi.is_available(), reason='Gurobi is not installed')
+@pytest.mark.parametrize('seed', range(12))
+def test_big_m_matches_indicators(monkeypatch, seed):
+    objects, problem = room_problem(seed)
+    objectives = []
+    for big_m in [False, True]:
+        monkeypatch.setattr(solvers, 'big_m', big_m)
+        solution = gurobi.solve(problem, mip_gap=mip_gap)
+        assert solution.status == 'optimal'
+        assert_feasible(objects, problem, solution.x, solution.s)
+        objectives.append(problem.objective(solution.x, solution.s))
+    assert abs(objectives[0] - objectives[1]) <= mip_gap * max(np.abs(objectives)) + 1e-9
+
+
+@pytest.mark.parametrize('backend', exact_backends)
+def test_warm_start_matches_cold_solve(backend):
+    for seed in range(8):
+        objects, problem = room_problem(seed)
+        cold = backend.solve(problem, mip_gap=mip_gap)
+        assert cold.status == 'optimal'
+        objective = problem.objective(cold.x, cold.s)
+
+        # Start from the optimum, a random assignment which need not be feasible, and the
+        # optimum of another room with elements and devices of the same names
+        rng = np.random.RandomState(seed)
+        (other_elements, other_devices, _), other = room_problem(seed + 100, num_elements=11)
+        before = backend.solve(other, mip_gap=mip_gap)
+        pairs = [(other_elements[other.pair_element[p]].name,
+                  other_devices[other.pair_device[p]].name)
+                 for p in np.flatnonzero(before.x > 0.5)]
+        starts = [cold.x, (rng.random_sample(problem.num_pairs) < 0.3).astype(np.float64),
+                  problem.pairs_in(pairs).astype(np.float64)]
+        for start_x in starts:
+            warm = backend.solve(problem, mip_gap=mip_gap,
+                                 start=(start_x, np.zeros(problem.num_pairs)))
+            assert warm.status == 'optimal'
+            assert_feasible(objects, problem, warm.x, warm.s)
+            assert abs(problem.objective(warm.x, warm.s) - objective) \
+                <= mip_gap * max(abs(objective), 1.0) + 1e-9
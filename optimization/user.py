@@ -20,9 +20,8 @@
 import uuid
 
 class User(object):
-    name = ''
-    id = None
-    importance = None
+
+    __slots__ = ('name', 'id', 'importance')
 
     def __init__(self, name='', id=None, importance=None):
         self.name = name
@@ -93,9 +93,8 @@ class Scenario(object):
     def remove_user_by_name(self, user_name):
         assert user_name in self.users.keys()
         user = self.users[user_name]
-        for _, device in self.devices.iteritems():
-            if user in device.users:
-                device.users.remove(user)
+        for _, device in self.devices.items():
+            device.remove_access(user)
         del self.users[user_name]
 
     def set_user_importance(self, user_name, element_name, value):
@@ -105,12 +104,13 @@ class Scenario(object):
         user.importance[element_name] = value
 
     def reset_all_user_importances(self):
-        for _, user in self.users.iteritems():
+        for _, user in self.users.items():
             user.importance = {}
 
     def run(self, expect={}):
         """Run optimizer and print inputs and output. Optionally run tests on outputs."""
-        elements, devices, users = self.elements.values(), self.devices.values(), self.users.values()
+        elements, devices, users = [list(objects.values()) for objects in
+                                    (self.elements, self.devices, self.users)]
         output, _ = optimize_device_assignment.optimize(elements, devices, users)
 
         print('\nInputs')
@@ -142,7 +142,7 @@ class Scenario(object):
         # See if expectations fulfilled if specified previously
         if len(expect) > 0:
             msgs = []
-            for device_name, element_names in expect.iteritems():
+            for device_name, element_names in expect.items():
                 assert device_name in self.devices.keys()
                 device = self.devices[device_name]
 
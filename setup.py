@@ -12,10 +12,15 @@ setup(
         author_email='spark@inf.ethz.ch',
 
         packages=find_packages(exclude=[]),
-        python_requires='>=2.7',
+        python_requires='>=3.8',
         install_requires=[
             'matplotlib',
             'numpy',
+            'scipy',
             'websocket-server',
         ],
+        extras_require={
+            # Open-source solver backend, see optimization/solvers.py
+            'cbc': ['pulp'],
+        },
 )